@@ -0,0 +1,105 @@
+# Frame corpus for the benchmarks, built with the encoders.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from zcl import spec
+
+
+# Options for a response from a device (server to client).
+_RESPONSE = {'direction': 1, 'default_response': False}
+
+
+def _read_attributes_response():
+    # basic cluster: strings, ints, and an unsupported attribute.
+    attributes = [
+        {'attribute': 0x0000, 'status': 'SUCCESS', 'datatype': 'uint8', 'value': 3},
+        {'attribute': 0x0001, 'status': 'SUCCESS', 'datatype': 'uint8', 'value': 1},
+        {'attribute': 0x0003, 'status': 'SUCCESS', 'datatype': 'uint8', 'value': 2},
+        {'attribute': 0x0004, 'status': 'SUCCESS', 'datatype': 'string', 'value': 'IKEA of Sweden'},
+        {'attribute': 0x0005, 'status': 'SUCCESS', 'datatype': 'string', 'value': 'TRADFRI bulb E27 W opal 1000lm'},
+        {'attribute': 0x0006, 'status': 'SUCCESS', 'datatype': 'string', 'value': '20170801'},
+        {'attribute': 0x0007, 'status': 'SUCCESS', 'datatype': 'enum8', 'value': 1},
+        {'attribute': 0x0010, 'status': 'UNSUPPORTED_ATTRIBUTE'},
+    ]
+    return spec.encode_profile_command('basic', 'read_attributes_response', 0x21, attributes=attributes, **_RESPONSE)[1]
+
+
+def _report_attributes():
+    # level_control and color style report with six attributes.
+    attributes = [
+        {'attribute': 0x0000, 'datatype': 'uint8', 'value': 0xfe},
+        {'attribute': 0x0001, 'datatype': 'uint16', 'value': 0},
+        {'attribute': 0x0010, 'datatype': 'uint16', 'value': 10},
+        {'attribute': 0x0011, 'datatype': 'uint8', 'value': 0xff},
+        {'attribute': 0x0012, 'datatype': 'uint16', 'value': 5},
+        {'attribute': 0x0013, 'datatype': 'uint16', 'value': 5},
+    ]
+    return spec.encode_profile_command('level_control', 'report_attributes', 0x22, attributes=attributes, **_RESPONSE)[1]
+
+
+def _simple_desc_resp():
+    descriptor = {
+        'endpoint': 1,
+        'profile': spec.Profile.HOME_AUTOMATION,
+        'device_identifier': 0x0100,
+        'device_version': 1,
+        'in_clusters': [0x0000, 0x0003, 0x0004, 0x0005, 0x0006, 0x0008],
+        'out_clusters': [0x0019],
+    }
+    return spec.encode_zdo('simple_desc_resp', 0x23, status=0, addr16=0x1234, simple_descriptors=[descriptor])[1]
+
+
+def _active_ep_resp():
+    return spec.encode_zdo('active_ep_resp', 0x24, status=0, addr16=0x1234, active_eps=[1, 2, 242])[1]
+
+
+def _mgmt_nwk_update_notify():
+    return spec.encode_zdo('mgmt_nwk_update_notify', 0x25, status=0, scanned_channels=0x07fff800, total_transmissions=1200, transmisson_failures=12, energy_values=list(range(0x40, 0x50)))[1]
+
+
+# (name, cluster, data)
+ZCL_FRAMES = [
+    ('onoff.on', 0x0006, spec.encode_cluster_command('onoff', 'on', 0x10)[1]),
+    ('onoff.toggle', 0x0006, spec.encode_cluster_command('onoff', 'toggle', 0x11)[1]),
+    ('onoff.off_with_effect', 0x0006, spec.encode_cluster_command('onoff', 'off_with_effect', 0x12, effect_id=0, effect_variant=0)[1]),
+    ('level_control.move_to_level', 0x0008, spec.encode_cluster_command('level_control', 'move_to_level', 0x13, level=0x80, time=10)[1]),
+    ('level_control.step', 0x0008, spec.encode_cluster_command('level_control', 'step', 0x14, mode=0, size=16, time=5)[1]),
+    ('basic.read_attributes_response', 0x0000, _read_attributes_response()),
+    ('level_control.report_attributes', 0x0008, _report_attributes()),
+]
+
+# (name, cluster, data)
+ZDO_FRAMES = [
+    ('simple_desc_resp', 0x8004, _simple_desc_resp()),
+    ('active_ep_resp', 0x8005, _active_ep_resp()),
+    ('mgmt_nwk_update_notify', 0x8038, _mgmt_nwk_update_notify()),
+]
+
+# (name, function, args, kwargs)
+ENCODES = [
+    ('encode_cluster_command/onoff.on', spec.encode_cluster_command, ('onoff', 'on', 0x10,), {}),
+    ('encode_cluster_command/level_control.move_to_level', spec.encode_cluster_command, ('level_control', 'move_to_level', 0x13,), {'level': 0x80, 'time': 10}),
+    ('encode_cluster_command/color.move_to_color_temperature', spec.encode_cluster_command, ('color', 'move_to_color_temperature', 0x14,), {'mireds': 370, 'time': 10}),
+    ('encode_profile_command/basic.read_attributes', spec.encode_profile_command, ('basic', 'read_attributes', 0x15,), {'attributes': [0x0004, 0x0005, 0x0006, 0x4000]}),
+    ('encode_profile_command/level_control.configure_reporting', spec.encode_profile_command, ('level_control', 'configure_reporting', 0x16,), {'configs': [{'attribute': 0x0000, 'datatype': 'uint8', 'minimum': 1, 'maximum': 60, 'delta': 1}]}),
+    ('encode_zdo/active_ep', spec.encode_zdo, ('active_ep', 0x17,), {'addr16': 0x1234}),
+    ('encode_zdo/match_desc', spec.encode_zdo, ('match_desc', 0x18,), {'addr16': 0xfffd, 'profile': 0x0104, 'in_clusters': [0x0006, 0x0008], 'out_clusters': []}),
+]
+
+# The hot commands from ENCODES again as templates, with the same
+# frames as result.
+TEMPLATES = [
+    ('template/onoff.on', spec.cluster_command_template('onoff', 'on'), (0x10,), {}),
+    ('template/level_control.move_to_level', spec.cluster_command_template('level_control', 'move_to_level', time=10), (0x13,), {'level': 0x80}),
+    ('template/color.move_to_color_temperature', spec.cluster_command_template('color', 'move_to_color_temperature'), (0x14,), {'mireds': 370, 'time': 10}),
+]
+
+# (name, cluster, data) for frames that decode_zcl can't decode.
+UNDECODABLE_FRAMES = [
+    ('manufacturer_specific', 0x0006, bytes([0x05, 0x4b, 0x10, 0x21, 0x00, 0x01])),
+    ('unknown_command', 0x0006, bytes([0x01, 0x22, 0x99])),
+    ('unknown_cluster', 0xfc00, bytes([0x01, 0x23, 0x00])),
+]
@@ -0,0 +1,297 @@
+# Codec benchmark suite.
+#
+# Measures frames/sec and retained allocations per frame for the corpus
+# in bench/corpus.py, plus the import time of zcl.spec, and compares
+# them against bench/baseline.json. Exits non-zero on a regression.
+#
+# Usage:
+#   python bench/run.py             # compare against the baseline
+#   python bench/run.py --update    # record a new baseline
+#
+# Baselines are only comparable on the same machine, so re-record
+# them when moving to different hardware. The process pool cases are
+# only recorded on machines with more than one CPU; their speedup over
+# decoding in one process is printed with every run.
+
+import argparse
+import concurrent.futures
+import gc
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+import corpus
+from zcl import batch
+from zcl import capture
+from zcl import memo
+from zcl import metrics
+from zcl import parallel
+from zcl import spec
+
+BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+
+
+def cases():
+    for name, cluster, data in corpus.ZCL_FRAMES:
+        yield 'decode_zcl/' + name, lambda cluster=cluster, data=data: spec.decode_zcl(cluster, data)
+    for name, cluster, data in corpus.ZDO_FRAMES:
+        yield 'decode_zdo/' + name, lambda cluster=cluster, data=data: spec.decode_zdo(cluster, data)
+    for name, fn, args, kwargs in corpus.ENCODES:
+        # Looked up again in case zcl.metrics has wrapped it.
+        fn = getattr(spec, fn.__name__)
+        yield name, lambda fn=fn, args=args, kwargs=kwargs: fn(*args, **kwargs)
+
+
+def decode_zcl_except(cluster, data):
+    try:
+        return spec.decode_zcl(cluster, data)
+    except (ValueError, struct.error) as e:
+        return e
+
+
+def frames_per_sec(fn, number=5000, repeat=5):
+    return number / min(timeit.repeat(fn, number=number, repeat=repeat))
+
+
+def allocations(fn, number=1000):
+    # Blocks and bytes still allocated per frame while the results are
+    # kept alive, i.e. the cost of what each call hands back.
+    keep = [None] * number
+    fn()
+    gc.collect()
+    gc.disable()
+    try:
+        tracemalloc.start()
+        before_bytes, _peak = tracemalloc.get_traced_memory()
+        before_blocks = sys.getallocatedblocks()
+        for k in range(number):
+            keep[k] = fn()
+        blocks = sys.getallocatedblocks() - before_blocks
+        after_bytes, _peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        gc.enable()
+    # tracemalloc's own bookkeeping shows up in the block count.
+    return max(0, blocks) / number, (after_bytes - before_bytes) / number
+
+
+def import_time(repeat=10):
+    code = 'import time; t = time.perf_counter(); import zcl.spec; print(time.perf_counter() - t)'
+    env = dict(os.environ, PYTHONPATH=os.path.join(BENCH_DIR, '..'))
+    times = []
+    for _i in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', code], env=env)
+        times.append(float(out))
+    return min(times) * 1000
+
+
+def measure(fn, frames=1):
+    # frames is the number of frames each call of fn decodes.
+    blocks, nbytes = allocations(fn, max(1, 1000 // frames))
+    return {
+        'frames_per_sec': frames_per_sec(fn, max(1, 5000 // frames)) * frames,
+        'blocks_per_frame': blocks / frames,
+        'bytes_per_frame': nbytes / frames,
+    }
+
+
+def measure_wall(fn, frames, repeat=3):
+    # For cases that run in other processes, where allocations in this
+    # one don't mean anything.
+    return {
+        'frames_per_sec': frames / min(timeit.repeat(fn, number=1, repeat=repeat)),
+    }
+
+
+def write_capture(path, copies=5000):
+    frames = 0
+    with open(path, 'wb') as f:
+        writer = capture.CaptureWriter(f)
+        for k in range(copies):
+            for _name, cluster, data in corpus.ZCL_FRAMES:
+                writer.write(k, 1, 1, 0x0104, cluster, data)
+                frames += 1
+            for _name, cluster, data in corpus.ZDO_FRAMES:
+                writer.write(k, 1, spec.Endpoint.ZDO, 0, cluster, data)
+                frames += 1
+    return frames
+
+
+def start_pool(workers):
+    pool = concurrent.futures.ProcessPoolExecutor(workers)
+    # Wait for every worker process, so none start inside a timed case.
+    for future in [pool.submit(os.getpid) for _k in range(workers)]:
+        future.result()
+    return pool
+
+
+def run():
+    results = {}
+    # The same cases again with the generated codecs (zcl.codegen).
+    for prefix, codegen in (('', False,), ('codegen/', True,),):
+        spec.use_codegen(codegen)
+        for name, fn in cases():
+            results[prefix + name] = measure(fn)
+    spec.use_codegen(False)
+    # Instrumentation (zcl.metrics): once disabled, the plain functions
+    # are back in place, so the disabled cases should match the plain
+    # ones above.
+    for prefix, enabled in (('metrics/enabled/', True,), ('metrics/disabled/', False,),):
+        if enabled:
+            metrics.enable()
+        for name, fn in cases():
+            results[prefix + name] = measure(fn)
+        metrics.disable()
+    for name, template, args, kwargs in corpus.TEMPLATES:
+        results[name] = measure(lambda template=template, args=args, kwargs=kwargs: template.encode(*args, **kwargs))
+    # Non-raising decoding, against catching decode_zcl's exception.
+    for name, cluster, data in [corpus.ZCL_FRAMES[0], corpus.ZCL_FRAMES[-1]] + corpus.UNDECODABLE_FRAMES:
+        results['fallback/try_decode_zcl/' + name] = measure(lambda cluster=cluster, data=data: spec.try_decode_zcl(cluster, data))
+    for name, cluster, data in corpus.UNDECODABLE_FRAMES:
+        results['fallback/decode_zcl_except/' + name] = measure(lambda cluster=cluster, data=data: decode_zcl_except(cluster, data))
+    # Compact (slotted) results, mainly for their memory per frame.
+    for name, cluster, data in corpus.ZCL_FRAMES:
+        fn = lambda cluster=cluster, data=data: spec.decode_zcl_compact(cluster, data)
+        results['compact/decode_zcl/' + name] = measure(fn)
+    for name, cluster, data in corpus.ZDO_FRAMES:
+        fn = lambda cluster=cluster, data=data: spec.decode_zdo_compact(cluster, data)
+        results['compact/decode_zdo/' + name] = measure(fn)
+    # Memoized decoding (zcl.memo) of frames that have been seen before.
+    decoder = memo.MemoDecoder()
+    for name, cluster, data in corpus.ZCL_FRAMES:
+        decoder.decode_zcl(cluster, data)
+        results['memo/decode_zcl/' + name] = measure(lambda cluster=cluster, data=data: decoder.decode_zcl(cluster, data))
+    # Batch decoding of attribute reports and read responses.
+    attribute_frames = [(cluster, data) for name, cluster, data in corpus.ZCL_FRAMES if name.endswith(('.report_attributes', '.read_attributes_response'))] * 500
+    clusters = [cluster for cluster, _data in attribute_frames]
+    frames = [data for _cluster, data in attribute_frames]
+    results['batch/decode_zcl_batch/attributes'] = measure(lambda: batch.decode_zcl_batch(clusters, frames), len(frames))
+    results['batch/decode_zcl/attributes'] = measure(lambda: [spec.decode_zcl(cluster, data) for cluster, data in attribute_frames], len(frames))
+
+    # Decoding a capture in a process pool (zcl.parallel).
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'corpus.cap')
+        n = write_capture(path)
+        def decode_capture():
+            with open(path, 'rb') as f:
+                return list(capture.decode_capture(f))
+        results['parallel/decode_capture'] = measure_wall(decode_capture, n)
+        for workers in (1, 2, 4, 8, 16,):
+            # Pool startup is timed on its own, and the decoding cases
+            # reuse one pool, as a long-running process would.
+            results['parallel/pool_startup/{}'.format(workers)] = {
+                'ms': min(timeit.repeat(lambda: start_pool(workers).shutdown(), number=1, repeat=3)) * 1000,
+            }
+            with start_pool(workers) as pool:
+                results['parallel/decode_parallel/{}'.format(workers)] = measure_wall(lambda: list(parallel.decode_parallel(path, workers, executor=pool)), n)
+                results['parallel/aggregate_parallel/{}'.format(workers)] = measure_wall(lambda: parallel.aggregate_parallel(path, workers, executor=pool), n)
+
+    results['import_zcl_spec'] = {
+        'ms': import_time(),
+    }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if 'frames_per_sec' in base and metrics['frames_per_sec'] < base['frames_per_sec'] * (1 - tolerance):
+            regressions.append('{}: {:.0f} frames/sec (baseline {:.0f})'.format(name, metrics['frames_per_sec'], base['frames_per_sec']))
+        if 'blocks_per_frame' in base and metrics['blocks_per_frame'] > base['blocks_per_frame'] + 0.5:
+            regressions.append('{}: {:.1f} blocks/frame (baseline {:.1f})'.format(name, metrics['blocks_per_frame'], base['blocks_per_frame']))
+        if 'ms' in base and metrics['ms'] > base['ms'] * (1 + tolerance):
+            regressions.append('{}: {:.1f} ms (baseline {:.1f})'.format(name, metrics['ms'], base['ms']))
+    # Disabled metrics should cost nothing (see tests/test_metrics.py for
+    # why), so they're held to the same tolerance as a regression.
+    disabled = overhead(results, 'metrics/disabled/')
+    if disabled > tolerance:
+        regressions.append('metrics/disabled: {:+.1%} overhead over the plain cases'.format(disabled))
+    return regressions
+
+
+def report(results, baseline):
+    print('{:<68} {:>12} {:>10} {:>8} {:>8}'.format('case', 'frames/sec', 'baseline', 'blocks', 'bytes'))
+    for name, metrics in results.items():
+        base = baseline.get(name, {})
+        if 'ms' in metrics:
+            print('{:<68} {:>9.1f} ms {:>7.1f} ms'.format(name, metrics['ms'], base.get('ms', float('nan'))))
+            continue
+        print('{:<68} {:>12.0f} {:>10.0f} {:>8.1f} {:>8.0f}'.format(name, metrics['frames_per_sec'], base.get('frames_per_sec', float('nan')), metrics.get('blocks_per_frame', float('nan')), metrics.get('bytes_per_frame', float('nan'))))
+
+
+def overhead(results, prefix):
+    # Mean slowdown of the prefix cases relative to the plain ones.
+    ratios = [results[name]['frames_per_sec'] / results[prefix + name]['frames_per_sec'] - 1 for name in results if prefix + name in results]
+    return sum(ratios) / len(ratios) if ratios else float('nan')
+
+
+# Cases that need more than one CPU to mean anything.
+POOL_CASES = ('parallel/pool_startup/', 'parallel/decode_parallel/', 'parallel/aggregate_parallel/',)
+
+
+def speedups(results):
+    # Speedup of the process pool cases over decode_capture in one process.
+    serial = results['parallel/decode_capture']['frames_per_sec']
+    for name, metrics in results.items():
+        if name.startswith(POOL_CASES) and 'frames_per_sec' in metrics:
+            yield name, metrics['frames_per_sec'] / serial
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the zcl codec.')
+    parser.add_argument('--update', action='store_true', help='record the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before flagging a regression (default 0.25)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run()
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    report(results, baseline)
+    for prefix in ('metrics/disabled/', 'metrics/enabled/',):
+        print('{} overhead: {:+.1%}'.format(prefix.rstrip('/'), overhead(results, prefix)))
+    # The metrics cases are the plain decode_zcl/decode_zdo/encode_*
+    # calls; see zcl.metrics for what isn't instrumented at all.
+    print('(metrics overhead measured on decode_zcl, decode_zdo and encode_* only)')
+    for name, speedup in speedups(results):
+        print('{} speedup: {:.2f}x'.format(name, speedup))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.update:
+        if (os.cpu_count() or 1) < 2:
+            # On one CPU the pool cases are the serial decode plus noise,
+            # and would only make for spurious regressions elsewhere.
+            results = {name: metrics for name, metrics in results.items() if not name.startswith(POOL_CASES)}
+            print('Not recording the process pool cases on a single CPU.')
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Baseline updated.')
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print('REGRESSION', regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+# Microbenchmark for status8 decoding in multi-record responses.
+#
+# Compares the status lookup tables against the original linear scan
+# over the Status enum, by temporarily swapping the status8 decoder and
+# recompiling the decoders.
+#
+# Usage: python bench/status.py
+
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from zcl import spec
+
+
+def _scan_decode_status(data, i, obj):
+    status, = struct.unpack('<B', data[i:i+1])
+    for s in spec.Status:
+        if s.value == status:
+            return s.name, i + 1
+    raise ValueError('Unknown status {}'.format(status))
+
+
+def read_attributes_response(n):
+    data = struct.pack('<BBB', 0x18, 1, 0x01)
+    for attribute in range(n):
+        status = spec.Status.SUCCESS if attribute % 4 else spec.Status.UNSUPPORTED_ATTRIBUTE
+        data += struct.pack('<HB', attribute, status)
+        if status == spec.Status.SUCCESS:
+            data += struct.pack('<BH', spec.DataType.UINT16, attribute)
+    return data
+
+
+def write_attributes_response(n):
+    data = struct.pack('<BBB', 0x18, 1, 0x04)
+    for attribute in range(n):
+        data += struct.pack('<BH', spec.Status.INVALID_VALUE if attribute % 2 else spec.Status.UNSUPPORTED_ATTRIBUTE, attribute)
+    return data
+
+
+def _recompile():
+    # Plans and decoders look up STRUCT_TYPES when they're built, so all
+    # the caches have to go for a swapped decoder to take effect.
+    spec._DECODE_PLANS.clear()
+    spec._DECODERS.clear()
+    spec._ENCODERS.clear()
+
+
+def run(frames, number=2000):
+    results = {}
+    for name, data in frames:
+        t = min(timeit.repeat(lambda: spec.decode_zcl(0x0006, data), number=number, repeat=5))
+        results[name] = t / number * 1e6
+    return results
+
+
+def main():
+    frames = []
+    for n in (1, 8, 32):
+        frames.append(('read_attributes_response x{}'.format(n), read_attributes_response(n)))
+        frames.append(('write_attributes_response x{}'.format(n), write_attributes_response(n)))
+
+    table = run(frames)
+
+    decode, encode = spec.STRUCT_TYPES['status8']
+    spec.STRUCT_TYPES['status8'] = (_scan_decode_status, encode,)
+    _recompile()
+    try:
+        scan = run(frames)
+    finally:
+        spec.STRUCT_TYPES['status8'] = (decode, encode,)
+        _recompile()
+
+    print('{:<32} {:>10} {:>10} {:>8}'.format('frame', 'scan us', 'table us', 'speedup'))
+    for name, _data in frames:
+        print('{:<32} {:>10.2f} {:>10.2f} {:>7.2f}x'.format(name, scan[name], table[name], scan[name] / table[name]))
+
+
+if __name__ == '__main__':
+    main()
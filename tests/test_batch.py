@@ -0,0 +1,84 @@
+import struct
+
+import pytest
+
+from zcl import batch, spec
+
+
+CLUSTERS_AND_FRAMES = [
+    (0x0008, '18220a 0000 20 fe 0100 21 0000'),
+    (0x0000, '182101 0000 00 20 03 0400 00 42 0e 494b4541206f662053776564656e 1000 86'),
+    (0x0006, '011001'),
+    (0x0b04, '18230a 0505 29 1a09 0805 29 ecff'),
+    (0x0008, '18240a 0000 20 7f'),
+    (0x0006, '1110 01'),
+]
+
+
+def _frames(entries):
+    return [cluster for cluster, _frame in entries], [bytes.fromhex(frame.replace(' ', '')) for _cluster, frame in entries]
+
+
+def _records(groups):
+    # {frame index: records}, from the columns and the other records.
+    records = {}
+    for group in groups.values():
+        for index, kwargs in zip(group.frames, group.kwargs):
+            records[index] = kwargs
+        for columns in group.columns.values():
+            for index, attribute, datatype, value in zip(columns.frame, columns.attribute, columns.datatype, columns.value):
+                record = {'attribute': attribute, 'datatype': datatype, 'value': value}
+                if group.command_name == 'read_attributes_response':
+                    record['status'] = 'SUCCESS'
+                records.setdefault(index, []).append(record)
+        for index, record in group.other:
+            records.setdefault(index, []).append(record)
+    return records
+
+
+def test_matches_decode_zcl():
+    clusters, frames = _frames(CLUSTERS_AND_FRAMES)
+    groups = batch.decode_zcl_batch(clusters, frames)
+    records = _records(groups)
+
+    for index, (cluster, data) in enumerate(zip(clusters, frames)):
+        cluster_name, seq, command_type, command_name, _default_response, kwargs = spec.decode_zcl(cluster, data)
+        group = groups[(cluster_name, command_name,)]
+        assert group.command_type == command_type
+        assert group.seqs[list(group.frames).index(index)] == seq
+        if 'attributes' in kwargs:
+            key = lambda record: record['attribute']
+            assert sorted(records[index], key=key) == sorted(kwargs['attributes'], key=key)
+        else:
+            assert records[index] == kwargs
+
+
+def test_columns():
+    clusters, frames = _frames(CLUSTERS_AND_FRAMES)
+    groups = batch.decode_zcl_batch(clusters, frames)
+    report = groups[('level_control', 'report_attributes',)]
+    assert list(report.frames) == [0, 4]
+    assert list(report.columns['uint8'].frame) == [0, 4]
+    assert list(report.columns['uint8'].value) == [0xfe, 0x7f]
+    assert list(report.columns['uint16'].value) == [0]
+    electrical = groups[('electrical_measurement', 'report_attributes',)]
+    assert list(electrical.columns['int16'].value) == [2330, -20]
+    # The on and default_response-less on share a group.
+    assert list(groups[('onoff', 'on',)].frames) == [2, 5]
+
+
+def test_errors():
+    entries = CLUSTERS_AND_FRAMES + [(0x0008, '18250a 0000 20 fe 0100 21 00'), (0x0006, '0110'), (0xfc00, '011001')]
+    clusters, frames = _frames(entries)
+    # Without an errors list, the first failure raises as in decode_zcl.
+    with pytest.raises(struct.error):
+        batch.decode_zcl_batch(clusters, frames)
+    with pytest.raises(ValueError):
+        batch.decode_zcl_batch(clusters[-1:], frames[-1:])
+
+    errors = []
+    groups = batch.decode_zcl_batch(clusters, frames, errors)
+    assert sorted(index for index, _e in errors) == [6, 7, 8]
+    # The records of the truncated report before the error are rolled
+    # back.
+    assert list(groups[('level_control', 'report_attributes',)].columns['uint8'].frame) == [0, 4]
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from zcl import cache
+from zcl import dispatch
+from zcl import simulator
+from zcl import spec
+
+
+BASIC = spec.get_cluster_by_name('basic')
+LEVEL_CONTROL = spec.get_cluster_by_name('level_control')
+MODEL_ID = cache.attribute_id('basic', 'model_id')
+CURRENT_LEVEL = cache.attribute_id('level_control', 'current_level')
+
+
+def _setup(**kwargs):
+    network = simulator.SimulatedNetwork()
+    device, = network.add_devices(1, **kwargs)
+    dispatcher = dispatch.Dispatcher(network.transport(), timeout=1.0)
+    attributes = cache.AttributeCache()
+    attributes.attach(dispatcher)
+    return network, device, dispatcher, attributes
+
+
+def test_responses_to_other_callers():
+    async def main():
+        _network, device, dispatcher, attributes = _setup()
+        frame = await dispatcher.profile_request(device.address, 1, 'basic', 'read_attributes', attributes=[MODEL_ID])
+        assert frame.command_name == 'read_attributes_response'
+        # Resolving the request didn't hide the response from the cache.
+        entry = attributes.get(device.address, 1, BASIC, MODEL_ID)
+        assert entry is not None and entry.value == 'Light'
+
+    asyncio.run(main())
+
+
+def test_read_uses_cache():
+    async def main():
+        _network, device, dispatcher, attributes = _setup()
+        first = await attributes.read(dispatcher, device.address, 1, 'basic', ['manufacturer_name', 'model_id'])
+        assert first == {'manufacturer_name': 'Simulated', 'model_id': 'Light'}
+        received = device.received
+        second = await attributes.read(dispatcher, device.address, 1, 'basic', ['model_id', 'manufacturer_name'])
+        assert second == {'model_id': 'Light', 'manufacturer_name': 'Simulated'}
+        assert device.received == received
+
+    asyncio.run(main())
+
+
+def test_reports():
+    async def main():
+        _network, device, dispatcher, attributes = _setup(time_scale=0.001)
+        frame = await dispatcher.profile_request(device.address, 1, 'level_control', 'configure_reporting', configs=[
+            {'attribute': CURRENT_LEVEL, 'datatype': 'uint8', 'minimum': 0, 'maximum': 60, 'delta': 1},
+        ])
+        assert frame['results'] == [{'status': 'SUCCESS'}]
+        device.set_attribute(1, 'level_control', 'current_level', 0x42)
+        await asyncio.sleep(0.05)
+        entry = attributes.get(device.address, 1, LEVEL_CONTROL, CURRENT_LEVEL)
+        assert entry is not None and entry.value == 0x42
+
+    asyncio.run(main())
+
+
+def test_zdo_frames_are_ignored():
+    async def main():
+        network, device, dispatcher, attributes = _setup()
+        received = []
+        dispatcher.subscribe(lambda source, endpoint, frame: received.append(frame.cluster_name))
+
+        # ZDO traffic, both a response and unsolicited, reaches the
+        # subscribers after the cache without upsetting it.
+        frame = await dispatcher.zdo_request(device.address, 'active_ep', addr16=device.address)
+        assert frame['active_eps'] == [1]
+        newcomer = network.transport(0x5678)
+        cluster, data = spec.encode_zdo('device_annce', 0, addr16=0x5678, addr64=0x0011223344556677, capability=0x8e)
+        await newcomer.send(0, spec.Endpoint.ZDO, spec.Profile.ZIGBEE, cluster, data)
+        await asyncio.sleep(0)
+        assert received == ['device_annce']
+        assert dispatcher.subscriber_errors == 0
+        assert len(attributes) == 0
+
+    asyncio.run(main())
+
+
+def test_attribute_id():
+    assert cache.attribute_id('basic', 'model_id') == MODEL_ID
+    assert cache.attribute_id('basic', MODEL_ID) == MODEL_ID
+    with pytest.raises(ValueError):
+        cache.attribute_id('basic', 'nonexistent')
+    with pytest.raises(ValueError):
+        cache.attribute_id('nonexistent', 0)
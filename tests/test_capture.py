@@ -0,0 +1,67 @@
+import io
+
+import pytest
+
+from zcl import capture, spec
+
+
+def _records(n):
+    records = []
+    for k in range(n):
+        # Payloads of varying lengths, including empty ones.
+        payload = bytes(range(k % 40))
+        records.append(capture.CaptureRecord(1000.0 + k, 0x1000 + k, 1 + k % 3, 0x0104, 6, payload))
+    return records
+
+
+def _capture(records):
+    f = io.BytesIO()
+    writer = capture.CaptureWriter(f)
+    for record in records:
+        writer.write_record(record)
+    return f.getvalue()
+
+
+# Chunks smaller than a record header, smaller than a record, and sizes
+# that don't divide the record sizes all split records across chunks.
+@pytest.mark.parametrize('chunk_size', [1, 7, 23, 24, 25, 64, 1000, 65536])
+def test_read_capture_chunks(chunk_size):
+    records = _records(100)
+    read = list(capture.read_capture(io.BytesIO(_capture(records)), chunk_size))
+    assert [tuple(record[:5]) + (bytes(record.payload),) for record in read] == records
+
+
+def test_read_capture_empty():
+    assert list(capture.read_capture(io.BytesIO(_capture([])))) == []
+
+
+@pytest.mark.parametrize('cut', [1, 10, 30])
+def test_read_capture_truncated(cut):
+    data = _capture(_records(3))[:-cut]
+    with pytest.raises(ValueError):
+        list(capture.read_capture(io.BytesIO(data), 16))
+
+
+def test_read_capture_header():
+    with pytest.raises(ValueError):
+        list(capture.read_capture(io.BytesIO(b'ZCL')))
+    with pytest.raises(ValueError):
+        list(capture.read_capture(io.BytesIO(b'NOTCAP\x01')))
+    with pytest.raises(ValueError):
+        list(capture.read_capture(io.BytesIO(capture.MAGIC + b'\x02')))
+
+
+def test_decode_capture_errors():
+    good = spec.encode_cluster_command('onoff', 'on', 1)[1]
+    records = [
+        capture.CaptureRecord(1.0, 0x1234, 1, 0x0104, 6, good),
+        capture.CaptureRecord(2.0, 0x1234, 1, 0x0104, 6, b'\x01\x02\x99'),
+        capture.CaptureRecord(3.0, 0x1234, 0, 0x0000, 0x0005, b'\x01\x34\x12'),
+    ]
+    errors = []
+    decoded = list(capture.decode_capture(io.BytesIO(_capture(records)), 5, errors=errors))
+    assert [(record.timestamp, result) for record, result in decoded] == [
+        (1.0, ('onoff', 1, spec.ZclCommandType.CLUSTER, 'on', True, {})),
+        (3.0, ('active_ep', 1, {'addr16': 0x1234})),
+    ]
+    assert [record.timestamp for record, _e in errors] == [2.0]
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from zcl import cache
+from zcl import coalesce
+from zcl import dispatch
+from zcl import simulator
+
+
+def _setup(**kwargs):
+    network = simulator.SimulatedNetwork()
+    device, = network.add_devices(1)
+    dispatcher = dispatch.Dispatcher(network.transport(), timeout=1.0)
+    return device, coalesce.ReadCoalescer(dispatcher, **kwargs)
+
+
+def test_reads_are_merged():
+    async def main():
+        device, coalescer = _setup()
+        first, second = await asyncio.gather(
+            coalescer.read(device.address, 1, 'basic', ['model_id']),
+            coalescer.read(device.address, 1, 'basic', ['manufacturer_name', cache.attribute_id('basic', 'model_id')]),
+        )
+        assert first['model_id']['value'] == 'Light'
+        assert second['manufacturer_name']['value'] == 'Simulated'
+        assert second[cache.attribute_id('basic', 'model_id')]['value'] == 'Light'
+        assert (coalescer.requests, coalescer.frames,) == (2, 1,)
+
+    asyncio.run(main())
+
+
+def test_split_reads():
+    attributes = [cache.attribute_id('basic', name) for name in ('zclversion', 'manufacturer_name', 'model_id', 'date_code')]
+    assert coalesce.split_reads('basic', attributes, max_payload=1000) == [attributes]
+    # Three strings don't fit in one response.
+    chunks = coalesce.split_reads('basic', attributes)
+    assert [attribute for chunk in chunks for attribute in chunk] == attributes
+    assert len(chunks) > 1
+
+
+def test_unknown_names_raise():
+    async def main():
+        device, coalescer = _setup()
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(coalescer.read(device.address, 1, 'nonexistent', [0]), 1.0)
+        with pytest.raises(ValueError):
+            await asyncio.wait_for(coalescer.read(device.address, 1, 'basic', ['nonexistent']), 1.0)
+        # Nothing was left pending for them.
+        assert coalescer._pending == {}
+
+    asyncio.run(main())
+
+
+def test_send_errors_reach_waiters(monkeypatch):
+    def split_reads(*args):
+        raise RuntimeError('split_reads')
+    monkeypatch.setattr(coalesce, 'split_reads', split_reads)
+
+    async def main():
+        device, coalescer = _setup()
+        results = await asyncio.wait_for(asyncio.gather(
+            coalescer.read(device.address, 1, 'basic', ['model_id']),
+            coalescer.read(device.address, 1, 'basic', ['manufacturer_name']),
+            return_exceptions=True,
+        ), 1.0)
+        assert [str(result) for result in results] == ['split_reads', 'split_reads']
+        assert not coalescer._tasks
+
+    asyncio.run(main())
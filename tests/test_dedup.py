@@ -0,0 +1,79 @@
+from zcl import dedup
+from zcl import spec
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+ON = spec.encode_cluster_command('onoff', 'on', 7)[1]
+OFF = spec.encode_cluster_command('onoff', 'off', 7)[1]
+
+
+def test_duplicates_within_window():
+    clock = Clock()
+    f = dedup.DuplicateFilter(window=2.0, clock=clock)
+    assert not f.is_duplicate(0x1234, 1, 6, ON)
+    clock.now = 1.0
+    assert f.is_duplicate(0x1234, 1, 6, ON)
+    assert f.is_duplicate(0x1234, 1, 6, bytearray(ON))
+    # Different source, or different frame with the same seq.
+    assert not f.is_duplicate(0x5678, 1, 6, ON)
+    assert not f.is_duplicate(0x1234, 1, 6, OFF)
+    assert (f.hits, f.misses,) == (2, 3,)
+
+
+def test_window_expiry():
+    clock = Clock()
+    f = dedup.DuplicateFilter(window=2.0, clock=clock)
+    assert not f.is_duplicate(0x1234, 1, 6, ON)
+    clock.now = 1.5
+    assert not f.is_duplicate(0x5678, 1, 6, ON)
+    # Just inside the window, then past it: the same seq again is a new
+    # frame.
+    clock.now = 2.0
+    assert f.is_duplicate(0x1234, 1, 6, ON)
+    clock.now = 2.1
+    assert not f.is_duplicate(0x1234, 1, 6, ON)
+    # And is remembered from then on.
+    clock.now = 4.0
+    assert f.is_duplicate(0x1234, 1, 6, ON)
+
+    # Expired entries are dropped from the front.
+    clock.now = 10.0
+    assert not f.is_duplicate(0x9999, 1, 6, ON)
+    assert len(f) == 1
+    assert f.evictions == 0
+
+
+def test_eviction():
+    clock = Clock()
+    f = dedup.DuplicateFilter(window=60.0, max_entries=3, clock=clock)
+    for source in range(4):
+        assert not f.is_duplicate(source, 1, 6, ON)
+    assert (len(f), f.evictions,) == (3, 1,)
+    # The oldest was evicted, the rest are still duplicates.
+    assert not f.is_duplicate(0, 1, 6, ON)
+    assert f.is_duplicate(3, 1, 6, ON)
+
+
+def test_short_frames():
+    f = dedup.DuplicateFilter(clock=Clock())
+    assert not f.is_duplicate(0x1234, 1, 6, b'\x01')
+    assert not f.is_duplicate(0x1234, 1, 6, b'\x01')
+    zdo = spec.encode_zdo('active_ep', 3, addr16=0x1234)
+    assert not f.is_duplicate(0x1234, spec.Endpoint.ZDO, zdo[0], zdo[1])
+    assert f.is_duplicate(0x1234, spec.Endpoint.ZDO, zdo[0], zdo[1])
+
+
+def test_wrap():
+    received = []
+    f = dedup.DuplicateFilter(clock=Clock())
+    receiver = f.wrap(lambda *frame: received.append(frame))
+    for _ in range(3):
+        receiver(0x1234, 1, 0x0104, 6, ON)
+    assert received == [(0x1234, 1, 0x0104, 6, ON,)]
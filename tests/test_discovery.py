@@ -0,0 +1,119 @@
+import asyncio
+import random
+import struct
+
+from zcl import discovery
+from zcl import dispatch
+from zcl import simulator
+from zcl import spec
+
+
+def _setup(count, **kwargs):
+    network = simulator.SimulatedNetwork()
+    devices = network.add_devices(count, **kwargs)
+    dispatcher = dispatch.Dispatcher(network.transport(), timeout=0.05)
+    return network, devices, dispatcher
+
+
+def test_crawl():
+    async def main():
+        _network, devices, dispatcher = _setup(20)
+        crawler = discovery.Discovery(dispatcher, backoff=0.001)
+        result = await crawler.crawl([device.address for device in devices])
+        assert sorted(result) == [device.address for device in devices]
+        assert not crawler.failed
+        device = result[devices[0].address]
+        assert device['manufacturer_name'] == 'Simulated'
+        assert device['model_id'] == 'Light'
+        endpoint, = device['endpoints']
+        assert endpoint['endpoint'] == 1
+        assert endpoint['profile'] == spec.Profile.HOME_AUTOMATION
+        assert endpoint['device_identifier'] == 0x0101
+        assert sorted(endpoint['in_clusters']) == sorted(spec.get_cluster_by_name(name) for name in ('basic', 'identify', 'onoff', 'level_control',))
+
+    asyncio.run(main())
+
+
+def test_retries_lost_frames():
+    async def main():
+        _network, devices, dispatcher = _setup(20, loss=0.2, rng=random.Random(1))
+        crawler = discovery.Discovery(dispatcher, retries=8, backoff=0.001)
+        result = await crawler.crawl([device.address for device in devices])
+        assert len(result) == 20
+        # 3 requests per device without loss.
+        assert crawler.requests > 60
+
+    asyncio.run(main())
+
+
+def test_unreachable_device_fails():
+    async def main():
+        _network, devices, dispatcher = _setup(1)
+        crawler = discovery.Discovery(dispatcher, retries=1, backoff=0.001)
+        result = await crawler.crawl([devices[0].address, 0x7777])
+        assert list(result) == [devices[0].address]
+        assert isinstance(crawler.failed[0x7777], asyncio.TimeoutError)
+        assert crawler.requests == 3 + 2
+
+    asyncio.run(main())
+
+
+def test_cache(tmp_path):
+    path = str(tmp_path / 'devices.json')
+
+    async def main():
+        _network, devices, dispatcher = _setup(3)
+        addresses = [device.address for device in devices]
+        crawler = discovery.Discovery(dispatcher, cache_path=path, backoff=0.001)
+        first = await crawler.crawl(addresses)
+
+        # A restart loads the results instead of interviewing again.
+        crawler = discovery.Discovery(dispatcher, cache_path=path, backoff=0.001)
+        second = await crawler.crawl(addresses)
+        assert second == first
+        assert crawler.requests == 0
+
+        await crawler.crawl(addresses, refresh=True)
+        assert crawler.requests == 3 * 3
+
+    asyncio.run(main())
+
+
+def test_device_annce_invalidates():
+    async def main():
+        _network, devices, dispatcher = _setup(2)
+        addresses = [device.address for device in devices]
+        crawler = discovery.Discovery(dispatcher, backoff=0.001)
+        crawler.attach()
+        await crawler.crawl(addresses)
+
+        address = devices[1].address
+        cluster, data = spec.encode_zdo('device_annce', 0, addr16=address, addr64=0x0011223344556677, capability=0x8e)
+        await devices[1].transport.send(0, spec.Endpoint.ZDO, spec.Profile.ZIGBEE, cluster, data)
+        await asyncio.sleep(0)
+        assert address not in crawler.devices
+
+        requests = crawler.requests
+        await crawler.crawl(addresses)
+        assert address in crawler.devices
+        assert crawler.requests == requests + 3
+
+    asyncio.run(main())
+
+
+def test_malformed_response_fails():
+    async def main():
+        network, devices, dispatcher = _setup(1)
+
+        def frame_received(source, endpoint, profile, cluster, data):
+            # An active_ep_resp that claims three endpoints but has one.
+            network.loopback.deliver(0x6666, source, endpoint, profile, cluster | 0x8000, bytes((data[0], 0x00, 0x66, 0x66, 3, 1)))
+        network.transport(0x6666).set_receiver(frame_received)
+
+        crawler = discovery.Discovery(dispatcher, retries=1, backoff=0.001)
+        result = await crawler.crawl([0x6666, devices[0].address])
+        # The other device is still interviewed.
+        assert list(result) == [devices[0].address]
+        assert isinstance(crawler.failed[0x6666], struct.error)
+
+    asyncio.run(main())
@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from zcl import dispatch
+from zcl import spec
+
+
+COORDINATOR = 0x0000
+DEVICE = 0x1234
+
+
+def _responder(network, address, delays=None):
+    # A device that answers basic read_attributes with the attribute ids
+    # as values, after delays[attribute] seconds.
+    transport = network.transport(address)
+
+    def received(source, endpoint, profile, cluster, data):
+        header = spec.peek_zcl_header(data)
+        _cluster_name, _seq, _command_type, _command_name, _default_response, kwargs = spec.decode_zcl(cluster, data)
+        attributes = [{'attribute': a, 'status': 'SUCCESS', 'datatype': 'uint16', 'value': a} for a in kwargs['attributes']]
+        _cluster, response = spec.encode_profile_command('basic', 'read_attributes_response', header.seq, direction=1, default_response=False, attributes=attributes)
+        delay = (delays or {}).get(kwargs['attributes'][0], 0)
+        asyncio.get_running_loop().call_later(delay, network.deliver, address, source, endpoint, profile, cluster, response)
+
+    transport.set_receiver(received)
+    return transport
+
+
+def test_transport_is_abstract():
+    with pytest.raises(TypeError):
+        dispatch.Transport()
+
+
+def test_request_response():
+    async def main():
+        network = dispatch.LoopbackNetwork()
+        _responder(network, DEVICE)
+        dispatcher = dispatch.Dispatcher(network.transport(COORDINATOR))
+        frame = await dispatcher.profile_request(DEVICE, 1, 'basic', 'read_attributes', attributes=[4, 5])
+        assert frame.command_name == 'read_attributes_response'
+        assert [record['value'] for record in frame['attributes']] == [4, 5]
+        assert dispatcher.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_out_of_order_responses_match_by_seq():
+    async def main():
+        network = dispatch.LoopbackNetwork()
+        # The first request is answered last.
+        _responder(network, DEVICE, delays={1: 0.05, 2: 0.01, 3: 0})
+        dispatcher = dispatch.Dispatcher(network.transport(COORDINATOR))
+        frames = await asyncio.gather(*(dispatcher.profile_request(DEVICE, 1, 'basic', 'read_attributes', attributes=[a]) for a in (1, 2, 3)))
+        assert [frame['attributes'][0]['value'] for frame in frames] == [1, 2, 3]
+        assert len({frame.seq for frame in frames}) == 3
+
+    asyncio.run(main())
+
+
+def test_timeout():
+    async def main():
+        network = dispatch.LoopbackNetwork()
+        dispatcher = dispatch.Dispatcher(network.transport(COORDINATOR))
+        with pytest.raises(asyncio.TimeoutError):
+            await dispatcher.zdo_request(DEVICE, 'active_ep', timeout=0.01, addr16=DEVICE)
+        assert dispatcher.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_late_response_goes_to_subscribers():
+    async def main():
+        network = dispatch.LoopbackNetwork()
+        _responder(network, DEVICE, delays={1: 0.05})
+        dispatcher = dispatch.Dispatcher(network.transport(COORDINATOR))
+        received = []
+        dispatcher.subscribe(lambda source, endpoint, frame: received.append(frame.command_name))
+        with pytest.raises(asyncio.TimeoutError):
+            await dispatcher.profile_request(DEVICE, 1, 'basic', 'read_attributes', timeout=0.01, attributes=[1])
+        await asyncio.sleep(0.1)
+        assert received == ['read_attributes_response']
+
+    asyncio.run(main())
+
+
+def test_subscribe():
+    async def main():
+        network = dispatch.LoopbackNetwork()
+        device = network.transport(DEVICE)
+        dispatcher = dispatch.Dispatcher(network.transport(COORDINATOR))
+        onoff, anything = [], []
+
+        def on_onoff(source, endpoint, frame):
+            onoff.append((source, endpoint, frame.command_name,))
+
+        dispatcher.subscribe(on_onoff, 0x0006)
+        dispatcher.subscribe(lambda source, endpoint, frame: anything.append(frame.cluster_name))
+
+        for cluster_name, command_name in (('onoff', 'toggle',), ('level_control', 'stop',),):
+            cluster, data = spec.encode_cluster_command(cluster_name, command_name, 7)
+            await device.send(COORDINATOR, 1, spec.Profile.HOME_AUTOMATION, cluster, data)
+        await asyncio.sleep(0)
+        assert onoff == [(DEVICE, 1, 'toggle',)]
+        assert anything == ['onoff', 'level_control']
+
+        dispatcher.unsubscribe(on_onoff, 0x0006)
+        cluster, data = spec.encode_cluster_command('onoff', 'on', 8)
+        await device.send(COORDINATOR, 1, spec.Profile.HOME_AUTOMATION, cluster, data)
+        await asyncio.sleep(0)
+        assert len(onoff) == 1
+        assert anything == ['onoff', 'level_control', 'onoff']
+
+    asyncio.run(main())
+
+
+def test_failing_subscriber_does_not_stop_others():
+    async def main():
+        network = dispatch.LoopbackNetwork()
+        device = network.transport(DEVICE)
+        dispatcher = dispatch.Dispatcher(network.transport(COORDINATOR))
+        received = []
+
+        def fail(source, endpoint, frame):
+            raise RuntimeError('subscriber bug')
+
+        dispatcher.subscribe(fail, 0x0006)
+        dispatcher.subscribe(lambda source, endpoint, frame: received.append(frame.command_name), 0x0006)
+        dispatcher.subscribe(lambda source, endpoint, frame: received.append(frame.cluster_name))
+        cluster, data = spec.encode_cluster_command('onoff', 'toggle', 7)
+        await device.send(COORDINATOR, 1, spec.Profile.HOME_AUTOMATION, cluster, data)
+        await asyncio.sleep(0)
+        assert received == ['toggle', 'onoff']
+        assert dispatcher.subscriber_errors == 1
+
+    asyncio.run(main())
+
+
+def test_undecodable_frames_are_dropped():
+    async def main():
+        network = dispatch.LoopbackNetwork()
+        device = network.transport(DEVICE)
+        dispatcher = dispatch.Dispatcher(network.transport(COORDINATOR))
+        received = []
+        dispatcher.subscribe(lambda source, endpoint, frame: received.append(frame))
+        await device.send(COORDINATOR, 1, spec.Profile.HOME_AUTOMATION, 0x0006, b'\x01')
+        await device.send(COORDINATOR, 1, spec.Profile.HOME_AUTOMATION, 0xfc00, b'\x01\x02\x00')
+        await asyncio.sleep(0)
+        assert received == []
+        assert dispatcher.dropped == 2
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+import types
+
+import pytest
+
+from zcl import memo
+from zcl import metrics
+from zcl import spec
+
+
+def _report(seq, value):
+    return spec.encode_profile_command('level_control', 'report_attributes', seq, direction=1, attributes=[{'attribute': 0, 'datatype': 'uint8', 'value': value}])
+
+
+def _expected(cluster, data):
+    result = spec.decode_zcl(cluster, data)
+    return result[:5] + (memo._freeze(result[5]),)
+
+
+def test_hit():
+    decoder = memo.MemoDecoder()
+    cluster, first = _report(1, 0x42)
+    _cluster, second = _report(2, 0x42)
+    assert decoder.decode_zcl(cluster, first) == _expected(cluster, first)
+    result = decoder.decode_zcl(cluster, second)
+    # Same payload, so a hit, but with this frame's seq.
+    assert result == _expected(cluster, second)
+    assert result[1] == 2
+    assert (decoder.hits, decoder.misses, len(decoder),) == (1, 1, 1,)
+    # Results are shared, so they can't be changed.
+    kwargs = result[5]
+    assert isinstance(kwargs, types.MappingProxyType) and isinstance(kwargs['attributes'], tuple)
+    assert decoder.decode_zcl(cluster, bytearray(first))[5] is kwargs
+
+
+def test_miss_on_payload():
+    decoder = memo.MemoDecoder()
+    cluster, first = _report(1, 0x42)
+    _cluster, second = _report(1, 0x43)
+    decoder.decode_zcl(cluster, first)
+    assert decoder.decode_zcl(cluster, second)[5]['attributes'][0]['value'] == 0x43
+    assert (decoder.hits, decoder.misses,) == (0, 2,)
+
+
+def test_eviction():
+    decoder = memo.MemoDecoder(max_entries=2)
+    cluster = _report(0, 0)[0]
+    frames = [_report(0, value)[1] for value in range(3)]
+    decoder.decode_zcl(cluster, frames[0])
+    decoder.decode_zcl(cluster, frames[1])
+    # Using the first again makes the second the least recently used.
+    decoder.decode_zcl(cluster, frames[0])
+    decoder.decode_zcl(cluster, frames[2])
+    assert len(decoder) == 2
+    misses = decoder.misses
+    decoder.decode_zcl(cluster, frames[0])
+    assert decoder.misses == misses
+    decoder.decode_zcl(cluster, frames[1])
+    assert decoder.misses == misses + 1
+
+
+def test_errors_not_cached():
+    decoder = memo.MemoDecoder()
+    with pytest.raises(ValueError):
+        decoder.decode_zcl(0xfc00, b'\x01\x10\x01')
+    assert len(decoder) == 0
+
+
+def test_metrics():
+    decoder = memo.MemoDecoder()
+    cluster, frame = _report(1, 0x42)
+    m = metrics.enable()
+    try:
+        decoder.decode_zcl(cluster, frame)
+        decoder.decode_zcl(cluster, frame)
+    finally:
+        metrics.disable()
+    assert (m.counters['memo_hits'], m.counters['memo_misses'],) == (1, 1,)
+    ops = {entry['op']: entry['count'] for entry in m.snapshot()['commands']}
+    assert ops == {'decode_zcl': 1, 'decode_zcl_memo': 1}
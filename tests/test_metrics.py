@@ -0,0 +1,45 @@
+import pytest
+
+from zcl import metrics
+from zcl import spec
+
+
+def _functions():
+    return {op: getattr(spec, op) for op in metrics._DESCRIBE}
+
+
+def test_disable_restores_originals():
+    # What makes disabled metrics free: the spec functions are the
+    # originals again, not wrappers that check a flag.
+    before = _functions()
+    metrics.enable()
+    try:
+        assert all(getattr(spec, op) is not fn for op, fn in before.items())
+    finally:
+        metrics.disable()
+    assert _functions() == before
+    assert all(not hasattr(fn, '__wrapped__') for fn in before.values())
+    assert metrics.current() is None
+
+
+def test_record():
+    m = metrics.enable()
+    try:
+        spec.decode_zcl(0x0006, b'\x01\x10\x01')
+        spec.encode_cluster_command('onoff', 'on', 1)
+        with pytest.raises(ValueError):
+            spec.decode_zcl(0xfc00, b'\x01\x10\x01')
+    finally:
+        metrics.disable()
+    snapshot = m.snapshot()
+    counts = {(entry['op'], entry['cluster'], entry['command'],): (entry['count'], entry['bytes'],) for entry in snapshot['commands']}
+    assert counts == {
+        ('decode_zcl', 'onoff', 'on',): (1, 3,),
+        ('encode_cluster_command', 'onoff', 'on',): (1, 3,),
+    }
+    assert snapshot['errors'] == [{'op': 'decode_zcl', 'type': 'ValueError', 'count': 1}]
+    assert sum(snapshot['latency']['decode_zcl']['counts']) == 1
+
+    # Nothing is recorded once disabled.
+    spec.decode_zcl(0x0006, b'\x01\x10\x01')
+    assert m.snapshot()['commands'] == snapshot['commands']
@@ -0,0 +1,77 @@
+import concurrent.futures
+import struct
+
+import pytest
+
+from zcl import capture, parallel, spec
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with concurrent.futures.ProcessPoolExecutor(2) as pool:
+        yield pool
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'capture')
+    with open(path, 'wb') as f:
+        writer = capture.CaptureWriter(f)
+        for k in range(300):
+            if k % 50 == 7:
+                payload = b'\x01\x02\x99'
+            elif k % 3:
+                payload = spec.encode_profile_command('level_control', 'report_attributes', k % 256, direction=1, attributes=[{'attribute': 0, 'datatype': 'uint8', 'value': k % 256}])[1]
+            else:
+                payload = spec.encode_cluster_command('onoff', 'on', k % 256)[1]
+            writer.write(float(k), 0x1000 + k % 4, 1, 0x0104, 8 if k % 3 else 6, payload)
+    return path
+
+
+def _serial(path):
+    results = []
+    errors = []
+    with open(path, 'rb') as f:
+        for index, record in enumerate(capture.read_capture(f)):
+            try:
+                results.append((index, capture.decode_record(record),))
+            except (ValueError, struct.error):
+                errors.append(index)
+    return results, errors
+
+
+@pytest.mark.parametrize('shards', [1, 7, 64, 1000])
+def test_decode_parallel_order(pool, path, shards):
+    expected, expected_errors = _serial(path)
+    errors = []
+    assert list(parallel.decode_parallel(path, 2, errors, shards=shards, executor=pool)) == expected
+    assert [index for index, _e in errors] == expected_errors
+
+
+def test_decode_parallel_raises(pool, path):
+    with pytest.raises(ValueError):
+        list(parallel.decode_parallel(path, 2, shards=4, executor=pool))
+
+
+def test_shard_capture(path):
+    shards = parallel.shard_capture(path, 5)
+    assert shards[0][0] == capture._FILE_HEADER.size
+    assert all(end == start for (_s, end, _f), (start, _e, _g) in zip(shards, shards[1:]))
+    assert shards[0][2] == 0 and sorted(first for _s, _e, first in shards) == [first for _s, _e, first in shards]
+
+
+def test_aggregate_parallel(pool, path):
+    expected = parallel.Aggregate()
+    with open(path, 'rb') as f:
+        for record in capture.read_capture(f):
+            try:
+                expected.add(record, capture.decode_record(record))
+            except (ValueError, struct.error) as e:
+                expected.add_error(e)
+
+    aggregate = parallel.aggregate_parallel(path, 2, shards=9, executor=pool)
+    assert (aggregate.frames, aggregate.commands, aggregate.errors,) == (expected.frames, expected.commands, expected.errors,)
+    stats = lambda s: (s.count, s.min, s.max, s.last,)
+    assert {key: stats(s) for key, s in aggregate.attributes.items()} == {key: stats(s) for key, s in expected.attributes.items()}
+    # The last value is by timestamp, whichever shard it was in.
+    assert aggregate.attributes[('level_control', 0,)].last == 299 % 256
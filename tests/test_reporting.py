@@ -0,0 +1,133 @@
+import asyncio
+import random
+import struct
+import time
+
+from zcl import cache
+from zcl import dispatch
+from zcl import reporting
+from zcl import simulator
+from zcl import spec
+
+
+CURRENT_LEVEL = cache.attribute_id('level_control', 'current_level')
+ONOFF = cache.attribute_id('onoff', 'onoff')
+
+
+def _setup(**kwargs):
+    network = simulator.SimulatedNetwork()
+    devices = network.add_devices(2, **kwargs)
+    dispatcher = dispatch.Dispatcher(network.transport(), timeout=0.05)
+    return network, devices, dispatcher
+
+
+def _responder(network, address, respond):
+    # A device at address that answers each frame with respond(data).
+    def frame_received(source, endpoint, profile, cluster, data):
+        network.loopback.deliver(address, source, endpoint, profile, cluster, respond(data))
+    network.transport(address).set_receiver(frame_received)
+
+
+def test_plan():
+    configs = [
+        reporting.ReportingConfig(1, 1, 'level_control', 'current_level', 1, 60),
+        reporting.ReportingConfig(1, 1, 'onoff', ONOFF, 0, 300),
+        reporting.ReportingConfig(2, 1, 'level_control', CURRENT_LEVEL, 1, 60, delta=5),
+        reporting.ReportingConfig(1, 1, 'level_control', 0x7777, 1, 60, datatype='uint16'),
+    ]
+    assert reporting.plan(configs) == [
+        # Largest records first.
+        (1, 1, 'level_control', [
+            {'attribute': 0x7777, 'datatype': spec.DataType.UINT16, 'minimum': 1, 'maximum': 60, 'delta': 1},
+            {'attribute': CURRENT_LEVEL, 'datatype': spec.DataType.UINT8, 'minimum': 1, 'maximum': 60, 'delta': 1},
+        ]),
+        (1, 1, 'onoff', [{'attribute': ONOFF, 'datatype': spec.DataType.BOOLEAN, 'minimum': 0, 'maximum': 300}]),
+        (2, 1, 'level_control', [{'attribute': CURRENT_LEVEL, 'datatype': spec.DataType.UINT8, 'minimum': 1, 'maximum': 60, 'delta': 5}]),
+    ]
+
+
+def test_pack():
+    # 8, 9 and 10 byte records.
+    records = [{'attribute': k, 'datatype': 0x10, 'minimum': 0, 'maximum': 60} for k in range(5)]
+    records += [{'attribute': 0x100 + k, 'datatype': 0x20, 'minimum': 0, 'maximum': 60, 'delta': 1} for k in range(5)]
+    records += [{'attribute': 0x200 + k, 'datatype': 0x21, 'minimum': 0, 'maximum': 60, 'delta': 1} for k in range(5)]
+    for max_payload, count in ((13, 15,), (30, 6,), (82, 2,), (1000, 1,),):
+        frames = reporting._pack(records, max_payload)
+        assert sorted(record['attribute'] for records in frames for record in records) == sorted(record['attribute'] for record in records)
+        for frame in frames:
+            _cluster, data = spec.encode_profile_command('level_control', 'configure_reporting', 0, configs=frame)
+            assert len(data) <= max_payload
+        # 135 bytes of records in all. First fit decreasing packs 27 bytes
+        # a frame into 6 frames where 5 (10 + 9 + 8 each) would do.
+        assert len(frames) == count
+
+
+def test_configure():
+    async def main():
+        _network, devices, dispatcher = _setup()
+        planner = reporting.ReportingPlanner(dispatcher, backoff=0.001)
+        configs = [reporting.ReportingConfig(device.address, 1, 'level_control', 'current_level', 1, 60) for device in devices]
+        configs.append(reporting.ReportingConfig(devices[0].address, 1, 'level_control', 0x7777, 1, 60, datatype='uint8'))
+        results = await planner.configure(configs)
+        assert results == {
+            (devices[0].address, 1, 'level_control', CURRENT_LEVEL,): 'SUCCESS',
+            (devices[1].address, 1, 'level_control', CURRENT_LEVEL,): 'SUCCESS',
+            (devices[0].address, 1, 'level_control', 0x7777,): 'UNSUPPORTED_ATTRIBUTE',
+        }
+        # UNSUPPORTED_ATTRIBUTE isn't retried.
+        assert planner.frames == 2
+        assert planner.failed == {(devices[0].address, 1, 'level_control', 0x7777,): 'UNSUPPORTED_ATTRIBUTE'}
+        assert all((1, spec.get_cluster_by_name('level_control'), CURRENT_LEVEL,) in device.reporting for device in devices)
+
+    asyncio.run(main())
+
+
+def test_retries_lost_frames():
+    async def main():
+        _network, devices, dispatcher = _setup(loss=0.5, rng=random.Random(1))
+        planner = reporting.ReportingPlanner(dispatcher, retries=10, backoff=0.001)
+        results = await planner.configure([reporting.ReportingConfig(device.address, 1, 'level_control', 'current_level', 1, 60) for device in devices])
+        assert set(results.values()) == {'SUCCESS'}
+        assert planner.frames > 2
+
+    asyncio.run(main())
+
+
+def test_retries_status_with_backoff():
+    async def main():
+        network, _devices, dispatcher = _setup()
+        attempts = []
+
+        def respond(data):
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                # INSUFFICIENT_SPACE for current_level.
+                return bytes((0x18, data[1], 0x07, 0x89, 0x00)) + struct.pack('<H', CURRENT_LEVEL)
+            return bytes((0x18, data[1], 0x07, 0x00))
+        _responder(network, 0x6666, respond)
+
+        planner = reporting.ReportingPlanner(dispatcher, retries=3, backoff=0.02)
+        results = await planner.configure([reporting.ReportingConfig(0x6666, 1, 'level_control', 'current_level', 1, 60)])
+        assert results == {(0x6666, 1, 'level_control', CURRENT_LEVEL,): 'SUCCESS'}
+        assert planner.frames == 3
+        # Backoff doubles between attempts.
+        assert attempts[1] - attempts[0] >= 0.02
+        assert attempts[2] - attempts[1] >= 0.04
+
+    asyncio.run(main())
+
+
+def test_malformed_response():
+    async def main():
+        network, _devices, dispatcher = _setup()
+        # A failure record without its direction and attribute.
+        _responder(network, 0x6666, lambda data: bytes((0x18, data[1], 0x07, 0x86)))
+
+        planner = reporting.ReportingPlanner(dispatcher, retries=2, backoff=0.001)
+        results = await planner.configure([reporting.ReportingConfig(0x6666, 1, 'level_control', 'current_level', 1, 60)])
+        status = results[(0x6666, 1, 'level_control', CURRENT_LEVEL,)]
+        assert isinstance(status, struct.error)
+        # Retried like a timeout.
+        assert planner.frames == 3
+
+    asyncio.run(main())
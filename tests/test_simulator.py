@@ -0,0 +1,39 @@
+import asyncio
+
+from zcl import cache
+from zcl import dispatch
+from zcl import simulator
+
+
+def _setup(**kwargs):
+    network = simulator.SimulatedNetwork()
+    device, = network.add_devices(1, **kwargs)
+    dispatcher = dispatch.Dispatcher(network.transport(), timeout=1.0)
+    return device, dispatcher
+
+
+def test_responses_are_tracked():
+    async def main():
+        device, dispatcher = _setup(latency=0.01)
+        frame = await dispatcher.profile_request(device.address, 1, 'basic', 'read_attributes', attributes=[cache.attribute_id('basic', 'model_id')])
+        assert frame['attributes'][0]['value'] == 'Light'
+        # The send task is dropped once it's done.
+        await asyncio.sleep(0)
+        assert not device._sending
+
+    asyncio.run(main())
+
+
+def test_write_attributes():
+    async def main():
+        device, dispatcher = _setup()
+        frame = await dispatcher.profile_request(device.address, 1, 'level_control', 'write_attributes', attributes=[
+            {'attribute': cache.attribute_id('level_control', 'current_level'), 'datatype': 'uint8', 'value': 0x42},
+        ])
+        assert frame['attributes'] == [{'status': 'SUCCESS'}]
+        frame = await dispatcher.profile_request(device.address, 1, 'level_control', 'write_attributes', attributes=[
+            {'attribute': 0x7777, 'datatype': 'uint8', 'value': 1},
+        ])
+        assert frame['attributes'] == [{'status': 'UNSUPPORTED_ATTRIBUTE', 'attribute': 0x7777}]
+
+    asyncio.run(main())
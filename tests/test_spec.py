@@ -0,0 +1,315 @@
+import pytest
+
+from zcl import spec
+
+
+CLUSTER = spec.ZclCommandType.CLUSTER
+PROFILE = spec.ZclCommandType.PROFILE
+
+# (cluster, frame, decode_zdo result). The results are what the codec
+# returned before it was reworked, and must not change.
+ZDO_DECODES = [
+    (0x8005, '2400341203 0102f2', ('active_ep_resp', 0x24, {'status': 0, 'addr16': 0x1234, 'active_eps': [1, 2, 242]})),
+    (0x8004, '23003412 14 01 0401 0001 01 06 0000 0300 0400 0500 0600 0800 01 1900', ('simple_desc_resp', 0x23, {'status': 0, 'addr16': 0x1234, 'simple_descriptors': [
+        {'endpoint': 1, 'profile': 0x0104, 'device_identifier': 0x0100, 'device_version': 1, 'in_clusters': [0, 3, 4, 5, 6, 8], 'out_clusters': [0x19]},
+    ]})),
+    (0x8038, '25 00 00f8ff07 b004 0c00 04 40414243', ('mgmt_nwk_update_notify', 0x25, {'status': 0, 'scanned_channels': 0x07fff800, 'total_transmissions': 1200, 'transmisson_failures': 12, 'energy_values': [0x40, 0x41, 0x42, 0x43]})),
+    (0x0013, '07 3412 7766554433221100 8e', ('device_annce', 7, {'addr16': 0x1234, 'addr64': 0x0011223344556677, 'capability': 0x8e})),
+    (0x0006, '08 fdff 0401 02 0600 0800 00', ('match_desc', 8, {'addr16': 0xfffd, 'profile': 0x0104, 'in_clusters': [6, 8], 'out_clusters': []})),
+]
+
+# (cluster, frame, decode_zcl result).
+ZCL_DECODES = [
+    (0x0006, '011001', ('onoff', 0x10, CLUSTER, 'on', True, {})),
+    (0x0006, '1110 01', ('onoff', 0x10, CLUSTER, 'on', False, {})),
+    (0x0008, '0113 00 80 0a00', ('level_control', 0x13, CLUSTER, 'move_to_level', True, {'level': 0x80, 'time': 10})),
+    (0x0006, '0112 40 01 00', ('onoff', 0x12, CLUSTER, 'off_with_effect', True, {'effect_id': 1, 'effect_variant': 0})),
+    (0x0004, '1930 01 00 0300 06 4c6976696e67', ('groups', 0x30, CLUSTER, 'view_group_response', False, {'status': 'SUCCESS', 'id': 3, 'name': 'Living'})),
+    (0x0000, '182101 0000 00 20 03 0400 00 42 0e 494b4541206f662053776564656e 1000 86', ('basic', 0x21, PROFILE, 'read_attributes_response', False, {'attributes': [
+        {'attribute': 0x0000, 'status': 'SUCCESS', 'datatype': spec.DataType.UINT8, 'value': 3},
+        {'attribute': 0x0004, 'status': 'SUCCESS', 'datatype': spec.DataType.CHARACTER_STRING, 'value': 'IKEA of Sweden'},
+        {'attribute': 0x0010, 'status': 'UNSUPPORTED_ATTRIBUTE'},
+    ]})),
+    (0x0008, '18220a 0000 20 fe 0100 21 0000', ('level_control', 0x22, PROFILE, 'report_attributes', False, {'attributes': [
+        {'attribute': 0x0000, 'datatype': spec.DataType.UINT8, 'value': 0xfe},
+        {'attribute': 0x0001, 'datatype': spec.DataType.UINT16, 'value': 0},
+    ]})),
+    (0x0008, '181607 00', ('level_control', 0x16, PROFILE, 'configure_reporting_response', False, {'results': [{'status': 'SUCCESS'}]})),
+    # These raised before write_attr_status records had an attribute and
+    # attr_reporting_config records had a decoder.
+    (0x0000, '181704 00', ('basic', 0x17, PROFILE, 'write_attributes_response', False, {'attributes': [{'status': 'SUCCESS'}]})),
+    (0x0000, '181704 86 1000 87 1100', ('basic', 0x17, PROFILE, 'write_attributes_response', False, {'attributes': [
+        {'status': 'UNSUPPORTED_ATTRIBUTE', 'attribute': 0x0010},
+        {'status': 'INVALID_VALUE', 'attribute': 0x0011},
+    ]})),
+    (0x0008, '001606 00 0000 20 0100 3c00 01 01 0100 1e00', ('level_control', 0x16, PROFILE, 'configure_reporting', True, {'configs': [
+        {'direction': 0, 'attribute': 0x0000, 'datatype': spec.DataType.UINT8, 'minimum': 1, 'maximum': 60, 'delta': 1},
+        {'direction': 1, 'attribute': 0x0001, 'timeout': 30},
+    ]})),
+]
+
+# (function, args, kwargs, (cluster, frame)).
+ENCODES = [
+    (spec.encode_zdo, ('active_ep', 0x17,), {'addr16': 0x1234}, (0x0005, '17 3412')),
+    (spec.encode_zdo, ('match_desc', 0x18,), {'addr16': 0xfffd, 'profile': 0x0104, 'in_clusters': [6, 8], 'out_clusters': []}, (0x0006, '18 fdff 0401 02 0600 0800 00')),
+    (spec.encode_cluster_command, ('onoff', 'on', 0x10,), {}, (0x0006, '011001')),
+    (spec.encode_cluster_command, ('onoff', 'on', 0x10,), {'default_response': False}, (0x0006, '111001')),
+    (spec.encode_cluster_command, ('onoff', 'on', 5,), {'manufacturer_code': 0x1234}, (0x0006, '05 3412 05 01')),
+    (spec.encode_cluster_command, ('level_control', 'move_to_level', 0x13,), {'level': 0x80, 'time': 10}, (0x0008, '0113 00 80 0a00')),
+    (spec.encode_cluster_command, ('onoff', 'off_with_effect', 0x12,), {'effect_id': 1, 'effect_variant': 0}, (0x0006, '0112 40 01 00')),
+    (spec.encode_cluster_command, ('groups', 'add_group', 0x20,), {'id': 0x0102, 'name': 'Living'}, (0x0004, '0120 00 0201 06 4c6976696e67')),
+    (spec.encode_profile_command, ('basic', 'read_attributes', 0x15,), {'attributes': [4, 5]}, (0x0000, '001500 0400 0500')),
+    (spec.encode_profile_command, ('level_control', 'configure_reporting', 0x16,), {'configs': [{'attribute': 0, 'datatype': 'uint8', 'minimum': 1, 'maximum': 60, 'delta': 1}]}, (0x0008, '001606 00 0000 20 0100 3c00 01')),
+    # These raised before datatypes could be given as ids, write_attr went
+    # through the datatype table, and write_attr_status records had an
+    # attribute.
+    (spec.encode_profile_command, ('level_control', 'configure_reporting', 0x16,), {'configs': [{'attribute': 0, 'datatype': 0x20, 'minimum': 1, 'maximum': 60, 'delta': 1}, {'direction': 1, 'attribute': 1, 'timeout': 30}]}, (0x0008, '001606 00 0000 20 0100 3c00 01 01 0100 1e00')),
+    (spec.encode_profile_command, ('onoff', 'write_attributes', 0x01,), {'attributes': [{'attribute': 0x4003, 'datatype': 'bool', 'value': True}]}, (0x0006, '000102 0340 10 01')),
+    (spec.encode_profile_command, ('basic', 'write_attributes_response', 0x17,), {'attributes': [{'status': 'SUCCESS'}]}, (0x0000, '001704 00')),
+    (spec.encode_profile_command, ('basic', 'write_attributes_response', 0x17,), {'attributes': [{'status': 'UNSUPPORTED_ATTRIBUTE', 'attribute': 0x0010}]}, (0x0000, '001704 86 1000')),
+]
+
+# Output that changed on purpose when record lists without a count started
+# decoding to the end of the frame, and profile commands started honouring
+# direction, default_response and manufacturer_code.
+# (cluster, frame, before, after) for decode_zcl.
+CHANGED_DECODES = [
+    (0x0000, '101500 0400 0500',
+        ('basic', 0x15, PROFILE, 'read_attributes', False, {'attributes': [4]}),
+        ('basic', 0x15, PROFILE, 'read_attributes', False, {'attributes': [4, 5]})),
+    (0x0000, '001602 1000 42 03 416263 1100 20 05',
+        ('basic', 0x16, PROFILE, 'write_attributes', True, {'attributes': [
+            {'attribute': 0x0010, 'datatype': spec.DataType.CHARACTER_STRING, 'value': 'Abc'},
+        ]}),
+        ('basic', 0x16, PROFILE, 'write_attributes', True, {'attributes': [
+            {'attribute': 0x0010, 'datatype': spec.DataType.CHARACTER_STRING, 'value': 'Abc'},
+            {'attribute': 0x0011, 'datatype': spec.DataType.UINT8, 'value': 5},
+        ]})),
+]
+
+# (args, kwargs, before, after) for encode_profile_command and
+# profile_command_template.
+CHANGED_ENCODES = [
+    (('basic', 'read_attributes', 0x15,), {'attributes': [4], 'direction': 1, 'default_response': False}, '0015000400', '1815000400'),
+    (('basic', 'read_attributes', 0x15,), {'attributes': [4], 'manufacturer_code': 0x1234}, '0015000400', '04 3412 15 00 0400'),
+]
+
+
+def _hex(frame):
+    return bytes.fromhex(frame.replace(' ', ''))
+
+
+@pytest.fixture(params=[False, True], ids=['plans', 'codegen'])
+def codec(request):
+    spec.use_codegen(request.param)
+    yield
+    spec.use_codegen(False)
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZDO_DECODES)
+def test_decode_zdo(codec, cluster, frame, expected):
+    assert spec.decode_zdo(cluster, _hex(frame)) == expected
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZCL_DECODES)
+def test_decode_zcl(codec, cluster, frame, expected):
+    assert spec.decode_zcl(cluster, _hex(frame)) == expected
+
+
+@pytest.mark.parametrize('fn, args, kwargs, expected', ENCODES)
+def test_encode(codec, fn, args, kwargs, expected):
+    cluster, frame = expected
+    assert fn(*args, **kwargs) == (cluster, _hex(frame),)
+
+
+@pytest.mark.parametrize('fn, args, kwargs, expected', ENCODES)
+def test_encode_into(codec, fn, args, kwargs, expected):
+    into = getattr(spec, fn.__name__ + '_into')
+    cluster, frame = expected
+    buffer = bytearray(64)
+    assert into(buffer, 3, *args, **kwargs) == (cluster, len(_hex(frame)),)
+    assert buffer[3:3 + len(_hex(frame))] == _hex(frame)
+
+
+# memoryview input came with decoding in place; bytes and bytearray give
+# the same results as before the rework.
+@pytest.mark.parametrize('wrap', [bytes, bytearray, memoryview])
+@pytest.mark.parametrize('cluster, frame, expected', ZCL_DECODES)
+def test_decode_zcl_buffers(wrap, cluster, frame, expected):
+    assert spec.decode_zcl(cluster, wrap(_hex(frame))) == expected
+
+
+@pytest.mark.parametrize('wrap', [bytes, bytearray, memoryview])
+@pytest.mark.parametrize('cluster, frame, expected', ZDO_DECODES)
+def test_decode_zdo_buffers(wrap, cluster, frame, expected):
+    assert spec.decode_zdo(cluster, wrap(_hex(frame))) == expected
+
+
+@pytest.mark.parametrize('cluster, frame, before, after', CHANGED_DECODES)
+def test_changed_decode_zcl(codec, cluster, frame, before, after):
+    assert spec.decode_zcl(cluster, _hex(frame)) == after != before
+    assert spec.decode_zcl_compact(cluster, _hex(frame)).as_tuple() == after
+
+
+@pytest.mark.parametrize('args, kwargs, before, after', CHANGED_ENCODES)
+def test_changed_encode_profile_command(codec, args, kwargs, before, after):
+    assert spec.encode_profile_command(*args, **kwargs) == (0x0000, _hex(after),)
+    assert _hex(after) != _hex(before)
+    cluster_name, command_name, seq = args
+    template = spec.profile_command_template(cluster_name, command_name, **kwargs)
+    assert template.encode(seq) == (0x0000, _hex(after),)
+
+
+# (template function, args, template kwargs, encode kwargs).
+TEMPLATES = [
+    (spec.cluster_command_template, ('onoff', 'on',), {}, {}),
+    (spec.cluster_command_template, ('onoff', 'on',), {'default_response': False, 'manufacturer_code': 0x1234}, {}),
+    (spec.cluster_command_template, ('level_control', 'move_to_level',), {'time': 10}, {'level': 0x80}),
+    (spec.cluster_command_template, ('level_control', 'move_to_level',), {}, {'level': 0x80, 'time': 10}),
+    (spec.cluster_command_template, ('groups', 'add_group',), {'name': 'Living'}, {'id': 0x0102}),
+    (spec.profile_command_template, ('basic', 'read_attributes',), {'attributes': [4, 5]}, {}),
+]
+
+
+@pytest.mark.parametrize('template, args, fixed, variable', TEMPLATES)
+@pytest.mark.parametrize('seq', [0, 0x15, 255])
+def test_template(template, args, fixed, variable, seq):
+    encode = spec.encode_cluster_command if template is spec.cluster_command_template else spec.encode_profile_command
+    expected = encode(*args, seq, **fixed, **variable)
+    t = template(*args, **fixed)
+    assert t.encode(seq, **variable) == expected
+    buffer = bytearray(64)
+    assert t.encode_into(buffer, 3, seq, **variable) == (expected[0], len(expected[1]),)
+    assert buffer[3:3 + len(expected[1])] == expected[1]
+
+
+def test_template_errors():
+    on = spec.cluster_command_template('onoff', 'on')
+    move = spec.cluster_command_template('level_control', 'move_to_level', time=10)
+    for template, kwargs in ((on, {},), (move, {'level': 1},)):
+        for seq in (-1, 256):
+            with pytest.raises(ValueError):
+                template.encode(seq, **kwargs)
+            with pytest.raises(ValueError):
+                template.encode_into(bytearray(16), 0, seq, **kwargs)
+    with pytest.raises(ValueError, match='Unknown arg "level"'):
+        on.encode(1, level=1)
+    with pytest.raises(ValueError, match='Missing arg "level"'):
+        move.encode(1)
+    with pytest.raises(ValueError, match='Unknown arg "time"'):
+        move.encode(1, level=1, time=5)
+    with pytest.raises(ValueError):
+        # The string's length isn't known up front.
+        spec.cluster_command_template('groups', 'add_group')
+
+
+def _plain(value):
+    # Lazy RecordLists as lists.
+    if isinstance(value, dict):
+        return {name: _plain(v) for name, v in value.items()}
+    if isinstance(value, (list, spec.RecordList)):
+        return [_plain(v) for v in value]
+    return value
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZCL_DECODES)
+def test_decode_zcl_lazy(cluster, frame, expected):
+    frame = spec.decode_zcl_lazy(cluster, _hex(frame))
+    cluster_name, seq, command_type, command_name, default_response, kwargs = frame.as_tuple()
+    assert (cluster_name, seq, command_type, command_name, default_response, _plain(kwargs),) == expected
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZDO_DECODES)
+def test_decode_zdo_lazy(cluster, frame, expected):
+    cluster_name, seq, kwargs = spec.decode_zdo_lazy(cluster, _hex(frame)).as_tuple()
+    assert (cluster_name, seq, _plain(kwargs),) == expected
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZCL_DECODES)
+def test_decode_zcl_compact(cluster, frame, expected):
+    assert spec.decode_zcl_compact(cluster, _hex(frame)).as_tuple() == expected
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZCL_DECODES)
+def test_decode_zcl_compact_records(cluster, frame, expected):
+    frame = spec.decode_zcl_compact(cluster, _hex(frame))
+    for name in frame._fields:
+        value = getattr(frame, name)
+        if isinstance(value, list):
+            assert not any(isinstance(record, dict) for record in value)
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZDO_DECODES)
+def test_decode_zdo_compact(cluster, frame, expected):
+    assert spec.decode_zdo_compact(cluster, _hex(frame)).as_tuple() == expected
+
+
+def test_iter_zcl_records():
+    cluster, frame, expected = ZCL_DECODES[5]
+    assert list(spec.iter_zcl_records(cluster, _hex(frame))) == expected[5]['attributes']
+
+
+def test_peek_headers():
+    header = spec.peek_zcl_header(_hex('1821 01 0000 00 20 03'))
+    assert (header.command_type, header.direction, header.default_response, header.seq, header.command, header.size,) == (PROFILE, 1, False, 0x21, 0x01, 3,)
+    header = spec.peek_zdo_header(0x8005, _hex('24 00 3412 00'))
+    assert (header.seq, header.response,) == (0x24, True,)
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZCL_DECODES)
+def test_try_decode_zcl(cluster, frame, expected):
+    assert spec.try_decode_zcl(cluster, _hex(frame)) == expected
+
+
+@pytest.mark.parametrize('cluster, frame, expected', ZDO_DECODES)
+def test_try_decode_zdo(cluster, frame, expected):
+    assert spec.try_decode_zdo(cluster, _hex(frame)) == expected
+
+
+# (cluster, frame, reason, header size).
+ZCL_UNDECODABLE = [
+    (0x0006, '0110', 'short_header', None),
+    (0x0006, '0534', 'short_header', None),
+    (0x0006, '05 3412 10 01', 'manufacturer_specific', 5),
+    (0xfc00, '011001', 'unknown_cluster', 3),
+    (0x0006, '011099', 'unknown_command', 3),
+    (0x0000, '180101 0000 ff', 'invalid_payload', 3),
+    (0x0008, '0113 00 80 0a', 'truncated', 3),
+]
+
+
+@pytest.mark.parametrize('cluster, frame, reason, size', ZCL_UNDECODABLE)
+def test_try_decode_zcl_undecoded(cluster, frame, reason, size):
+    data = _hex(frame)
+    before = spec.DECODE_FALLBACKS[reason]
+    result = spec.try_decode_zcl(cluster, data)
+    assert isinstance(result, spec.Undecoded)
+    assert (result.cluster, result.reason,) == (cluster, reason,)
+    assert spec.DECODE_FALLBACKS[reason] == before + 1
+    if size is None:
+        assert result.header is None
+        assert bytes(result.payload) == data
+    else:
+        assert result.header.size == size
+        assert result.header.seq == data[size - 2]
+        assert bytes(result.payload) == data[size:]
+
+
+@pytest.mark.parametrize('cluster, frame, reason', [
+    (0x8005, '', 'short_header'),
+    (0x7fff, '01', 'unknown_cluster'),
+    (0x8005, '24 00 3412', 'truncated'),
+])
+def test_try_decode_zdo_undecoded(cluster, frame, reason):
+    result = spec.try_decode_zdo(cluster, _hex(frame))
+    assert isinstance(result, spec.Undecoded)
+    assert (result.cluster, result.reason,) == (cluster, reason,)
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        spec.decode_zcl(0xfc00, _hex('011001'))
+    with pytest.raises(ValueError):
+        spec.decode_zcl(0x0006, _hex('010199'))
+    with pytest.raises(ValueError):
+        spec.decode_zdo(0x7fff, _hex('01'))
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from zcl import capture, store
+
+
+def _write_capture(path, n, seed=1):
+    rng = random.Random(seed)
+    records = []
+    with open(path, 'wb') as f:
+        writer = capture.CaptureWriter(f)
+        for k in range(n):
+            # Out of order, and with repeated timestamps.
+            record = capture.CaptureRecord(float(rng.randrange(n // 2)), rng.choice((0x1111, 0x2222, 0x3333)), 1, 0x0104, rng.choice((0x0006, 0x0008)), bytes([k % 256]) * (k % 5))
+            writer.write_record(record)
+            records.append(record)
+    return records
+
+
+def _plain(records):
+    return [tuple(record[:5]) + (bytes(record.payload),) for record in records]
+
+
+def _expected(records, start=None, end=None, source=None, cluster=None):
+    # Time order, with ties in file order.
+    return sorted((record for record in records
+                   if (start is None or record.timestamp >= start) and (end is None or record.timestamp < end)
+                   and (source is None or record.source == source) and (cluster is None or record.cluster == cluster)),
+                  key=lambda record: record.timestamp)
+
+
+@pytest.mark.parametrize('query', [
+    {},
+    {'start': 10, 'end': 20},
+    {'start': 50},
+    {'end': 5},
+    {'source': 0x2222},
+    {'source': 0x2222, 'start': 10, 'end': 30},
+    {'cluster': 0x0008},
+    {'cluster': 0x0008, 'end': 40},
+    {'source': 0x1111, 'cluster': 0x0006},
+    {'source': 0x4444},
+    {'start': 30, 'end': 30},
+])
+def test_query(tmp_path, query):
+    path = str(tmp_path / 'capture')
+    records = _write_capture(path, 200)
+    with store.CaptureStore(path) as s:
+        assert len(s) == 200
+        assert _plain(s.query(**query)) == _plain(_expected(records, **query))
+
+
+def test_iter(tmp_path):
+    path = str(tmp_path / 'capture')
+    records = _write_capture(path, 50)
+    with store.CaptureStore(path) as s:
+        assert _plain(s) == _plain(_expected(records))
+
+
+@pytest.mark.parametrize('run_size', [1, 7, 64])
+def test_external_sort(tmp_path, run_size):
+    # Merged runs give the same index as a single in-memory sort.
+    path = str(tmp_path / 'capture')
+    _write_capture(path, 500)
+    store.build_index(path, run_size=10000)
+    with open(path + '.idx', 'rb') as f:
+        expected = f.read()
+    store.build_index(path, run_size=run_size)
+    with open(path + '.idx', 'rb') as f:
+        assert f.read() == expected
+
+
+def test_rebuild_stale_index(tmp_path):
+    path = str(tmp_path / 'capture')
+    _write_capture(path, 20)
+    with store.CaptureStore(path) as s:
+        assert len(s) == 20
+    records = _write_capture(path, 30, seed=2)
+    with store.CaptureStore(path) as s:
+        assert _plain(s) == _plain(_expected(records))
+
+
+def test_close_with_payloads(tmp_path):
+    path = str(tmp_path / 'capture')
+    _write_capture(path, 10)
+    s = store.CaptureStore(path)
+    payload = next(iter(s)).payload
+    with pytest.raises(BufferError):
+        s.close()
+    payload.release()
+    del payload
+    s.close()
+
+
+def test_not_a_capture(tmp_path):
+    path = tmp_path / 'capture'
+    path.write_bytes(b'NOTCAP\x01')
+    with pytest.raises(ValueError):
+        store.CaptureStore(str(path))
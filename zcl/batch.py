@@ -0,0 +1,189 @@
+# Batch decoding of many ZCL frames at once.
+#
+# Frames are grouped by (cluster, command) from their headers, and each
+# group is then decoded in one pass with a single command lookup. The
+# attribute records of report_attributes and read_attributes_response
+# are written straight into typed columns (array.array, one set per
+# fixed-width struct type) instead of a dict per record. Those convert
+# to NumPy structured arrays with to_numpy() if NumPy is installed.
+
+import array
+import struct
+
+from . import spec
+
+
+_UINT16 = struct.Struct('<H')
+
+# Commands whose records go into columns, and whether the records have a
+# status field.
+_ATTRIBUTE_COMMANDS = {
+    'read_attributes_response': True,
+    'report_attributes': False,
+}
+
+# Fixed-width datatypes: datatype -> (struct type, Struct).
+_FIXED_DATATYPES = {}
+for _datatype, _struct_type in spec.DATATYPE_STRUCT_TYPES.items():
+    _decode, _encode = spec.STRUCT_TYPES[_struct_type]
+    if not callable(_decode):
+        _FIXED_DATATYPES[int(_datatype)] = (_struct_type, struct.Struct(_decode),)
+
+
+class AttributeColumns:
+    """Columns of attribute records that all have the same struct type.
+    frame is the index of the record's frame in the input."""
+
+    __slots__ = ('struct_type', 'frame', 'attribute', 'datatype', 'value',)
+
+    def __init__(self, struct_type, fmt):
+        self.struct_type = struct_type
+        self.frame = array.array('I')
+        self.attribute = array.array('H')
+        self.datatype = array.array('B')
+        self.value = array.array(fmt.lstrip('<'))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def to_numpy(self):
+        import numpy
+        columns = ('frame', 'attribute', 'datatype', 'value',)
+        out = numpy.empty(len(self), dtype=[(name, getattr(self, name).typecode) for name in columns])
+        for name in columns:
+            column = getattr(self, name)
+            out[name] = numpy.frombuffer(column, dtype=column.typecode)
+        return out
+
+
+class BatchGroup:
+    """The decoded frames for one (cluster, command).
+
+    frames and seqs are the input index and sequence number of each frame
+    in the group. For attribute reports and read responses, records with
+    fixed-width values are in columns (by struct type) and the rest
+    (strings, failed statuses) are in other as (frame, record). For all
+    other commands, kwargs has the decoded payload of each frame.
+    """
+
+    __slots__ = ('cluster_name', 'command_type', 'command_name', 'frames', 'seqs', 'kwargs', 'columns', 'other',)
+
+    def __init__(self, cluster_name, command_type, command_name):
+        self.cluster_name = cluster_name
+        self.command_type = command_type
+        self.command_name = command_name
+        self.frames = array.array('I')
+        self.seqs = array.array('B')
+        self.kwargs = []
+        self.columns = {}
+        self.other = []
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        return 'BatchGroup({!r}, {!r}, frames={})'.format(self.cluster_name, self.command_name, len(self))
+
+
+def _decode_attribute_records(group, index, data, i, status):
+    columns = group.columns
+    end = len(data)
+    while i < end:
+        attribute, = _UINT16.unpack_from(data, i)
+        i += 2
+        if status:
+            name, i = spec._decode_status(data, i, None)
+            if name != 'SUCCESS':
+                group.other.append((index, {'attribute': attribute, 'status': name},))
+                continue
+        datatype, = spec._UINT8.unpack_from(data, i)
+        i += 1
+        fixed = _FIXED_DATATYPES.get(datatype)
+        if fixed is None:
+            record = {'attribute': attribute, 'datatype': datatype}
+            if status:
+                record = {'attribute': attribute, 'status': 'SUCCESS', 'datatype': datatype}
+            record['value'], i = spec._decode_datatype(data, i, record)
+            group.other.append((index, record,))
+            continue
+        struct_type, st = fixed
+        value, = st.unpack_from(data, i)
+        i += st.size
+        c = columns.get(struct_type)
+        if c is None:
+            c = columns[struct_type] = AttributeColumns(struct_type, st.format)
+        c.frame.append(index)
+        c.attribute.append(attribute)
+        c.datatype.append(datatype)
+        c.value.append(value)
+
+
+def _rollback(group, index):
+    # Drop any records already added for a frame that then failed.
+    for c in group.columns.values():
+        n = len(c.frame)
+        while n and c.frame[n - 1] == index:
+            n -= 1
+        for column in (c.frame, c.attribute, c.datatype, c.value,):
+            del column[n:]
+    while group.other and group.other[-1][0] == index:
+        group.other.pop()
+
+
+def decode_zcl_batch(clusters, frames, errors=None):
+    """Decode frames (with clusters[k] the cluster id of frames[k]) and
+    return {(cluster_name, command_name): BatchGroup}.
+
+    Frames that fail to decode raise the same errors as decode_zcl,
+    unless errors is a list, in which case (index, exception) is appended
+    to it and the frame is skipped.
+    """
+    # Group by the header first, so each group needs a single lookup.
+    pending = {}
+    for index, (cluster, data) in enumerate(zip(clusters, frames)):
+        try:
+            frame_control, _manufacturer_code, seq, command, i = spec._decode_zcl_header(data)
+        except struct.error as e:
+            if errors is None:
+                raise
+            errors.append((index, e,))
+            continue
+        key = (cluster, frame_control & 0x0d, command,)
+        entries = pending.get(key)
+        if entries is None:
+            entries = pending[key] = []
+        entries.append((index, seq, i, data,))
+
+    groups = {}
+    for (cluster, frame_control, command), entries in pending.items():
+        try:
+            cluster_name, command_type, command_name, args = spec._lookup_zcl_command(cluster, frame_control, command)
+        except ValueError as e:
+            if errors is None:
+                raise
+            errors.extend((index, e,) for index, _seq, _i, _data in entries)
+            continue
+
+        group = groups.get((cluster_name, command_name,))
+        if group is None:
+            group = groups[(cluster_name, command_name,)] = BatchGroup(cluster_name, command_type, command_name)
+
+        status = _ATTRIBUTE_COMMANDS.get(command_name) if command_type == spec.ZclCommandType.PROFILE else None
+        decoder = spec._get_decoder(args)
+        for index, seq, i, data in entries:
+            try:
+                if status is None:
+                    kwargs, _nbytes = decoder(data, i)
+                    group.kwargs.append(kwargs)
+                else:
+                    _decode_attribute_records(group, index, data, i, status)
+            except (ValueError, struct.error) as e:
+                if errors is None:
+                    raise
+                _rollback(group, index)
+                errors.append((index, e,))
+                continue
+            group.frames.append(index)
+            group.seqs.append(seq)
+
+    return groups
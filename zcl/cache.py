@@ -0,0 +1,123 @@
+# Cache of attribute values by (device, endpoint, cluster, attribute).
+#
+# Entries come from report_attributes and read_attributes_response
+# frames (attach() subscribes the cache to a Dispatcher, including the
+# responses to other callers' requests), and expire after ttl seconds.
+# The cache holds at most max_entries values, and evicts the least
+# recently used. read() answers from the cache where it can and sends a
+# single read_attributes for the rest.
+
+import collections
+import time
+
+from . import spec
+
+
+CachedAttribute = collections.namedtuple('CachedAttribute', ('value', 'datatype', 'timestamp',))
+
+_ATTRIBUTE_COMMANDS = ('report_attributes', 'read_attributes_response',)
+
+
+def attribute_id(cluster_name, attribute):
+    """The id of attribute (a name in the CLUSTERS_BY_NAME tables, or
+    already an id) of cluster_name. Raises ValueError for an unknown
+    cluster or attribute name."""
+    spec.get_cluster_by_name(cluster_name)
+    if not isinstance(attribute, str):
+        return attribute
+    _cluster, _rx_commands, _tx_commands, attributes = spec.CLUSTERS_BY_NAME[cluster_name]
+    if attribute not in attributes:
+        raise ValueError('Unknown attribute "{}" for cluster "{}"'.format(attribute, cluster_name))
+    attribute, _datatype = attributes[attribute]
+    return attribute
+
+
+def attribute_name(cluster, attribute):
+    """The name of attribute (an id) in the CLUSTERS_BY_ID tables, or None
+    if it isn't known."""
+    if cluster not in spec.CLUSTERS_BY_ID:
+        return None
+    _cluster_name, _rx_commands, _tx_commands, attributes = spec.CLUSTERS_BY_ID[cluster]
+    if attribute not in attributes:
+        return None
+    name, _datatype = attributes[attribute]
+    return name
+
+
+class AttributeCache:
+    def __init__(self, ttl=60.0, max_entries=65536, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, device, endpoint, cluster, attribute, value, datatype=None):
+        key = (device, endpoint, cluster, attribute,)
+        self._entries[key] = CachedAttribute(value, datatype, self.clock())
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, device, endpoint, cluster, attribute):
+        self._entries.pop((device, endpoint, cluster, attribute,), None)
+
+    def get(self, device, endpoint, cluster, attribute, max_age=None):
+        """Return the CachedAttribute for the attribute (an id) if it's no
+        older than max_age (default: the ttl), otherwise None."""
+        key = (device, endpoint, cluster, attribute,)
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = self.clock() - entry.timestamp
+            if age <= (self.ttl if max_age is None else min(max_age, self.ttl)):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if age > self.ttl:
+                del self._entries[key]
+        self.misses += 1
+        return None
+
+    def feed(self, source, endpoint, frame):
+        """Add the attributes in frame if it's a report_attributes or
+        read_attributes_response. The signature matches Dispatcher
+        subscribers, and other frames (including ZdoFrames) are
+        ignored."""
+        if not isinstance(frame, spec.ZclFrame) or frame.command_type != spec.ZclCommandType.PROFILE or frame.command_name not in _ATTRIBUTE_COMMANDS:
+            return
+        cluster = spec.get_cluster_by_name(frame.cluster_name)
+        for record in frame['attributes']:
+            if 'value' in record:
+                self.update(source, endpoint, cluster, record['attribute'], record['value'], record['datatype'])
+
+    def attach(self, dispatcher):
+        dispatcher.subscribe(self.feed, responses=True)
+
+    async def read(self, dispatcher, device, endpoint, cluster_name, attributes, max_age=None):
+        """Return {attribute: value} for attributes (names or ids) of
+        cluster_name, reading the ones that aren't cached (or are older
+        than max_age) from the device. Attributes the device fails to
+        read are left out."""
+        cluster = spec.get_cluster_by_name(cluster_name)
+        result = {}
+        missing = {}
+        for attribute in attributes:
+            ident = attribute_id(cluster_name, attribute)
+            entry = self.get(device, endpoint, cluster, ident, max_age)
+            if entry is None:
+                missing.setdefault(ident, []).append(attribute)
+            else:
+                result[attribute] = entry.value
+        if missing:
+            frame = await dispatcher.profile_request(device, endpoint, cluster_name, 'read_attributes', attributes=list(missing))
+            if frame.command_name == 'read_attributes_response':
+                self.feed(device, endpoint, frame)
+                for record in frame['attributes']:
+                    if 'value' in record:
+                        for attribute in missing.get(record['attribute'], ()):
+                            result[attribute] = record['value']
+        return result
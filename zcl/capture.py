@@ -0,0 +1,120 @@
+# Capture files of raw frames, for audits and offline analysis.
+#
+# A capture is a file header followed by length-prefixed records:
+#
+#   header:  magic 'ZCLCAP', version (uint8)
+#   record:  payload length (uint16), timestamp (float64, seconds),
+#            source address (uint64), endpoint (uint8), profile (uint16),
+#            cluster (uint16), payload
+#
+# All fields are little-endian. The source address is whatever the
+# coordinator reports (a 16-bit network address or a 64-bit IEEE
+# address). Frames on the ZDO endpoint are ZDO frames, everything else
+# is ZCL.
+#
+# read_capture reads in fixed-size chunks, so memory use is bounded by
+# the chunk size, not the capture size.
+
+import collections
+import struct
+
+from . import spec
+
+
+MAGIC = b'ZCLCAP'
+VERSION = 1
+
+_FILE_HEADER = struct.Struct('<6sB')
+_RECORD_HEADER = struct.Struct('<HdQBHH')
+
+CaptureRecord = collections.namedtuple('CaptureRecord', ('timestamp', 'source', 'endpoint', 'profile', 'cluster', 'payload',))
+
+
+class CaptureWriter:
+    def __init__(self, f):
+        self._f = f
+        f.write(_FILE_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, timestamp, source, endpoint, profile, cluster, payload):
+        self._f.write(_RECORD_HEADER.pack(len(payload), timestamp, source, endpoint, profile, cluster))
+        self._f.write(payload)
+
+    def write_record(self, record):
+        self.write(*record)
+
+
+def _read_file_header(f):
+    header = f.read(_FILE_HEADER.size)
+    if len(header) < _FILE_HEADER.size:
+        raise ValueError('Not a capture file')
+    magic, version = _FILE_HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError('Not a capture file')
+    if version != VERSION:
+        raise ValueError('Unsupported capture version {}'.format(version))
+
+
+def read_capture(f, chunk_size=65536):
+    """Yield a CaptureRecord for each record in the capture file f.
+
+    The payload of each record is a memoryview into the chunk it was read
+    from. It stays valid for as long as it's referenced.
+    """
+    _read_file_header(f)
+
+    buf = b''
+    view = memoryview(buf)
+    i = 0
+    while True:
+        if len(buf) - i < _RECORD_HEADER.size:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                if i < len(buf):
+                    raise ValueError('Truncated capture record')
+                return
+            buf = buf[i:] + chunk
+            view = memoryview(buf)
+            i = 0
+            continue
+
+        length, timestamp, source, endpoint, profile, cluster = _RECORD_HEADER.unpack_from(buf, i)
+        end = i + _RECORD_HEADER.size + length
+        if end > len(buf):
+            chunk = f.read(max(chunk_size, end - len(buf)))
+            if not chunk:
+                raise ValueError('Truncated capture record')
+            buf = buf[i:] + chunk
+            view = memoryview(buf)
+            i = 0
+            continue
+
+        yield CaptureRecord(timestamp, source, endpoint, profile, cluster, view[end - length:end])
+        i = end
+
+
+def decode_record(record, lazy=False):
+    if record.endpoint == spec.Endpoint.ZDO:
+        if lazy:
+            return spec.decode_zdo_lazy(record.cluster, record.payload)
+        return spec.decode_zdo(record.cluster, record.payload)
+    if lazy:
+        return spec.decode_zcl_lazy(record.cluster, record.payload)
+    return spec.decode_zcl(record.cluster, record.payload)
+
+
+def decode_capture(f, chunk_size=65536, lazy=False, errors=None):
+    """Yield (record, decoded) for each record in the capture file f,
+    decoded with decode_zdo/decode_zcl (or their lazy variants).
+
+    Records that fail to decode raise, unless errors is a list, in which
+    case (record, exception) is appended to it and the record is skipped.
+    """
+    for record in read_capture(f, chunk_size):
+        try:
+            decoded = decode_record(record, lazy)
+        except (ValueError, struct.error) as e:
+            if errors is None:
+                raise
+            errors.append((record, e,))
+            continue
+        yield record, decoded
@@ -0,0 +1,163 @@
+# Coalescing of read_attributes requests.
+#
+# Reads of the same (device, endpoint, cluster) that arrive within a
+# short window are merged and sent as few read_attributes frames as
+# possible. Frames are split so that both the request and the expected
+# response fit in max_payload bytes (the response is estimated from the
+# attribute datatypes in CLUSTERS_BY_NAME). Devices that still truncate
+# a response are asked again for the attributes they left out. Each
+# caller gets back the records for just the attributes it asked for.
+
+import asyncio
+
+from . import cache
+from . import spec
+
+
+# Maximum ZCL payload in a single unfragmented APS frame.
+MAX_APS_PAYLOAD = 82
+
+# Response size estimates for attributes that aren't fixed-width or
+# aren't in the tables.
+_VARIABLE_SIZE_ESTIMATE = 32
+_UNKNOWN_SIZE_ESTIMATE = 8
+
+# attribute id, status, datatype.
+_RECORD_OVERHEAD = 4
+
+
+def _value_size(cluster_name, attribute):
+    _cluster, _rx_commands, _tx_commands, attributes = spec.CLUSTERS_BY_ID[spec.get_cluster_by_name(cluster_name)]
+    if attribute not in attributes:
+        return _UNKNOWN_SIZE_ESTIMATE
+    _name, datatype = attributes[attribute]
+    datatype = spec.DATATYPES_BY_NAME.get(datatype.split(':')[0])
+    if datatype is None:
+        return _UNKNOWN_SIZE_ESTIMATE
+    _decode, size = spec.STRUCT_TYPES[spec.DATATYPE_STRUCT_TYPES[datatype]]
+    if callable(size):
+        return _VARIABLE_SIZE_ESTIMATE
+    return size
+
+
+def split_reads(cluster_name, attributes, max_payload=MAX_APS_PAYLOAD):
+    """Split attributes (ids) into lists that each fit in one
+    read_attributes request and response of at most max_payload bytes."""
+    header = spec._ZCL_HEADER.size
+    chunks = []
+    chunk = []
+    request = response = header
+    for attribute in attributes:
+        size = _RECORD_OVERHEAD + _value_size(cluster_name, attribute)
+        if chunk and (request + 2 > max_payload or response + size > max_payload):
+            chunks.append(chunk)
+            chunk = []
+            request = response = header
+        chunk.append(attribute)
+        request += 2
+        response += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class _PendingReads:
+    __slots__ = ('attributes', 'waiters',)
+
+    def __init__(self):
+        # Attribute ids in the order first asked for (a dict as an
+        # ordered set).
+        self.attributes = {}
+        # (future, [(attribute as given, attribute id)]).
+        self.waiters = []
+
+
+class ReadCoalescer:
+    """Merges read_attributes requests made through dispatcher (see
+    zcl.dispatch) within window seconds of each other."""
+
+    def __init__(self, dispatcher, window=0.005, max_payload=MAX_APS_PAYLOAD):
+        self.dispatcher = dispatcher
+        self.window = window
+        self.max_payload = max_payload
+        self.requests = 0
+        self.frames = 0
+        self._pending = {}
+        # Running _send tasks, so they aren't garbage collected.
+        self._tasks = set()
+
+    async def read(self, device, endpoint, cluster_name, attributes):
+        """Return {attribute: record} for attributes (names or ids), where
+        record is the read_attributes_response record (with status, and
+        value on success), or None if the device didn't return one."""
+        # Resolved first, so unknown names raise here rather than in the
+        # flush that the other callers are waiting on.
+        wanted = [(attribute, cache.attribute_id(cluster_name, attribute),) for attribute in attributes]
+
+        key = (device, endpoint, cluster_name,)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _PendingReads()
+            asyncio.get_running_loop().call_later(self.window, self._flush, key)
+
+        for _attribute, attribute_id in wanted:
+            pending.attributes[attribute_id] = None
+        future = asyncio.get_running_loop().create_future()
+        pending.waiters.append((future, wanted,))
+        self.requests += 1
+        return await future
+
+    def _flush(self, key):
+        pending = self._pending.pop(key)
+        task = asyncio.ensure_future(self._send(key, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _read_chunk(self, device, endpoint, cluster_name, chunk):
+        records = {}
+        remaining = chunk
+        while remaining:
+            self.frames += 1
+            frame = await self.dispatcher.profile_request(device, endpoint, cluster_name, 'read_attributes', attributes=remaining)
+            if frame.command_name != 'read_attributes_response':
+                break
+            for record in frame['attributes']:
+                records[record['attribute']] = record
+            left = [attribute for attribute in remaining if attribute not in records]
+            if len(left) == len(remaining):
+                break
+            remaining = left
+        return records
+
+    async def _send(self, key, pending):
+        try:
+            await self._send_pending(key, pending)
+        except Exception as e:
+            # Nothing else will resolve the waiters.
+            for future, _wanted in pending.waiters:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _send_pending(self, key, pending):
+        device, endpoint, cluster_name = key
+        chunks = split_reads(cluster_name, pending.attributes, self.max_payload)
+        results = await asyncio.gather(*(self._read_chunk(device, endpoint, cluster_name, chunk) for chunk in chunks), return_exceptions=True)
+
+        records = {}
+        errors = {}
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                for attribute in chunk:
+                    errors[attribute] = result
+            else:
+                records.update(result)
+
+        for future, wanted in pending.waiters:
+            if future.done():
+                continue
+            for _attribute, attribute_id in wanted:
+                if attribute_id in errors:
+                    future.set_exception(errors[attribute_id])
+                    break
+            else:
+                future.set_result({attribute: records.get(attribute_id) for attribute, attribute_id in wanted})
@@ -0,0 +1,409 @@
+# Generates specialised decode/encode functions for arg specs, in the
+# spirit of dataclasses: the compiled plans from zcl.spec are turned into
+# straight-line Python source and exec'd, so there is no per-field
+# interpretation (step dispatch, n_/b_/s_ bookkeeping, name checks) left
+# at runtime. The generated functions have the same signatures and
+# results as the plan-driven ones.
+#
+# Enable with zcl.spec.use_codegen().
+
+import struct
+
+from . import spec
+
+
+# Record decoders that are just _decode_helper over fixed args. These get
+# called directly rather than through the wrapper.
+_RECORD_DECODER_ARGS = {
+    spec._decode_simple_descriptor: spec._SIMPLE_DESCRIPTOR_ARGS,
+    spec._decode_read_attr_status: spec._READ_ATTR_STATUS_ARGS,
+    spec._decode_write_attr: spec._WRITE_ATTR_ARGS,
+    spec._decode_reported_attribute: spec._REPORTED_ATTRIBUTE_ARGS,
+}
+
+# Decoders that don't look at the obj argument.
+_IGNORES_OBJ = {
+    spec._decode_status,
+    spec._decode_string,
+    spec._decode_attr_reporting_status,
+    spec._decode_write_attr_status,
+}
+
+
+def _hex64(value):
+    if isinstance(value, str):
+        return int(value, 16)
+    return value
+
+
+class _Source:
+    def __init__(self):
+        self.lines = []
+        self.namespace = {
+            'struct': struct,
+            'ValueError': ValueError,
+            '_DATATYPE_DECODERS': spec._DATATYPE_DECODERS,
+            '_write_into': spec._write_into,
+            '_hex64': _hex64,
+        }
+
+    def emit(self, line, indent=1):
+        self.lines.append('    ' * indent + line)
+
+    def bind(self, value):
+        name = '_c{}'.format(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def build(self, header, filename):
+        source = '\n'.join([header] + self.lines) + '\n'
+        exec(compile(source, filename, 'exec'), self.namespace)
+        return self.namespace['_generated']
+
+
+def _record_call(source, decode, compact):
+    # Returns the name of a record decoder, and whether it takes obj.
+    if decode in _RECORD_DECODER_ARGS:
+        args = _RECORD_DECODER_ARGS[decode]
+        return source.bind(_compact_record_decoder(args) if compact else spec._get_decoder(args)), False
+    if compact and decode in _COMPACT_CUSTOM_DECODERS:
+        return source.bind(_COMPACT_CUSTOM_DECODERS[decode]), True
+    return source.bind(decode), True
+
+
+def generate_decoder(args):
+    return _generate_decoder(args)
+
+
+def _generate_decoder(args, cls=None, header=()):
+    # With cls, the generated function takes the header values as extra
+    # arguments and returns cls(*header, *fields) instead of a dict, and
+    # records are decoded into their compact classes too.
+    plan = spec._get_decode_plan(args)
+    source = _Source()
+    compact = cls is not None
+
+    # (name, local) for each field stored so far, in order.
+    fields = []
+    n = '1'
+    b = '0'
+    var = 0
+
+    def kwargs():
+        return '{' + ', '.join('{!r}: {}'.format(name, local) for name, local in fields) + '}'
+
+    def result():
+        if compact:
+            return '{}({})'.format(source.bind(cls), ', '.join(list(header) + [local for _name, local in fields]))
+        return kwargs()
+
+    for step in plan:
+        kind = step[0]
+
+        if kind == spec._STEP_STRUCT:
+            _kind, st, stores, n_pos, b_pos = step
+            count = len(st.unpack(bytes(st.size)))
+            locals_ = ['_v{}'.format(var + pos) for pos in range(count)]
+            var += len(locals_)
+            source.emit('{}, = {}(data, i)'.format(', '.join(locals_), source.bind(st.unpack_from)))
+            source.emit('i += {}'.format(st.size))
+            for pos, name in stores:
+                fields.append((name, locals_[pos],))
+            if n_pos is not None:
+                n = '1' if n_pos < 0 else locals_[n_pos]
+            if b_pos is not None:
+                b = '0' if b_pos < 0 else locals_[b_pos]
+            continue
+
+        _kind, name, role, decode, check = step
+        v = '_v{}'.format(var)
+        var += 1
+
+        if kind == spec._STEP_VALUE:
+            if decode is spec._decode_datatype and 'datatype' in dict(fields):
+                # Inline the datatype lookup using the datatype field.
+                datatype = dict(fields)['datatype']
+                source.emit('if {} == 0:'.format(datatype))
+                source.emit('{} = None'.format(v), 2)
+                source.emit('else:')
+                source.emit('_d = _DATATYPE_DECODERS.get({})'.format(datatype), 2)
+                source.emit('if _d is None:', 2)
+                source.emit("raise ValueError('Unknown struct type')", 3)
+                source.emit('{}, i = _d(data, i, None)'.format(v), 2)
+            else:
+                call, with_obj = _record_call(source, decode, compact)
+                obj = ', ' + ('None' if decode in _IGNORES_OBJ else kwargs()) if with_obj else ''
+                source.emit('{}, i = {}(data, i{})'.format(v, call, obj))
+        elif kind == spec._STEP_REPEAT_STRUCT:
+            fmt, nbytes = decode
+            source.emit("{} = list(struct.unpack_from('<{{}}{}'.format({}), data, i))".format(v, fmt, n))
+            source.emit('i += {} * {}'.format(n, nbytes))
+        else:
+            call, with_obj = _record_call(source, decode, compact)
+            obj = ', ' + ('None' if decode in _IGNORES_OBJ else kwargs()) if with_obj else ''
+            source.emit('{} = []'.format(v))
+            if kind == spec._STEP_REPEAT:
+                # Repeat n times
+                source.emit('for _i in range({}):'.format(n))
+            else:
+                # b bytes of records, or until end of frame
+                source.emit('_end = {}'.format('i + ' + b if kind == spec._STEP_BYTES else 'len(data)'))
+                source.emit('while i < _end:')
+            source.emit('_x, i = {}(data, i{})'.format(call, obj), 2)
+            source.emit('{}.append(_x)'.format(v), 2)
+
+        if role == spec._ROLE_COUNT:
+            n = v
+        elif role == spec._ROLE_BYTES:
+            b = v
+        else:
+            fields.append((name, v,))
+            n = '1'
+            b = '0'
+
+        if check:
+            source.emit("if {} != 'SUCCESS':".format(v))
+            source.emit('return {}, i'.format(result()), 2)
+
+    source.emit('return {}, i'.format(result()))
+
+    return source.build('def _generated({}):'.format(', '.join(['data', 'i'] + list(header))), '<zcl decoder {}>'.format(args))
+
+
+def _field_expr(source, name, length, hex64):
+    if length is True:
+        return 'len(kwargs[{!r}])'.format(name)
+    elif length:
+        return '{}(kwargs[{!r}])'.format(source.bind(length), name)
+    elif hex64:
+        return '_hex64(kwargs[{!r}])'.format(name)
+    return 'kwargs[{!r}]'.format(name)
+
+
+def _generate_encoder(args, plan, into):
+    source = _Source()
+
+    for step in plan:
+        kind = step[0]
+
+        if kind == spec._STEP_STRUCT:
+            _kind, st, fields = step
+            values = ', '.join(_field_expr(source, *field) for field in fields)
+            if into:
+                source.emit('{}(buffer, offset, {})'.format(source.bind(st.pack_into), values))
+                source.emit('offset += {}'.format(st.size))
+            else:
+                source.emit('parts.append({}({}))'.format(source.bind(st.pack), values))
+        elif kind == spec._STEP_REPEAT_STRUCT:
+            _kind, name, fmt, hex64 = step
+            if hex64:
+                source.emit('_values = [_hex64(value) for value in kwargs[{!r}]]'.format(name))
+            else:
+                source.emit('_values = kwargs[{!r}]'.format(name))
+            source.emit("_fmt = '<{{}}{}'.format(len(_values))".format(fmt))
+            if into:
+                source.emit('struct.pack_into(_fmt, buffer, offset, *_values)')
+                source.emit('offset += struct.calcsize(_fmt)')
+            else:
+                source.emit('parts.append(struct.pack(_fmt, *_values))')
+        elif kind == spec._STEP_REPEAT:
+            _kind, name, encode = step
+            source.emit('for _value in kwargs[{!r}]:'.format(name))
+            if into:
+                source.emit('offset = _write_into(buffer, offset, {}(_value))'.format(source.bind(encode)), 2)
+            else:
+                source.emit('parts.append({}(_value))'.format(source.bind(encode)), 2)
+        else:
+            _kind, name, encode, length = step
+            value = _field_expr(source, name, length, False)
+            if into:
+                source.emit('offset = _write_into(buffer, offset, {}({}))'.format(source.bind(encode), value))
+            else:
+                source.emit('parts.append({}({}))'.format(source.bind(encode), value))
+
+    if into:
+        source.emit('return offset')
+        return source.build('def _generated(kwargs, buffer, offset):', '<zcl encoder {}>'.format(args))
+    source.emit("return b''.join(parts)")
+    return source.build('def _generated(kwargs, parts):', '<zcl encoder {}>'.format(args))
+
+
+def generate_encoder(args):
+    plan = spec._get_encode_plan(args)
+    return _generate_encoder(args, plan, False), _generate_encoder(args, plan, True)
+
+
+# Compact results: per-command and per-record classes with __slots__,
+# generated from the arg specs, instead of a dict per frame and per
+# record.
+
+_UNSET = object()
+
+
+def _field_names(args):
+    names = []
+    for step in spec._get_decode_plan(args):
+        if step[0] == spec._STEP_STRUCT:
+            names.extend(name for _pos, name in step[2])
+        elif step[2] == spec._ROLE_VALUE:
+            names.append(step[1])
+    return tuple(dict.fromkeys(names))
+
+
+def _as_dict_value(value):
+    if isinstance(value, CompactRecord):
+        return value.as_dict()
+    if isinstance(value, list):
+        return [_as_dict_value(x) for x in value]
+    return value
+
+
+class CompactRecord:
+    __slots__ = ()
+    _header = ()
+    _fields = ()
+
+    def __getattr__(self, name):
+        # Fields after a failed status (e.g. the value of an unsupported
+        # attribute) are left unset, as they're missing from the dict.
+        if name in self._fields:
+            return None
+        raise AttributeError(name)
+
+    def _items(self):
+        for name in self._fields:
+            try:
+                yield name, object.__getattribute__(self, name)
+            except AttributeError:
+                break
+
+    def as_dict(self):
+        return {name: _as_dict_value(value) for name, value in self._items()}
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._header) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(name, value) for name, value in self._items()))
+
+
+class CompactZclFrame(CompactRecord):
+    __slots__ = ()
+    _header = ('seq', 'default_response',)
+    cluster_name = None
+    command_type = None
+    command_name = None
+
+    def as_tuple(self):
+        return self.cluster_name, self.seq, self.command_type, self.command_name, self.default_response, self.as_dict()
+
+
+class CompactZdoFrame(CompactRecord):
+    __slots__ = ()
+    _header = ('seq',)
+    cluster_name = None
+
+    def as_tuple(self):
+        return self.cluster_name, self.seq, self.as_dict()
+
+
+def _class_name(*names):
+    return ''.join(part.capitalize() for name in names for part in name.split('_'))
+
+
+def _compact_class(name, base, fields, attrs=None):
+    header = getattr(base, '_header', ())
+    source = _Source()
+    source.namespace['_UNSET'] = _UNSET
+    for field in header:
+        source.emit('self.{0} = {0}'.format(field))
+    for field in fields:
+        source.emit('if {} is _UNSET:'.format(field))
+        source.emit('return', 2)
+        source.emit('self.{0} = {0}'.format(field))
+    params = ['self'] + list(header) + ['{}=_UNSET'.format(field) for field in fields]
+    if not fields and not header:
+        source.emit('pass')
+    init = source.build('def _generated({}):'.format(', '.join(params)), '<zcl class {}>'.format(name))
+
+    namespace = dict(attrs or {})
+    namespace.update({
+        '__slots__': tuple(header) + fields,
+        '_fields': fields,
+        '__init__': init,
+    })
+    return type(name, (base,), namespace)
+
+
+# Record classes, by record decoder.
+_RECORD_NAMES = {
+    spec._decode_simple_descriptor: 'simple_descriptor',
+    spec._decode_read_attr_status: 'read_attr_status',
+    spec._decode_write_attr: 'write_attr',
+    spec._decode_reported_attribute: 'reported_attribute',
+}
+
+_COMPACT_RECORD_DECODERS = {}
+
+
+def _compact_record_decoder(args):
+    decoder = _COMPACT_RECORD_DECODERS.get(args)
+    if decoder is None:
+        name = next((_RECORD_NAMES[decode] for decode, record_args in _RECORD_DECODER_ARGS.items() if record_args == args), 'record')
+        cls = _compact_class(_class_name(name), CompactRecord, _field_names(args))
+        decoder = _COMPACT_RECORD_DECODERS[args] = _generate_decoder(args, cls)
+    return decoder
+
+
+_AttrReportingStatus = _compact_class('AttrReportingStatus', CompactRecord, _field_names(spec._ATTR_REPORTING_STATUS_ARGS))
+_WriteAttrStatus = _compact_class('WriteAttrStatus', CompactRecord, _field_names(spec._WRITE_ATTR_STATUS_ARGS))
+_AttrReportingConfig = _compact_class('AttrReportingConfig', CompactRecord, _field_names(spec._ATTR_REPORTING_CONFIG_ARGS + spec._ATTR_REPORTING_SEND_ARGS) + ('delta',))
+_AttrReportingTimeout = _compact_class('AttrReportingTimeout', CompactRecord, _field_names(spec._ATTR_REPORTING_CONFIG_ARGS + spec._ATTR_REPORTING_RECEIVE_ARGS))
+
+
+def _compact_attr_reporting_status(data, i, obj):
+    kwargs, i = spec._decode_attr_reporting_status(data, i, obj)
+    return _AttrReportingStatus(**kwargs), i
+
+
+def _compact_write_attr_status(data, i, obj):
+    kwargs, i = spec._decode_write_attr_status(data, i, obj)
+    return _WriteAttrStatus(**kwargs), i
+
+
+def _compact_attr_reporting_config(data, i, obj):
+    # The fields after the attribute depend on the direction.
+    kwargs, i = spec._decode_attr_reporting_config(data, i, obj)
+    return (_AttrReportingTimeout if kwargs['direction'] else _AttrReportingConfig)(**kwargs), i
+
+
+# Records that aren't just _decode_helper over fixed args (see
+# _decode_attr_reporting_status).
+_COMPACT_CUSTOM_DECODERS = {
+    spec._decode_attr_reporting_status: _compact_attr_reporting_status,
+    spec._decode_write_attr_status: _compact_write_attr_status,
+    spec._decode_attr_reporting_config: _compact_attr_reporting_config,
+}
+
+
+def compact_zcl_decoder(cluster_name, command_type, command_name, args):
+    """Returns a decoder of (data, i, seq, default_response) that returns
+    (frame, i), where frame is an instance of a generated
+    CompactZclFrame subclass for this command."""
+    cls = _compact_class(_class_name(cluster_name, command_name), CompactZclFrame, _field_names(args), {
+        'cluster_name': cluster_name,
+        'command_type': command_type,
+        'command_name': command_name,
+    })
+    return _generate_decoder(args, cls, CompactZclFrame._header)
+
+
+def compact_zdo_decoder(cluster_name, args):
+    """Returns a decoder of (data, i, seq) that returns (frame, i), where
+    frame is an instance of a generated CompactZdoFrame subclass."""
+    cls = _compact_class(_class_name(cluster_name), CompactZdoFrame, _field_names(args), {
+        'cluster_name': cluster_name,
+    })
+    return _generate_decoder(args, cls, CompactZdoFrame._header)
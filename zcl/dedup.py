@@ -0,0 +1,96 @@
+# Suppression of duplicate frames.
+#
+# MAC and APS retries mean the same frame can arrive more than once.
+# DuplicateFilter remembers frames by (source, cluster, seq, hash of the
+# frame), taking the sequence number from the header alone
+# (peek_zcl_header/peek_zdo_header), so duplicates are dropped before
+# any payload decoding. A frame counts as a duplicate if the same one was
+# seen within window seconds. At most max_entries frames are remembered;
+# entries are kept in arrival order, so expiry and eviction just pop the
+# oldest, and every operation is constant time (amortised).
+
+import collections
+import struct
+import time
+
+from . import spec
+
+
+class DuplicateFilter:
+    def __init__(self, window=2.0, max_entries=4096, clock=time.monotonic):
+        self.window = window
+        self.max_entries = max_entries
+        self.clock = clock
+        # Duplicates dropped, and frames let through.
+        self.hits = 0
+        self.misses = 0
+        # Entries dropped because the filter was full (rather than
+        # expired), i.e. max_entries is too small for the window.
+        self.evictions = 0
+        # key -> time first seen.
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def is_duplicate(self, source, endpoint, cluster, data):
+        """Return True if this frame was already seen within the window,
+        otherwise remember it and return False. Frames too short to have a
+        header are never duplicates (they're left to the decoder)."""
+        try:
+            if endpoint == spec.Endpoint.ZDO:
+                seq = spec.peek_zdo_header(cluster, data).seq
+            else:
+                seq = spec.peek_zcl_header(data).seq
+        except struct.error:
+            return False
+        key = (source, cluster, seq, hash(data if isinstance(data, bytes) else bytes(data)),)
+
+        now = self.clock()
+        entries = self._entries
+        seen = entries.get(key)
+        if seen is not None and now - seen <= self.window:
+            self.hits += 1
+            return True
+        self.misses += 1
+
+        if seen is not None:
+            # Same frame again after the window: a new frame that happens
+            # to have the same seq, so it goes to the back.
+            entries.move_to_end(key)
+        entries[key] = now
+        # Expire from the front, where the oldest entries are.
+        while entries:
+            oldest = next(iter(entries.values()))
+            if now - oldest <= self.window:
+                break
+            entries.popitem(last=False)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return False
+
+    def wrap(self, receiver):
+        """Return a receiver(source, endpoint, profile, cluster, data) (see
+        dispatch.Transport) that passes frames on to receiver unless they
+        are duplicates, e.g.
+
+            transport.set_receiver(dedup.wrap(dispatcher.frame_received))
+        """
+        is_duplicate = self.is_duplicate
+
+        def filtered(source, endpoint, profile, cluster, data):
+            if not is_duplicate(source, endpoint, cluster, data):
+                receiver(source, endpoint, profile, cluster, data)
+        return filtered
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+        }
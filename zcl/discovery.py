@@ -0,0 +1,160 @@
+# Network discovery: interviews devices for their endpoints and identity.
+#
+# Interviewing a device means active_ep, then simple_desc for each
+# endpoint, then read_attributes of manufacturer_name and model_id from
+# the basic cluster on the first endpoint that has it. Discovery runs
+# interviews concurrently through a Dispatcher (see zcl.dispatch), at
+# most concurrency at a time, and retries requests that time out with
+# exponential backoff.
+#
+# Results are plain dicts (so they can be stored as JSON), kept in
+# devices by address. With a cache_path they're loaded from and saved to
+# disk, and devices already there aren't interviewed again unless they
+# rejoin (device_annce) or are invalidated.
+
+import asyncio
+import json
+import os
+import struct
+import time
+
+from . import cache
+from . import spec
+
+
+# Attributes read from the basic cluster.
+BASIC_ATTRIBUTES = ('manufacturer_name', 'model_id',)
+
+_BASIC_CLUSTER = spec.get_cluster_by_name('basic')
+_DEVICE_ANNCE = spec.ZDO_BY_NAME['device_annce'][0]
+
+_CACHE_VERSION = 1
+
+
+def _check_status(frame):
+    if frame['status'] != 0:
+        raise ValueError('{} failed with status {}'.format(frame.cluster_name, frame['status']))
+
+
+class Discovery:
+    """Interviews devices through dispatcher. Devices that couldn't be
+    interviewed (after retries) are in failed, with the exception."""
+
+    def __init__(self, dispatcher, cache_path=None, concurrency=8, retries=3, backoff=0.5, timeout=None, clock=time.time):
+        self.dispatcher = dispatcher
+        self.cache_path = cache_path
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.clock = clock
+        # address -> interview result.
+        self.devices = {}
+        # address -> exception.
+        self.failed = {}
+        # Requests sent, including retries.
+        self.requests = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        if cache_path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        if data.get('version') != _CACHE_VERSION:
+            return
+        self.devices = {int(address): device for address, device in data['devices'].items()}
+
+    def save(self):
+        tmp = self.cache_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': _CACHE_VERSION, 'devices': {str(address): device for address, device in self.devices.items()}}, f, indent=1)
+        os.replace(tmp, self.cache_path)
+
+    def invalidate(self, device):
+        self.devices.pop(device, None)
+
+    def attach(self):
+        """Forget devices when they announce themselves (e.g. after a
+        firmware update or a rejoin), so the next crawl interviews them
+        again."""
+        self.dispatcher.subscribe(self._device_annce, _DEVICE_ANNCE)
+
+    def _device_annce(self, source, endpoint, frame):
+        self.invalidate(frame['addr16'])
+
+    async def _request(self, request, *args, **kwargs):
+        # request is a Dispatcher method.
+        for attempt in range(self.retries + 1):
+            self.requests += 1
+            try:
+                return await request(*args, timeout=self.timeout, **kwargs)
+            except asyncio.TimeoutError:
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def interview(self, device):
+        """Interview device (an address) and return the result:
+
+            {'endpoints': [{'endpoint', 'profile', 'device_identifier',
+                            'device_version', 'in_clusters',
+                            'out_clusters'}, ...],
+             'manufacturer_name': str or None, 'model_id': str or None,
+             'timestamp': when it was interviewed}
+        """
+        frame = await self._request(self.dispatcher.zdo_request, device, 'active_ep', addr16=device)
+        _check_status(frame)
+
+        endpoints = []
+        for endpoint in frame['active_eps']:
+            frame = await self._request(self.dispatcher.zdo_request, device, 'simple_desc', addr16=device, endpoint=endpoint)
+            _check_status(frame)
+            for descriptor in frame['simple_descriptors']:
+                endpoints.append({
+                    'endpoint': descriptor['endpoint'],
+                    'profile': descriptor['profile'],
+                    'device_identifier': descriptor['device_identifier'],
+                    'device_version': descriptor['device_version'],
+                    'in_clusters': list(descriptor['in_clusters']),
+                    'out_clusters': list(descriptor['out_clusters']),
+                })
+
+        result = {'endpoints': endpoints}
+        for name in BASIC_ATTRIBUTES:
+            result[name] = None
+        for descriptor in endpoints:
+            if _BASIC_CLUSTER in descriptor['in_clusters']:
+                attributes = [cache.attribute_id('basic', name) for name in BASIC_ATTRIBUTES]
+                frame = await self._request(self.dispatcher.profile_request, device, descriptor['endpoint'], 'basic', 'read_attributes', attributes=attributes)
+                if frame.command_name == 'read_attributes_response':
+                    for record in frame['attributes']:
+                        if 'value' in record:
+                            result[cache.attribute_name(_BASIC_CLUSTER, record['attribute'])] = record['value']
+                break
+        result['timestamp'] = self.clock()
+        return result
+
+    async def _crawl_one(self, device):
+        async with self._semaphore:
+            try:
+                self.devices[device] = await self.interview(device)
+                self.failed.pop(device, None)
+            except (asyncio.TimeoutError, ValueError, struct.error) as e:
+                # Malformed responses (decoded lazily, on access) fail
+                # just this device.
+                self.failed[device] = e
+
+    async def crawl(self, devices, refresh=False):
+        """Interview each of devices (addresses) that isn't already known
+        (or all of them if refresh), and return {address: result} for the
+        ones that succeeded. The cache is saved afterwards, even if
+        cancelled."""
+        try:
+            await asyncio.gather(*(self._crawl_one(device) for device in devices if refresh or device not in self.devices))
+        finally:
+            if self.cache_path is not None:
+                self.save()
+        return {device: self.devices[device] for device in devices if device in self.devices}
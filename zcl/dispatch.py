@@ -0,0 +1,236 @@
+# asyncio request/response dispatch on top of the codec.
+#
+# A Dispatcher sends requests through a Transport and matches incoming
+# frames back to them by (device, kind, seq), where kind is 'zdo' or
+# 'zcl' (they have separate sequence number spaces). Incoming frames are
+# routed on their header alone (peek_zdo_header/peek_zcl_header), and the
+# payload is only decoded (lazily) once it's known where it's going.
+# Frames that don't answer a pending request go to subscribers.
+#
+# A Transport delivers frames to the dispatcher's frame_received. For
+# tests and simulation, LoopbackNetwork connects any number of
+# LoopbackTransports in memory.
+
+import abc
+import asyncio
+import logging
+import struct
+
+from . import spec
+
+
+_log = logging.getLogger(__name__)
+
+
+ZDO = 'zdo'
+ZCL = 'zcl'
+
+# Profile commands that answer a request (as opposed to report_attributes
+# etc, which a device sends with its own sequence numbers).
+_RESPONSE_PROFILE_COMMANDS = frozenset(
+    spec.PROFILE_COMMANDS_BY_NAME[name][0] for name in ('read_attributes_response', 'write_attributes_response', 'configure_reporting_response', 'default_response',)
+)
+
+
+class Transport(abc.ABC):
+    """Base class for transports. Subclasses implement send, and call
+    self.receiver(source, endpoint, profile, cluster, data) for each
+    incoming frame."""
+
+    def __init__(self):
+        self.receiver = None
+
+    def set_receiver(self, receiver):
+        self.receiver = receiver
+
+    @abc.abstractmethod
+    async def send(self, device, endpoint, profile, cluster, data):
+        pass
+
+
+class LoopbackNetwork:
+    """An in-memory network of LoopbackTransports, addressed by device."""
+
+    def __init__(self):
+        self._transports = {}
+
+    def transport(self, address):
+        transport = LoopbackTransport(self, address)
+        self._transports[address] = transport
+        return transport
+
+    def deliver(self, source, device, endpoint, profile, cluster, data):
+        transport = self._transports.get(device)
+        if transport is None or transport.receiver is None:
+            # Lost, like a frame to a device that isn't there.
+            return
+        asyncio.get_running_loop().call_soon(transport.receiver, source, endpoint, profile, cluster, data)
+
+
+class LoopbackTransport(Transport):
+    def __init__(self, network, address):
+        super().__init__()
+        self.network = network
+        self.address = address
+
+    async def send(self, device, endpoint, profile, cluster, data):
+        self.network.deliver(self.address, device, endpoint, profile, cluster, bytes(data))
+
+
+class Dispatcher:
+    """Sends requests through transport and resolves them with the
+    matching response, a ZdoFrame or ZclFrame.
+
+    Requests that get no response within timeout seconds raise
+    asyncio.TimeoutError. Frames that aren't responses to a pending
+    request are passed to subscribers as callback(source, endpoint,
+    frame), as are responses for subscribers that asked for them.
+    Frames that can't be decoded are dropped and counted in dropped. A
+    subscriber that raises is logged (and counted in subscriber_errors)
+    without affecting the others.
+    """
+
+    def __init__(self, transport, timeout=5.0, profile=spec.Profile.HOME_AUTOMATION):
+        self.transport = transport
+        self.timeout = timeout
+        self.profile = profile
+        self.dropped = 0
+        self.subscriber_errors = 0
+        # (device, kind) -> next sequence number.
+        self._seqs = {}
+        # (device, kind, seq) -> (future, response cluster, timeout handle).
+        self._pending = {}
+        # cluster (or None for all) -> [callback].
+        self._subscribers = {}
+        # The same, for callbacks that also want responses.
+        self._response_subscribers = {}
+        transport.set_receiver(self.frame_received)
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def _allocate_seq(self, device, kind):
+        key = (device, kind,)
+        seq = self._seqs.get(key, 0)
+        for _i in range(256):
+            if (device, kind, seq,) not in self._pending:
+                self._seqs[key] = (seq + 1) & 0xff
+                return seq
+            seq = (seq + 1) & 0xff
+        raise ValueError('No free sequence numbers for device {}'.format(device))
+
+    def _expire(self, key):
+        future, _cluster, _handle = self._pending.pop(key)
+        if not future.done():
+            future.set_exception(asyncio.TimeoutError())
+
+    async def _request(self, device, kind, cluster, response_cluster, encode, endpoint, profile, timeout):
+        seq = self._allocate_seq(device, kind)
+        _cluster, data = encode(seq)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (device, kind, seq,)
+        handle = loop.call_later(self.timeout if timeout is None else timeout, self._expire, key)
+        self._pending[key] = (future, response_cluster, handle,)
+        try:
+            await self.transport.send(device, endpoint, profile, cluster, data)
+            return await future
+        finally:
+            entry = self._pending.get(key)
+            if entry is not None and entry[0] is future:
+                del self._pending[key]
+                handle.cancel()
+
+    async def zdo_request(self, device, cluster_name, timeout=None, **kwargs):
+        """Send the ZDO request cluster_name and return the ZdoFrame of
+        the response."""
+        if cluster_name not in spec.ZDO_BY_NAME:
+            raise ValueError('Unknown ZDO "{}"'.format(cluster_name))
+        cluster, _args = spec.ZDO_BY_NAME[cluster_name]
+        encode = lambda seq: spec.encode_zdo(cluster_name, seq, **kwargs)
+        return await self._request(device, ZDO, cluster, cluster | 0x8000, encode, spec.Endpoint.ZDO, spec.Profile.ZIGBEE, timeout)
+
+    async def cluster_request(self, device, endpoint, cluster_name, command_name, timeout=None, **kwargs):
+        """Send a cluster command and return the ZclFrame of the response
+        (a cluster-specific response or default_response)."""
+        cluster = spec.get_cluster_by_name(cluster_name)
+        encode = lambda seq: spec.encode_cluster_command(cluster_name, command_name, seq, **kwargs)
+        return await self._request(device, ZCL, cluster, cluster, encode, endpoint, self.profile, timeout)
+
+    async def profile_request(self, device, endpoint, cluster_name, command_name, timeout=None, **kwargs):
+        """Send a profile command (e.g. read_attributes) and return the
+        ZclFrame of the response."""
+        cluster = spec.get_cluster_by_name(cluster_name)
+        encode = lambda seq: spec.encode_profile_command(cluster_name, command_name, seq, **kwargs)
+        return await self._request(device, ZCL, cluster, cluster, encode, endpoint, self.profile, timeout)
+
+    async def send(self, device, endpoint, cluster, data, profile=None):
+        """Send an already-encoded frame without waiting for a response."""
+        await self.transport.send(device, endpoint, self.profile if profile is None else profile, cluster, data)
+
+    def subscribe(self, callback, cluster=None, responses=False):
+        """Call callback(source, endpoint, frame) for each unsolicited frame
+        on cluster (or on any cluster if None). With responses, also call
+        it for responses to requests (from any caller), once the request
+        has them."""
+        self._subscribers.setdefault(cluster, []).append(callback)
+        if responses:
+            self._response_subscribers.setdefault(cluster, []).append(callback)
+
+    def unsubscribe(self, callback, cluster=None, responses=False):
+        self._subscribers[cluster].remove(callback)
+        if responses:
+            self._response_subscribers[cluster].remove(callback)
+
+    def _publish(self, subscribers, source, endpoint, cluster, frame):
+        for callbacks in (subscribers.get(cluster, ()), subscribers.get(None, ()),):
+            for callback in callbacks:
+                try:
+                    callback(source, endpoint, frame)
+                except Exception:
+                    self.subscriber_errors += 1
+                    _log.exception('Subscriber %r failed on a frame from %s', callback, source)
+
+    def _resolve(self, key, endpoint, cluster, decode, data):
+        # Returns True if the frame answered a pending request.
+        entry = self._pending.get(key)
+        if entry is None:
+            return False
+        future, response_cluster, handle = entry
+        if response_cluster != cluster:
+            return False
+        del self._pending[key]
+        handle.cancel()
+        if not future.done():
+            try:
+                frame = decode(cluster, data)
+            except (ValueError, struct.error) as e:
+                future.set_exception(e)
+                return True
+            future.set_result(frame)
+            if self._response_subscribers:
+                source, _kind, _seq = key
+                self._publish(self._response_subscribers, source, endpoint, cluster, frame)
+        return True
+
+    def frame_received(self, source, endpoint, profile, cluster, data):
+        try:
+            if endpoint == spec.Endpoint.ZDO:
+                header = spec.peek_zdo_header(cluster, data)
+                if header.response and self._resolve((source, ZDO, header.seq,), endpoint, cluster, spec.decode_zdo_lazy, data):
+                    return
+                frame = spec.decode_zdo_lazy(cluster, data)
+            else:
+                header = spec.peek_zcl_header(data)
+                if header.command_type == spec.ZclCommandType.PROFILE:
+                    response = header.command in _RESPONSE_PROFILE_COMMANDS
+                else:
+                    response = header.direction == 1
+                if response and self._resolve((source, ZCL, header.seq,), endpoint, cluster, spec.decode_zcl_lazy, data):
+                    return
+                frame = spec.decode_zcl_lazy(cluster, data)
+        except (ValueError, struct.error):
+            self.dropped += 1
+            return
+        self._publish(self._subscribers, source, endpoint, cluster, frame)
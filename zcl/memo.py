@@ -0,0 +1,85 @@
+# Memoized decoding of repeated frames.
+#
+# Sensors often send byte-identical reports, apart from the sequence
+# number. MemoDecoder keeps decode_zcl results in a bounded LRU keyed by
+# (cluster, frame control, manufacturer code, command, payload), so a
+# repeat costs a header parse and a dict lookup. Results are shared
+# between all the frames with the same payload, so they're frozen: dicts
+# become read-only mappings (types.MappingProxyType) and lists become
+# tuples. Frames that fail to decode aren't cached.
+#
+# With zcl.metrics enabled, hits and misses are counted ('memo_hits' and
+# 'memo_misses'), and hits are recorded as the op 'decode_zcl_memo'. The
+# misses show up as 'decode_zcl', so the two can be compared per command.
+
+import collections
+import time
+import types
+
+from . import metrics
+from . import spec
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return types.MappingProxyType({name: _freeze(v) for name, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class MemoDecoder:
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _decode_zcl(self, cluster, data):
+        frame_control, manufacturer_code, seq, command, i = spec._decode_zcl_header(data)
+        key = (cluster, frame_control, manufacturer_code, command, bytes(data[i:]),)
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            cluster_name, command_type, command_name, default_response, kwargs = entry
+            return cluster_name, seq, command_type, command_name, default_response, kwargs
+
+        self.misses += 1
+        cluster_name, seq, command_type, command_name, default_response, kwargs = spec.decode_zcl(cluster, data)
+        kwargs = _freeze(kwargs)
+        entries[key] = (cluster_name, command_type, command_name, default_response, kwargs,)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        return cluster_name, seq, command_type, command_name, default_response, kwargs
+
+    def decode_zcl(self, cluster, data):
+        """As spec.decode_zcl, but the kwargs are frozen and may be shared
+        with other results."""
+        recording = metrics.current()
+        if recording is None:
+            return self._decode_zcl(cluster, data)
+        hits = self.hits
+        start = time.perf_counter()
+        result = self._decode_zcl(cluster, data)
+        elapsed = time.perf_counter() - start
+        if self.hits != hits:
+            recording.increment('memo_hits')
+            recording.record('decode_zcl_memo', result[0], result[3], len(data), elapsed)
+        else:
+            recording.increment('memo_misses')
+        return result
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+        }
@@ -0,0 +1,180 @@
+# Opt-in instrumentation of the codec.
+#
+# enable() replaces decode_zcl, decode_zdo, decode_zcl_lazy,
+# decode_zdo_lazy and the encode_* functions in zcl.spec with wrappers
+# that record into a Metrics object, and disable() puts the originals
+# back. While disabled nothing is wrapped, so there's no cost at all.
+# Callers must look the functions up on the module (spec.decode_zcl(...))
+# for the wrappers to take effect.
+#
+# Not everything goes through those functions. These aren't recorded:
+#   - decode_zcl_lazy/decode_zdo_lazy payloads: only the header parse is
+#     timed, as the payload is decoded later, on access (the Dispatcher
+#     and capture.decode_record(lazy=True) decode this way).
+#   - decode_zcl_compact, decode_zdo_compact and iter_zcl_records.
+#   - try_decode_zcl/try_decode_zdo, apart from their fallback counts
+#     (spec.DECODE_FALLBACKS, included in snapshot()).
+#   - batch.decode_zcl_batch.
+#   - FrameTemplates (cluster_command_template/profile_command_template).
+#   - parallel.decode_parallel/aggregate_parallel, which decode in other
+#     processes.
+# MemoDecoder records its hits itself, as 'decode_zcl_memo'; its misses
+# go through decode_zcl.
+#
+# Metrics records, per operation and (cluster, command), the number of
+# calls, frame bytes and total time, a latency histogram per operation,
+# and failures by exception type. snapshot() returns all of it (plus the
+# try_decode_* fallback counts from spec.DECODE_FALLBACKS) as plain dicts
+# and lists, ready for JSON or a metrics exporter.
+
+import bisect
+import collections
+import time
+
+from . import spec
+
+
+# Latency histogram bucket upper bounds, in seconds (1us to ~1s).
+DEFAULT_BUCKETS = tuple(1e-6 * 2 ** k for k in range(21))
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts',)
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        # The last count is for values above the last bound.
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def snapshot(self):
+        return {
+            'bounds': list(self.bounds),
+            'counts': list(self.counts),
+        }
+
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        # (op, cluster_name, command_name) -> [calls, bytes, seconds].
+        self.commands = {}
+        # op -> Histogram.
+        self.latency = {}
+        # (op, exception type name) -> count.
+        self.errors = collections.Counter()
+        # Named counters for other stages (e.g. fallbacks, cache hits).
+        self.counters = collections.Counter()
+
+    def record(self, op, cluster_name, command_name, nbytes, elapsed):
+        key = (op, cluster_name, command_name,)
+        entry = self.commands.get(key)
+        if entry is None:
+            entry = self.commands[key] = [0, 0, 0.0]
+        entry[0] += 1
+        entry[1] += nbytes
+        entry[2] += elapsed
+        histogram = self.latency.get(op)
+        if histogram is None:
+            histogram = self.latency[op] = Histogram(self.buckets)
+        histogram.add(elapsed)
+
+    def record_error(self, op, exception):
+        self.errors[(op, type(exception).__name__,)] += 1
+
+    def increment(self, name, n=1):
+        self.counters[name] += n
+
+    def snapshot(self):
+        return {
+            'commands': [
+                {'op': op, 'cluster': cluster_name, 'command': command_name, 'count': count, 'bytes': nbytes, 'seconds': seconds}
+                for (op, cluster_name, command_name), (count, nbytes, seconds) in self.commands.items()
+            ],
+            'latency': {op: histogram.snapshot() for op, histogram in self.latency.items()},
+            'errors': [
+                {'op': op, 'type': name, 'count': count}
+                for (op, name), count in self.errors.items()
+            ],
+            'counters': dict(self.counters),
+            'fallbacks': dict(spec.DECODE_FALLBACKS),
+        }
+
+
+_metrics = None
+_originals = {}
+
+
+def _instrument(op, fn, describe):
+    # describe(args, kwargs, result) -> (cluster_name, command_name, nbytes).
+    def wrapper(*args, **kwargs):
+        metrics = _metrics
+        if metrics is None:
+            # A wrapper someone kept hold of after disable().
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            metrics.record_error(op, e)
+            raise
+        elapsed = time.perf_counter() - start
+        cluster_name, command_name, nbytes = describe(args, kwargs, result)
+        metrics.record(op, cluster_name, command_name, nbytes, elapsed)
+        return result
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+
+def _arg(args, kwargs, pos, name):
+    return args[pos] if len(args) > pos else kwargs[name]
+
+
+# op -> describe(args, kwargs, result).
+_DESCRIBE = {
+    'decode_zcl': lambda args, kwargs, result: (result[0], result[3], len(_arg(args, kwargs, 1, 'data')),),
+    'decode_zdo': lambda args, kwargs, result: (result[0], result[0], len(_arg(args, kwargs, 1, 'data')),),
+    'decode_zcl_lazy': lambda args, kwargs, result: (result.cluster_name, result.command_name, len(_arg(args, kwargs, 1, 'data')),),
+    'decode_zdo_lazy': lambda args, kwargs, result: (result.cluster_name, result.cluster_name, len(_arg(args, kwargs, 1, 'data')),),
+    'encode_zdo': lambda args, kwargs, result: (_arg(args, kwargs, 0, 'cluster_name'), _arg(args, kwargs, 0, 'cluster_name'), len(result[1]),),
+    'encode_zdo_into': lambda args, kwargs, result: (_arg(args, kwargs, 2, 'cluster_name'), _arg(args, kwargs, 2, 'cluster_name'), result[1],),
+    'encode_cluster_command': lambda args, kwargs, result: (_arg(args, kwargs, 0, 'cluster_name'), _arg(args, kwargs, 1, 'command_name'), len(result[1]),),
+    'encode_cluster_command_into': lambda args, kwargs, result: (_arg(args, kwargs, 2, 'cluster_name'), _arg(args, kwargs, 3, 'command_name'), result[1],),
+    'encode_profile_command': lambda args, kwargs, result: (_arg(args, kwargs, 0, 'cluster_name'), _arg(args, kwargs, 1, 'command_name'), len(result[1]),),
+    'encode_profile_command_into': lambda args, kwargs, result: (_arg(args, kwargs, 2, 'cluster_name'), _arg(args, kwargs, 3, 'command_name'), result[1],),
+}
+
+
+def enable(metrics=None):
+    """Start recording into metrics (a new Metrics if None), and return
+    it."""
+    global _metrics
+    if metrics is None:
+        metrics = Metrics()
+    if _metrics is None:
+        for op, describe in _DESCRIBE.items():
+            fn = getattr(spec, op)
+            _originals[op] = fn
+            setattr(spec, op, _instrument(op, fn, describe))
+    _metrics = metrics
+    return metrics
+
+
+def disable():
+    global _metrics
+    for op, fn in _originals.items():
+        setattr(spec, op, fn)
+    _originals.clear()
+    _metrics = None
+
+
+def current():
+    """The Metrics being recorded into, or None if disabled."""
+    return _metrics
@@ -0,0 +1,241 @@
+# Decoding capture files (see zcl.capture) across several processes.
+#
+# The capture is split into shards on record boundaries (found by walking
+# the record headers only), and each worker reads and decodes its own
+# shards. decode_parallel hands back the decoded frames in capture
+# order. aggregate_parallel instead has each worker reduce its shards to
+# an Aggregate and merges those, which avoids sending every decoded frame
+# back to the parent.
+#
+# Starting a process pool costs far more than decoding a small capture,
+# so both take an executor to reuse an existing pool across calls.
+
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import mmap
+import os
+import struct
+
+from . import capture
+from . import spec
+
+
+_UINT16 = struct.Struct('<H')
+
+
+def shard_capture(path, shards):
+    """Split the capture at path into at most shards byte ranges of about
+    the same size, on record boundaries. Returns a list of (start, end,
+    first record index)."""
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version = capture._FILE_HEADER.unpack_from(data, 0)
+            if magic != capture.MAGIC:
+                raise ValueError('Not a capture file')
+            if version != capture.VERSION:
+                raise ValueError('Unsupported capture version {}'.format(version))
+
+            i = start = capture._FILE_HEADER.size
+            end = len(data)
+            target = max(1, (end - start) // max(1, shards))
+            result = []
+            index = first = 0
+            while i < end:
+                if i + capture._RECORD_HEADER.size > end:
+                    raise ValueError('Truncated capture record')
+                length, = _UINT16.unpack_from(data, i)
+                i += capture._RECORD_HEADER.size + length
+                if i > end:
+                    raise ValueError('Truncated capture record')
+                index += 1
+                if i - start >= target:
+                    result.append((start, i, first,))
+                    start, first = i, index
+            if start < end:
+                result.append((start, end, first,))
+            return result
+
+
+def _read_shard(path, start, end):
+    # Workers read their whole shard in one go; payloads are views into it.
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    view = memoryview(data)
+    i = 0
+    while i < len(data):
+        length, timestamp, source, endpoint, profile, cluster = capture._RECORD_HEADER.unpack_from(data, i)
+        i += capture._RECORD_HEADER.size + length
+        yield capture.CaptureRecord(timestamp, source, endpoint, profile, cluster, view[i - length:i])
+
+
+def _decode_shard(path, shard):
+    # Returns ([decoded or None], [(index, exception)]) for the shard.
+    start, end, first = shard
+    results = []
+    errors = []
+    for index, record in enumerate(_read_shard(path, start, end), first):
+        try:
+            results.append(capture.decode_record(record))
+        except (ValueError, struct.error) as e:
+            results.append(None)
+            errors.append((index, e,))
+    return results, errors
+
+
+def _aggregate_shard(path, shard):
+    start, end, _first = shard
+    aggregate = Aggregate()
+    for record in _read_shard(path, start, end):
+        try:
+            decoded = capture.decode_record(record)
+        except (ValueError, struct.error) as e:
+            aggregate.add_error(e)
+        else:
+            aggregate.add(record, decoded)
+    return aggregate
+
+
+class AttributeStats:
+    """Values seen for one attribute. min and max only cover numeric
+    values; last is the value with the latest timestamp."""
+
+    __slots__ = ('count', 'min', 'max', 'last', 'last_timestamp',)
+
+    def __init__(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.last_timestamp = float('-inf')
+
+    def add(self, timestamp, value):
+        self.count += 1
+        if isinstance(value, (int, float,)):
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+        if timestamp >= self.last_timestamp:
+            self.last = value
+            self.last_timestamp = timestamp
+
+    def merge(self, other):
+        self.count += other.count
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        if other.last_timestamp >= self.last_timestamp:
+            self.last = other.last
+            self.last_timestamp = other.last_timestamp
+
+    def __repr__(self):
+        return 'AttributeStats(count={}, min={!r}, max={!r}, last={!r})'.format(self.count, self.min, self.max, self.last)
+
+
+class Aggregate:
+    """Summary of a capture.
+
+    commands counts frames by (cluster_name, command_name) ('zdo' and the
+    ZDO cluster name for ZDO frames). attributes maps (cluster_name,
+    attribute id) to AttributeStats, from report_attributes and successful
+    read_attributes_response records. errors counts failed frames by
+    exception type name.
+    """
+
+    __slots__ = ('frames', 'commands', 'attributes', 'errors',)
+
+    def __init__(self):
+        self.frames = 0
+        self.commands = collections.Counter()
+        self.attributes = {}
+        self.errors = collections.Counter()
+
+    def add(self, record, decoded):
+        self.frames += 1
+        if len(decoded) == 3:
+            cluster_name, _seq, _kwargs = decoded
+            self.commands[('zdo', cluster_name,)] += 1
+            return
+        cluster_name, _seq, command_type, command_name, _default_response, kwargs = decoded
+        self.commands[(cluster_name, command_name,)] += 1
+        if command_type != spec.ZclCommandType.PROFILE or command_name not in ('report_attributes', 'read_attributes_response',):
+            return
+        for attribute in kwargs['attributes']:
+            if 'value' not in attribute:
+                continue
+            key = (cluster_name, attribute['attribute'],)
+            stats = self.attributes.get(key)
+            if stats is None:
+                stats = self.attributes[key] = AttributeStats()
+            stats.add(record.timestamp, attribute['value'])
+
+    def add_error(self, exception):
+        self.frames += 1
+        self.errors[type(exception).__name__] += 1
+
+    def merge(self, other):
+        self.frames += other.frames
+        self.commands.update(other.commands)
+        self.errors.update(other.errors)
+        for key, stats in other.attributes.items():
+            mine = self.attributes.get(key)
+            if mine is None:
+                self.attributes[key] = stats
+            else:
+                mine.merge(stats)
+
+
+def _shards_for(path, workers, shards):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if shards is None:
+        # A few shards per worker evens out uneven ones.
+        shards = workers * 4
+    return workers, shard_capture(path, shards)
+
+
+def _pool(workers, executor):
+    if executor is not None:
+        return contextlib.nullcontext(executor)
+    return concurrent.futures.ProcessPoolExecutor(workers)
+
+
+def decode_parallel(path, workers=None, errors=None, shards=None, executor=None):
+    """Yield (index, decoded) for each record in the capture at path, in
+    order, decoded by decode_zcl/decode_zdo in a pool of workers
+    processes (default: one per CPU), or in executor if given (which is
+    left running).
+
+    Every decoded frame is pickled back to this process, which costs
+    nearly half as much again as decoding it. Use aggregate_parallel
+    where a summary will do.
+
+    Records that fail to decode raise, unless errors is a list, in which
+    case (index, exception) is appended to it and the record is skipped.
+    """
+    workers, ranges = _shards_for(path, workers, shards)
+    with _pool(workers, executor) as pool:
+        for (_start, _end, first), (results, shard_errors) in zip(ranges, pool.map(functools.partial(_decode_shard, path), ranges)):
+            failed = dict(shard_errors)
+            for index, decoded in enumerate(results, first):
+                if index in failed:
+                    if errors is None:
+                        raise failed[index]
+                    errors.append((index, failed[index],))
+                    continue
+                yield index, decoded
+
+
+def aggregate_parallel(path, workers=None, shards=None, executor=None):
+    """Return the Aggregate of the capture at path, computed in a pool of
+    workers processes (default: one per CPU), or in executor if given."""
+    workers, ranges = _shards_for(path, workers, shards)
+    aggregate = Aggregate()
+    with _pool(workers, executor) as pool:
+        for shard in pool.map(functools.partial(_aggregate_shard, path), ranges):
+            aggregate.merge(shard)
+    return aggregate
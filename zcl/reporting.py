@@ -0,0 +1,185 @@
+# Planning and sending attribute reporting configuration.
+#
+# plan() groups reporting configs by (device, endpoint, cluster) and packs
+# each group into as few configure_reporting frames as fit in
+# max_payload bytes. ReportingPlanner sends the frames through a
+# Dispatcher (see zcl.dispatch), at most concurrency at a time, and reads
+# the configure_reporting_response records (_decode_attr_reporting_status)
+# to find out which attributes failed. Frames that time out, and
+# attributes that failed with a status that might go away (e.g.
+# INSUFFICIENT_SPACE), are retried with exponential backoff, repacked so
+# that only those attributes are sent again.
+
+import asyncio
+import collections
+import struct
+
+from . import cache
+from . import coalesce
+from . import spec
+
+
+# A desired reporting configuration. attribute is a name or id, and
+# datatype (a name or id) defaults to the one in CLUSTERS_BY_NAME. delta
+# is the reportable change, for analog datatypes only.
+ReportingConfig = collections.namedtuple('ReportingConfig', ('device', 'endpoint', 'cluster_name', 'attribute', 'minimum', 'maximum', 'delta', 'datatype',), defaults=(None, None,))
+
+# Statuses worth trying again; anything else (e.g.
+# UNSUPPORTED_ATTRIBUTE) will fail the same way next time.
+RETRY_STATUSES = frozenset(('FAILURE', 'INSUFFICIENT_SPACE', 'TIMEOUT', 'ABORT', 'HARDWARE_FAILURE', 'SOFTWARE_FAILURE',))
+
+# direction, attribute, datatype, minimum, maximum.
+_RECORD_SIZE = 8
+
+
+def _record(config):
+    # The attr_reporting_config record for config.
+    attribute = cache.attribute_id(config.cluster_name, config.attribute)
+    datatype = config.datatype
+    if datatype is None:
+        _cluster, _rx_commands, _tx_commands, attributes = spec.CLUSTERS_BY_ID[spec.get_cluster_by_name(config.cluster_name)]
+        if attribute not in attributes:
+            raise ValueError('No datatype for attribute {} of cluster "{}"'.format(attribute, config.cluster_name))
+        _name, datatype = attributes[attribute]
+        datatype = datatype.split(':')[0]
+    record = {
+        'attribute': attribute,
+        'datatype': spec._datatype_id(datatype),
+        'minimum': config.minimum,
+        'maximum': config.maximum,
+    }
+    if record['datatype'] in spec.ANALOG_DATATYPES:
+        record['delta'] = 1 if config.delta is None else config.delta
+    return record
+
+
+def _record_size(record):
+    if 'delta' not in record:
+        return _RECORD_SIZE
+    _decode, size = spec.STRUCT_TYPES[spec.DATATYPE_STRUCT_TYPES[record['datatype']]]
+    return _RECORD_SIZE + size
+
+
+def _pack(records, max_payload):
+    # First fit decreasing: close to the fewest frames for records of
+    # mixed sizes.
+    space = max_payload - spec._ZCL_HEADER.size
+    frames = []
+    for record in sorted(records, key=_record_size, reverse=True):
+        size = _record_size(record)
+        for frame in frames:
+            if frame[0] >= size:
+                frame[0] -= size
+                frame[1].append(record)
+                break
+        else:
+            frames.append([space - size, [record]])
+    return [records for _space, records in frames]
+
+
+def _pack_groups(groups, max_payload):
+    # groups is {(device, endpoint, cluster_name): [record]}.
+    return [(device, endpoint, cluster_name, records) for (device, endpoint, cluster_name), records in groups.items() for records in _pack(records, max_payload)]
+
+
+def plan(configs, max_payload=coalesce.MAX_APS_PAYLOAD):
+    """Return [(device, endpoint, cluster_name, [record])], where each
+    list of records (attr_reporting_config dicts) fits in one
+    configure_reporting frame of at most max_payload bytes."""
+    groups = {}
+    for config in configs:
+        groups.setdefault((config.device, config.endpoint, config.cluster_name,), []).append(_record(config))
+    return _pack_groups(groups, max_payload)
+
+
+def _failures(frame, records):
+    # {attribute: status or exception} for the records of a
+    # configure_reporting frame that failed, from its response.
+    if frame.command_name == 'default_response':
+        # The whole command was rejected (e.g. UNSUPPORTED_CLUSTER).
+        status = spec._STATUS_NAMES[frame['status']] or frame['status']
+        return {record['attribute']: status for record in records}
+    if frame.command_name != 'configure_reporting_response':
+        return {record['attribute']: ValueError('Unexpected {}'.format(frame.command_name)) for record in records}
+    # Only attributes that failed get a record, and if they all
+    # succeeded there's a single SUCCESS record with no attribute.
+    return {result['attribute']: result['status'] for result in frame['results'] if result['status'] != 'SUCCESS' and 'attribute' in result}
+
+
+class ReportingPlanner:
+    """Configures reporting through dispatcher. After configure(),
+    failed has the status (or exception) for each attribute that couldn't
+    be configured."""
+
+    def __init__(self, dispatcher, concurrency=8, retries=3, backoff=0.5, timeout=None, max_payload=coalesce.MAX_APS_PAYLOAD, retry_statuses=RETRY_STATUSES):
+        self.dispatcher = dispatcher
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_payload = max_payload
+        self.retry_statuses = retry_statuses
+        # Frames sent, including retries.
+        self.frames = 0
+        # (device, endpoint, cluster_name, attribute id) -> status or
+        # exception.
+        self.failed = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _send(self, device, endpoint, cluster_name, records):
+        # Returns {attribute: status or exception} for the records that
+        # failed.
+        async with self._semaphore:
+            self.frames += 1
+            try:
+                frame = await self.dispatcher.profile_request(device, endpoint, cluster_name, 'configure_reporting', timeout=self.timeout, configs=records)
+            except (asyncio.TimeoutError, ValueError) as e:
+                return {record['attribute']: e for record in records}
+        try:
+            return _failures(frame, records)
+        except (ValueError, struct.error) as e:
+            # The response is decoded on access, so a malformed one only
+            # fails here. It fails every record, as a timeout would.
+            return {record['attribute']: e for record in records}
+
+    def _retryable(self, status):
+        return isinstance(status, BaseException) or status in self.retry_statuses
+
+    async def configure(self, configs):
+        """Configure reporting for configs (ReportingConfigs), and return
+        {(device, endpoint, cluster_name, attribute id): status}, where
+        status is 'SUCCESS', the failure status, or the exception (e.g.
+        asyncio.TimeoutError) from the last attempt."""
+        frames = plan(configs, self.max_payload)
+        results = {}
+        for device, endpoint, cluster_name, records in frames:
+            for record in records:
+                results[(device, endpoint, cluster_name, record['attribute'],)] = 'SUCCESS'
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            failures = await asyncio.gather(*(self._send(*frame) for frame in frames))
+
+            retry = []
+            for (device, endpoint, cluster_name, records), failed in zip(frames, failures):
+                for record in records:
+                    key = (device, endpoint, cluster_name, record['attribute'],)
+                    status = failed.get(record['attribute'], 'SUCCESS')
+                    results[key] = status
+                    if status != 'SUCCESS' and self._retryable(status):
+                        retry.append((key, record,))
+            if not retry:
+                break
+            # Repack just the failures, since they may now fit in fewer
+            # frames.
+            groups = {}
+            for (device, endpoint, cluster_name, _attribute), record in retry:
+                groups.setdefault((device, endpoint, cluster_name,), []).append(record)
+            frames = _pack_groups(groups, self.max_payload)
+
+        for key, status in results.items():
+            if status == 'SUCCESS':
+                self.failed.pop(key, None)
+            else:
+                self.failed[key] = status
+        return results
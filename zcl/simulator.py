@@ -0,0 +1,425 @@
+# Simulated devices and traffic, for testing and load-testing code that
+# talks to a Zigbee network without one.
+#
+# Each SimulatedDevice sits on a dispatch.LoopbackNetwork at its own
+# address and answers frames using the spec tables: ZDO active_ep,
+# simple_desc and match_desc requests, and read_attributes,
+# write_attributes and configure_reporting from its attribute values.
+# Other commands get a default_response. Configured attributes are
+# reported (report_attributes) to whoever configured them, every maximum
+# interval and on change. Responses can be delayed and randomly dropped,
+# to exercise timeouts and retries.
+#
+# TrafficGenerator produces a stream of valid report_attributes frames
+# from the devices on a SimulatedNetwork, either as fast as possible or
+# at a fixed rate, into any frame_received-style callable (a Dispatcher,
+# or a decoder). Frames are built from FrameTemplates shared between
+# devices with the same values, so generating one is just a lookup.
+
+import asyncio
+import itertools
+import random
+
+from . import dispatch
+from . import spec
+
+
+# Frame control for responses: server to client, no default response.
+_RESPONSE_OPTIONS = {'direction': 1, 'default_response': False}
+
+# configure_reporting maximum intervals.
+_NO_PERIODIC_REPORTS = 0x0000
+_STOP_REPORTING = 0xffff
+
+
+def _attribute_datatype(datatype):
+    # 'enum8:a,b' -> DataType.ENUM8.
+    return spec.DATATYPES_BY_NAME[datatype.split(':')[0]]
+
+
+def _default_value(datatype):
+    if datatype == spec.DataType.CHARACTER_STRING:
+        return ''
+    return 0
+
+
+def _all_successful(failures):
+    # If nothing failed, the response is a single SUCCESS status record
+    # (see _decode_attr_reporting_status).
+    return failures or [{'status': 'SUCCESS'}]
+
+
+class SimulatedEndpoint:
+    """An endpoint with in_clusters, {cluster_name: {attribute_name:
+    value}}, and out_clusters, [cluster_name]. A cluster with values None
+    gets every attribute in CLUSTERS_BY_NAME, with zero values."""
+
+    def __init__(self, endpoint, profile=spec.Profile.HOME_AUTOMATION, device_identifier=0, device_version=0, in_clusters=None, out_clusters=()):
+        self.endpoint = endpoint
+        self.profile = profile
+        self.device_identifier = device_identifier
+        self.device_version = device_version
+        self.out_clusters = [spec.get_cluster_by_name(name) for name in out_clusters]
+        # cluster id -> {attribute id: (datatype, value)}.
+        self.attributes = {}
+        for cluster_name, values in (in_clusters or {}).items():
+            cluster, _rx_commands, _tx_commands, attributes = spec.CLUSTERS_BY_NAME[cluster_name]
+            self.attributes[cluster] = {}
+            if values is None:
+                for attribute, datatype in attributes.values():
+                    datatype = _attribute_datatype(datatype)
+                    self.attributes[cluster][attribute] = (datatype, _default_value(datatype),)
+                continue
+            for attribute_name, value in values.items():
+                if attribute_name not in attributes:
+                    raise ValueError('Unknown attribute "{}" for cluster "{}"'.format(attribute_name, cluster_name))
+                attribute, datatype = attributes[attribute_name]
+                self.attributes[cluster][attribute] = (_attribute_datatype(datatype), value,)
+
+    @property
+    def in_clusters(self):
+        return list(self.attributes)
+
+    def simple_descriptor(self):
+        return {
+            'endpoint': self.endpoint,
+            'profile': self.profile,
+            'device_identifier': self.device_identifier,
+            'device_version': self.device_version,
+            'in_clusters': self.in_clusters,
+            'out_clusters': self.out_clusters,
+        }
+
+    def matches(self, profile, in_clusters, out_clusters):
+        # match_desc matches our in clusters against the requested in
+        # clusters, and our out clusters against the requested out ones.
+        if profile != self.profile:
+            return False
+        return any(cluster in self.attributes for cluster in in_clusters) or any(cluster in self.out_clusters for cluster in out_clusters)
+
+
+class _Reporting:
+    __slots__ = ('destination', 'minimum', 'maximum', 'delta', 'value', 'last', 'handle',)
+
+    def __init__(self, destination, minimum, maximum, delta):
+        self.destination = destination
+        self.minimum = minimum
+        self.maximum = maximum
+        self.delta = delta
+        # Value and time of the last report.
+        self.value = None
+        self.last = None
+        self.handle = None
+
+    def changed(self, value):
+        if self.value is None:
+            return True
+        if self.delta is not None:
+            return abs(value - self.value) >= self.delta
+        return value != self.value
+
+
+class SimulatedDevice:
+    """Answers frames sent to address on network. Reporting intervals are
+    multiplied by time_scale, so tests can run them faster than real
+    time."""
+
+    def __init__(self, network, address, endpoints, latency=0.0, loss=0.0, time_scale=1.0, rng=random):
+        self.address = address
+        self.endpoints = {endpoint.endpoint: endpoint for endpoint in endpoints}
+        self.latency = latency
+        self.loss = loss
+        self.time_scale = time_scale
+        self.rng = rng
+        # Frames received and reports sent, for tests.
+        self.received = 0
+        self.reports = 0
+        # (endpoint, cluster, attribute) -> _Reporting.
+        self.reporting = {}
+        self._seq = 0
+        # Responses being sent, so the tasks aren't garbage collected.
+        self._sending = set()
+        self.transport = network.transport(address)
+        self.transport.set_receiver(self.frame_received)
+
+    def frame_received(self, source, endpoint, profile, cluster, data):
+        self.received += 1
+        if endpoint == spec.Endpoint.ZDO:
+            response = self._zdo_response(cluster, data)
+            profile = spec.Profile.ZIGBEE
+        else:
+            response = self._zcl_response(source, endpoint, cluster, data)
+        if response is None:
+            return
+        response_cluster, response_data = response
+        self._send(source, endpoint, profile, response_cluster, response_data)
+
+    def _send(self, device, endpoint, profile, cluster, data):
+        if self.loss and self.rng.random() < self.loss:
+            return
+        task = asyncio.ensure_future(self._send_later(device, endpoint, profile, cluster, data))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send_later(self, device, endpoint, profile, cluster, data):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        await self.transport.send(device, endpoint, profile, cluster, data)
+
+    def _next_seq(self):
+        seq = self._seq
+        self._seq = (seq + 1) & 0xff
+        return seq
+
+    def _zdo_response(self, cluster, data):
+        decoded = spec.try_decode_zdo(cluster, data)
+        if isinstance(decoded, spec.Undecoded):
+            return None
+        cluster_name, seq, kwargs = decoded
+        if cluster_name == 'active_ep':
+            return spec.encode_zdo('active_ep_resp', seq, status=0, addr16=self.address, active_eps=list(self.endpoints))
+        if cluster_name == 'simple_desc':
+            endpoint = self.endpoints.get(kwargs['endpoint'])
+            if endpoint is None:
+                # invalid_ep
+                return spec.encode_zdo('simple_desc_resp', seq, status=1, addr16=self.address, simple_descriptors=[])
+            return spec.encode_zdo('simple_desc_resp', seq, status=0, addr16=self.address, simple_descriptors=[endpoint.simple_descriptor()])
+        if cluster_name == 'match_desc':
+            match_list = [endpoint.endpoint for endpoint in self.endpoints.values() if endpoint.matches(kwargs['profile'], kwargs['in_clusters'], kwargs['out_clusters'])]
+            return spec.encode_zdo('match_desc_resp', seq, status=0, addr16=self.address, match_list=match_list)
+        return None
+
+    def _zcl_response(self, source, endpoint, cluster, data):
+        decoded = spec.try_decode_zcl(cluster, data)
+        if isinstance(decoded, spec.Undecoded):
+            return None
+        cluster_name, seq, command_type, command_name, default_response, kwargs = decoded
+        attributes = self.endpoints[endpoint].attributes.get(cluster) if endpoint in self.endpoints else None
+        if attributes is None:
+            return self._default_response(cluster_name, seq, data, 'UNSUPPORTED_CLUSTER', default_response)
+        if command_type == spec.ZclCommandType.PROFILE:
+            handler = getattr(self, '_' + command_name, None)
+            if handler is None:
+                return self._default_response(cluster_name, seq, data, 'UNSUP_GENERAL_COMMAND', default_response)
+            return handler(source, endpoint, cluster_name, seq, attributes, kwargs)
+        return self._default_response(cluster_name, seq, data, 'SUCCESS', default_response)
+
+    def _default_response(self, cluster_name, seq, data, status, default_response):
+        if not default_response and status == 'SUCCESS':
+            return None
+        return spec.encode_profile_command(cluster_name, 'default_response', seq, command=spec.peek_zcl_header(data).command, status=spec.Status[status], **_RESPONSE_OPTIONS)
+
+    def _read_attributes(self, source, endpoint, cluster_name, seq, attributes, kwargs):
+        records = []
+        for attribute in kwargs['attributes']:
+            if attribute in attributes:
+                datatype, value = attributes[attribute]
+                records.append({'attribute': attribute, 'status': 'SUCCESS', 'datatype': datatype, 'value': value})
+            else:
+                records.append({'attribute': attribute, 'status': 'UNSUPPORTED_ATTRIBUTE'})
+        return spec.encode_profile_command(cluster_name, 'read_attributes_response', seq, attributes=records, **_RESPONSE_OPTIONS)
+
+    def _write(self, endpoint, cluster_name, attributes, records, undivided):
+        # Returns the status records for the attributes that failed.
+        failures = []
+        writes = []
+        for record in records:
+            attribute = record['attribute']
+            if attribute not in attributes:
+                failures.append({'status': 'UNSUPPORTED_ATTRIBUTE', 'attribute': attribute})
+            elif attributes[attribute][0] != record['datatype']:
+                failures.append({'status': 'INVALID_DATA_TYPE', 'attribute': attribute})
+            else:
+                writes.append(record)
+        if failures and undivided:
+            return failures
+        for record in writes:
+            self.set_attribute(endpoint, cluster_name, record['attribute'], record['value'])
+        return failures
+
+    def _write_attributes(self, source, endpoint, cluster_name, seq, attributes, kwargs):
+        failures = self._write(endpoint, cluster_name, attributes, kwargs['attributes'], False)
+        return spec.encode_profile_command(cluster_name, 'write_attributes_response', seq, attributes=_all_successful(failures), **_RESPONSE_OPTIONS)
+
+    def _write_attributes_undivided(self, source, endpoint, cluster_name, seq, attributes, kwargs):
+        failures = self._write(endpoint, cluster_name, attributes, kwargs['attributes'], True)
+        return spec.encode_profile_command(cluster_name, 'write_attributes_response', seq, attributes=_all_successful(failures), **_RESPONSE_OPTIONS)
+
+    def _write_attributes_no_response(self, source, endpoint, cluster_name, seq, attributes, kwargs):
+        self._write(endpoint, cluster_name, attributes, kwargs['attributes'], False)
+        return None
+
+    def _configure_reporting(self, source, endpoint, cluster_name, seq, attributes, kwargs):
+        cluster = spec.get_cluster_by_name(cluster_name)
+        failures = []
+        for config in kwargs['configs']:
+            attribute = config['attribute']
+            if config['direction'] != 0:
+                # Timeouts for reports we receive; we don't receive any.
+                continue
+            if attribute not in attributes:
+                failures.append({'status': 'UNSUPPORTED_ATTRIBUTE', 'direction': 0, 'attribute': attribute})
+            elif attributes[attribute][0] != config['datatype']:
+                failures.append({'status': 'INVALID_DATA_TYPE', 'direction': 0, 'attribute': attribute})
+            else:
+                self._configure(source, endpoint, cluster, attribute, config)
+        return spec.encode_profile_command(cluster_name, 'configure_reporting_response', seq, results=_all_successful(failures), **_RESPONSE_OPTIONS)
+
+    def _configure(self, destination, endpoint, cluster, attribute, config):
+        key = (endpoint, cluster, attribute,)
+        reporting = self.reporting.pop(key, None)
+        if reporting is not None and reporting.handle is not None:
+            reporting.handle.cancel()
+        if config['maximum'] == _STOP_REPORTING:
+            return
+        self.reporting[key] = _Reporting(destination, config['minimum'], config['maximum'], config.get('delta'))
+        # Report the current value straight away, which also starts the
+        # periodic reports.
+        self._report(key)
+
+    def _schedule(self, key, delay):
+        reporting = self.reporting[key]
+        if reporting.handle is not None:
+            reporting.handle.cancel()
+        reporting.handle = asyncio.get_running_loop().call_later(delay * self.time_scale, self._report, key)
+
+    def _report(self, key):
+        reporting = self.reporting.get(key)
+        if reporting is None:
+            return
+        endpoint, cluster, attribute = key
+        datatype, value = self.endpoints[endpoint].attributes[cluster][attribute]
+        cluster_name, _rx_commands, _tx_commands, _attributes = spec.CLUSTERS_BY_ID[cluster]
+        _cluster, data = spec.encode_profile_command(cluster_name, 'report_attributes', self._next_seq(), attributes=[{'attribute': attribute, 'datatype': datatype, 'value': value}], **_RESPONSE_OPTIONS)
+        self._send(reporting.destination, endpoint, self.endpoints[endpoint].profile, cluster, data)
+        self.reports += 1
+        reporting.value = value
+        reporting.last = asyncio.get_running_loop().time()
+        reporting.handle = None
+        if reporting.maximum != _NO_PERIODIC_REPORTS:
+            self._schedule(key, reporting.maximum)
+
+    def set_attribute(self, endpoint, cluster_name, attribute, value):
+        """Set an attribute (a name or id), and report it if reporting is
+        configured and it has changed enough."""
+        cluster, _rx_commands, _tx_commands, attributes = spec.CLUSTERS_BY_NAME[cluster_name]
+        if isinstance(attribute, str):
+            attribute, _datatype = attributes[attribute]
+        values = self.endpoints[endpoint].attributes[cluster]
+        datatype, _value = values[attribute]
+        values[attribute] = (datatype, value,)
+
+        key = (endpoint, cluster, attribute,)
+        reporting = self.reporting.get(key)
+        if reporting is None or not reporting.changed(value):
+            return
+        wait = reporting.last + reporting.minimum * self.time_scale - asyncio.get_running_loop().time()
+        if wait <= 0:
+            self._report(key)
+        else:
+            self._schedule(key, wait / self.time_scale)
+
+
+def light(endpoint=1):
+    """Endpoints for a typical dimmable light, for add_devices."""
+    return [SimulatedEndpoint(endpoint, device_identifier=0x0101, in_clusters={
+        'basic': {'zclversion': 3, 'manufacturer_name': 'Simulated', 'model_id': 'Light', 'power_source': 1},
+        'identify': None,
+        'onoff': {'onoff': 1},
+        'level_control': {'current_level': 254},
+    })]
+
+
+class SimulatedNetwork:
+    """A LoopbackNetwork with simulated devices on it. The controller is
+    whoever uses transport() (usually with a Dispatcher)."""
+
+    def __init__(self):
+        self.loopback = dispatch.LoopbackNetwork()
+        self.devices = {}
+
+    def transport(self, address=0):
+        return self.loopback.transport(address)
+
+    def add_device(self, address, endpoints, **kwargs):
+        device = self.devices[address] = SimulatedDevice(self.loopback, address, endpoints, **kwargs)
+        return device
+
+    def add_devices(self, count, endpoints=light, first_address=1, **kwargs):
+        """Add count devices at consecutive addresses, each with
+        endpoints(), and return them."""
+        return [self.add_device(address, endpoints(), **kwargs) for address in range(first_address, first_address + count)]
+
+
+class TrafficGenerator:
+    """Feeds report_attributes frames from the devices on network to
+    sink(source, endpoint, profile, cluster, data), e.g. a Dispatcher's
+    frame_received. Each device reports every attribute of each of its
+    clusters in one frame, round-robin across the network."""
+
+    def __init__(self, network, sink):
+        self.sink = sink
+        self.sent = 0
+        templates = {}
+        # (source, endpoint, profile, FrameTemplate).
+        self.sources = []
+        for device in network.devices.values():
+            for endpoint in device.endpoints.values():
+                for cluster, attributes in endpoint.attributes.items():
+                    if not attributes:
+                        continue
+                    cluster_name, _rx_commands, _tx_commands, _attributes = spec.CLUSTERS_BY_ID[cluster]
+                    records = tuple((attribute, datatype, value,) for attribute, (datatype, value) in attributes.items())
+                    key = (cluster_name, records,)
+                    template = templates.get(key)
+                    if template is None:
+                        template = templates[key] = spec.profile_command_template(cluster_name, 'report_attributes', attributes=[
+                            {'attribute': attribute, 'datatype': datatype, 'value': value} for attribute, datatype, value in records
+                        ], **_RESPONSE_OPTIONS)
+                    self.sources.append((device.address, endpoint.endpoint, endpoint.profile, template,))
+        if not self.sources:
+            raise ValueError('No attributes to report')
+        self._frames = self.frames()
+
+    def frames(self):
+        """Yield (source, endpoint, profile, cluster, data) forever. Each
+        source's sequence number goes up by one per round."""
+        for seq in itertools.cycle(range(256)):
+            for source, endpoint, profile, template in self.sources:
+                cluster, data = template.encode(seq)
+                yield source, endpoint, profile, cluster, data
+
+    def pump(self, count):
+        """Send count frames to the sink as fast as possible."""
+        sink = self.sink
+        for frame in itertools.islice(self._frames, count):
+            sink(*frame)
+        self.sent += count
+        return count
+
+    async def run(self, rate, duration=None, count=None, tick=0.01):
+        """Send frames at rate per second (in bursts every tick seconds),
+        until duration seconds have passed or count frames have been sent.
+        Returns the number sent."""
+        if duration is None and count is None:
+            raise ValueError('Need a duration or a count')
+        loop = asyncio.get_running_loop()
+        sink = self.sink
+        frames = self._frames
+        start = loop.time()
+        sent = 0
+        while True:
+            elapsed = loop.time() - start
+            if duration is not None and elapsed >= duration:
+                break
+            due = int(elapsed * rate) - sent
+            if count is not None:
+                due = min(due, count - sent)
+            for frame in itertools.islice(frames, due):
+                sink(*frame)
+            sent += due
+            if count is not None and sent >= count:
+                break
+            await asyncio.sleep(tick)
+        self.sent += sent
+        return sent
@@ -60,7 +60,10 @@
 
 # t_int = 0
 
+import collections
+import collections.abc
 import enum
+import functools
 import struct
 
 
@@ -145,6 +148,16 @@ class Status(enum.IntEnum):
     UNSUPPORTED_CLUSTER = 0xC3
 
 
+# Status byte to name (None for unknown codes), and name to encoded byte.
+_STATUS_NAMES = [None] * 256
+for _s in Status:
+    _STATUS_NAMES[_s.value] = _s.name
+
+_STATUS_BYTES = {
+    s.name: bytes((s.value,)) for s in Status
+}
+
+
 ZDO_BY_NAME = {
     # Zigbee Spec -- "2.4.3.1.5 Simple_Desc_req"
     'simple_desc': (0x0004, ('addr16:uint16', 'endpoint:uint8',),),
@@ -178,79 +191,305 @@ ZDO_BY_ID = {
 }
 
 
-def _decode_helper(args, data, i=0):
-    kwargs = {}
+# Arg specs are compiled once into a decoder plan: a tuple of steps,
+# with consecutive fixed-width fields merged into a single
+# struct.Struct. Plans are cached by the args tuple.
+_STEP_STRUCT = 0         # Run of fixed-width fields.
+_STEP_VALUE = 1          # Single field with a custom decoder.
+_STEP_REPEAT = 2         # '*' -- repeat n times.
+_STEP_REPEAT_STRUCT = 3  # '*' of a fixed-width type.
+_STEP_BYTES = 4          # '#' -- b bytes of records.
+_STEP_REMAINDER = 5      # '%' -- records until end of frame.
+
+_ROLE_VALUE = 0
+_ROLE_COUNT = 1  # n_
+_ROLE_BYTES = 2  # b_
+
+_DECODE_PLANS = {}
 
-    n = 1
-    b = 0
+
+def _struct_decoder(fmt, nbytes):
+    unpack_from = struct.Struct(fmt).unpack_from
+    return lambda dd, ii, _: (unpack_from(dd, ii)[0], ii + nbytes,)
+
+
+def _field_decoder(datatype):
+    decode, encode = STRUCT_TYPES[datatype]
+    if not callable(decode):
+        return _struct_decoder(decode, encode)
+    return decode
+
+
+def _arg_role(name):
+    if name.startswith('n_'):
+        return _ROLE_COUNT
+    elif name.startswith('b_'):
+        return _ROLE_BYTES
+    return _ROLE_VALUE
+
+
+def _struct_run_step(run):
+    # The state of n and b after the run: None leaves it unchanged, -1
+    # resets it, otherwise it's the index of the value to use.
+    n_pos = None
+    b_pos = None
+    stores = []
+    for pos, (name, role, _fmt) in enumerate(run):
+        if role == _ROLE_COUNT:
+            n_pos = pos
+        elif role == _ROLE_BYTES:
+            b_pos = pos
+        else:
+            stores.append((pos, name,))
+            n_pos = -1
+            b_pos = -1
+    st = struct.Struct('<' + ''.join(fmt.lstrip('<') for _name, _role, fmt in run))
+    return (_STEP_STRUCT, st, tuple(stores), n_pos, b_pos,)
+
+
+def _compile_decoder(args):
+    plan = []
+    run = []
 
     for arg in args:
         arg = arg.split(':')
         name, datatype = arg[0], arg[1],
 
-        v = None
+        check = False
+        if name.startswith('s_'):
+            name = name[2:]
+            check = True
+        role = _arg_role(name)
+
+        base = datatype.strip('*#%')
+        decode, encode = STRUCT_TYPES[base]
+        fixed = not callable(decode)
+
+        if fixed and not check and datatype == base:
+            run.append((name, role, decode,))
+            continue
 
-        decode, encode = STRUCT_TYPES[datatype.strip('*#%')]
-        if not callable(decode):
-            fmt, nbytes, = decode, encode
-            decode = lambda dd, ii, _: (struct.unpack(fmt, dd[ii:ii + nbytes])[0], ii + nbytes,)
+        if run:
+            plan.append(_struct_run_step(run))
+            run = []
 
         if datatype.startswith('*'):
+            if fixed:
+                plan.append((_STEP_REPEAT_STRUCT, name, role, (decode.lstrip('<'), encode,), check,))
+                continue
+            kind = _STEP_REPEAT
+        elif datatype.startswith('#'):
+            kind = _STEP_BYTES
+        elif datatype.startswith('%'):
+            kind = _STEP_REMAINDER
+        else:
+            kind = _STEP_VALUE
+        plan.append((kind, name, role, _field_decoder(base), check,))
+
+    if run:
+        plan.append(_struct_run_step(run))
+
+    return tuple(plan)
+
+
+def _get_decode_plan(args):
+    plan = _DECODE_PLANS.get(args)
+    if plan is None:
+        plan = _DECODE_PLANS[args] = _compile_decoder(args)
+    return plan
+
+
+def _iter_records(data, i, end, decode, obj):
+    while i < end:
+        x, i = decode(data, i, obj)
+        yield x
+
+
+class RecordList(collections.abc.Sequence):
+    """A variable-length list of records that is decoded on demand.
+
+    Records are decoded in order as they're accessed and then cached, so
+    finding one record only decodes the records before it. The
+    underlying buffer must not be modified while the list is in use.
+    """
+
+    __slots__ = ('_data', '_i', '_end', '_decode', '_obj', '_records',)
+
+    def __init__(self, data, i, end, decode, obj):
+        self._data = data
+        self._i = i
+        self._end = end
+        self._decode = decode
+        self._obj = obj
+        self._records = []
+
+    def _decode_next(self):
+        x, self._i = self._decode(self._data, self._i, self._obj)
+        self._records.append(x)
+        return x
+
+    def _fill(self, n=None):
+        while self._i < self._end and (n is None or len(self._records) < n):
+            self._decode_next()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or index < 0:
+            self._fill()
+        else:
+            self._fill(index + 1)
+        return self._records[index]
+
+    def __len__(self):
+        self._fill()
+        return len(self._records)
+
+    def __iter__(self):
+        yield from self._records
+        while self._i < self._end:
+            yield self._decode_next()
+
+    def __eq__(self, other):
+        if isinstance(other, RecordList):
+            other = list(other)
+        return list(self) == other
+
+    def __repr__(self):
+        return 'RecordList({!r})'.format(list(self))
+
+
+def _run_decode_plan(plan, data, i, lazy=False):
+    kwargs = {}
+
+    n = 1
+    b = 0
+
+    for step in plan:
+        kind = step[0]
+
+        if kind == _STEP_STRUCT:
+            _kind, st, stores, n_pos, b_pos = step
+            values = st.unpack_from(data, i)
+            i += st.size
+            for pos, name in stores:
+                kwargs[name] = values[pos]
+            if n_pos is not None:
+                n = 1 if n_pos < 0 else values[n_pos]
+            if b_pos is not None:
+                b = 0 if b_pos < 0 else values[b_pos]
+            continue
+
+        _kind, name, role, decode, check = step
+
+        if kind == _STEP_VALUE:
+            v, i = decode(data, i, kwargs)
+        elif kind == _STEP_REPEAT_STRUCT:
+            fmt, nbytes = decode
+            v = list(struct.unpack_from('<{}{}'.format(n, fmt), data, i))
+            i += n * nbytes
+        elif kind == _STEP_REPEAT:
             # Repeat n times
             v = []
             for _i in range(n):
                 x, i = decode(data, i, kwargs)
                 v.append(x)
-        elif datatype.startswith('#'):
+        elif kind == _STEP_BYTES:
             # There are b bytes of records
-            v = []
             ii = i + b
-            while i < ii:
-                x, i = decode(data, i, kwargs)
-                v.append(x)
-        elif datatype.startswith('%'):
+            if lazy:
+                v = RecordList(data, i, ii, decode, kwargs)
+                i = ii
+            else:
+                v = []
+                while i < ii:
+                    x, i = decode(data, i, kwargs)
+                    v.append(x)
+        else:
             # Keep reading records until end of frame
-            v = []
             ii = len(data)
-            while i < ii:
-                x, i = decode(data, i, kwargs)
-                v.append(x)
-        else:
-            v, i = decode(data, i, kwargs)
-
-        stop = False
-        if name.startswith('s_'):
-            name = name[2:]
-            if v != 'SUCCESS':
-                stop = True
+            if lazy:
+                v = RecordList(data, i, ii, decode, kwargs)
+                i = ii
+            else:
+                v = []
+                while i < ii:
+                    x, i = decode(data, i, kwargs)
+                    v.append(x)
 
-        if name.startswith('n_'):
+        if role == _ROLE_COUNT:
             n = v
-        elif name.startswith('b_'):
+        elif role == _ROLE_BYTES:
             b = v
         else:
             kwargs[name] = v
             n = 1
             b = 0
 
-        if stop:
+        if check and v != 'SUCCESS':
             break
 
     return kwargs, i
 
 
+# Decoders are callables of (data, i) returning (kwargs, i), built from
+# the plans by _make_decoder. use_codegen() swaps in generated ones.
+_DECODERS = {}
+
+
+def _plan_decoder(args):
+    return functools.partial(_run_decode_plan, _get_decode_plan(args))
+
+
+_make_decoder = _plan_decoder
+
+
+def _get_decoder(args):
+    decoder = _DECODERS.get(args)
+    if decoder is None:
+        decoder = _DECODERS[args] = _make_decoder(args)
+    return decoder
+
+
+def _decode_helper(args, data, i=0):
+    return _get_decoder(args)(data, i)
+
+
+_SIMPLE_DESCRIPTOR_ARGS = ('endpoint:uint8', 'profile:uint16', 'device_identifier:uint16', 'device_version:uint8', 'n_in_clusters:uint8', 'in_clusters:*uint16', 'n_out_clusters:uint8', 'out_clusters:*uint16',)
+
 def _decode_simple_descriptor(data, i, obj):
-    return _decode_helper(('endpoint:uint8', 'profile:uint16', 'device_identifier:uint16', 'device_version:uint8', 'n_in_clusters:uint8', 'in_clusters:*uint16', 'n_out_clusters:uint8', 'out_clusters:*uint16',), data, i)
+    return _decode_helper(_SIMPLE_DESCRIPTOR_ARGS, data, i)
 
-def _encode_simple_descriptor():
-    pass
+def _encode_simple_descriptor(obj):
+    return _encode_helper(_SIMPLE_DESCRIPTOR_ARGS, obj)
 
 
+_READ_ATTR_STATUS_ARGS = ('attribute:uint16', 's_status:status8', 'datatype:uint8', 'value:datatype',)
+
 def _decode_read_attr_status(data, i, obj):
-    return _decode_helper(('attribute:uint16', 's_status:status8', 'datatype:uint8', 'value:datatype',), data, i)
+    return _decode_helper(_READ_ATTR_STATUS_ARGS, data, i)
 
 def _encode_read_attr_status(obj):
-    pass
+    data = struct.pack('<H', obj['attribute']) + _encode_status(obj['status'])
+    if obj['status'] != 'SUCCESS':
+        return data
+    return data + _encode_datatype_value(obj['datatype'], obj['value'])
+
+
+def _datatype_id(datatype):
+    # Encoders take datatypes by name ('uint8'), decoders return the id.
+    if isinstance(datatype, str):
+        return DATATYPES_BY_NAME[datatype]
+    return datatype
+
+
+def _encode_datatype_value(datatype, value):
+    # The datatype id followed by the value.
+    datatype = _datatype_id(datatype)
+    data = _UINT8.pack(datatype)
+    if datatype == DataType.NULL:
+        return data
+    if datatype not in DATATYPE_STRUCT_TYPES:
+        raise ValueError('Unknown struct type')
+    return data + _encode_value_field_helper(DATATYPE_STRUCT_TYPES[datatype], value)
 
 
 def _encode_value_field_helper(datatype, value):
@@ -264,19 +503,29 @@ def _encode_value_field_helper(datatype, value):
         return encode(value)
 
 
+_WRITE_ATTR_ARGS = ('attribute:uint16', 'datatype:uint8', 'value:datatype',)
+
 def _decode_write_attr(data, i, obj):
-    return _decode_helper(('attribute:uint16', 'datatype:uint8', 'value:datatype',), data, i)
+    return _decode_helper(_WRITE_ATTR_ARGS, data, i)
 
 def _encode_write_attr(obj):
-    return struct.pack('<HB', obj['attribute'], DATATYPES_BY_NAME[obj['datatype']]) + _encode_value_field_helper(obj['datatype'], obj['value'])
+    return struct.pack('<H', obj['attribute']) + _encode_datatype_value(obj['datatype'], obj['value'])
+
 
+_WRITE_ATTR_STATUS_ARGS = ('status:status8', 'attribute:uint16',)
 
 def _decode_write_attr_status(data, i, obj):
-    # , 'attribute:uint16',
-    return _decode_helper(('status:status8', ), data, i)
+    # As for configure_reporting_response, only attributes that failed get a record, and if all were written there's a single SUCCESS status with no attribute.
+    if data[i] == 0x00 and len(data) - i == 1:
+        return {
+            'status': 'SUCCESS',
+        }, i + 1
+    return _decode_helper(_WRITE_ATTR_STATUS_ARGS, data, i)
 
 def _encode_write_attr_status(obj):
-    return struct.pack('<BH', obj['status'], obj['attribute'])
+    if 'attribute' not in obj:
+        return _encode_status(obj['status'])
+    return _encode_status(obj['status']) + struct.pack('<H', obj['attribute'])
 
 
 def _decode_datatype(data, i, obj):
@@ -287,58 +536,78 @@ def _decode_datatype(data, i, obj):
     if datatype == DataType.NULL:
         return None, i,
 
-    if datatype not in DATATYPE_STRUCT_TYPES:
+    if datatype not in _DATATYPE_DECODERS:
         raise ValueError('Unknown struct type')
 
-    decode, encode = STRUCT_TYPES[DATATYPE_STRUCT_TYPES[datatype]]
-    if not callable(decode):
-        fmt, nbytes, = decode, encode
-        decode = lambda dd, ii, _: (struct.unpack(fmt, dd[ii:ii + nbytes])[0], ii + nbytes,)
-
-    return decode(data, i, obj)
+    return _DATATYPE_DECODERS[datatype](data, i, obj)
 
 def _encode_datatype():
     pass
 
 
-def _decode_attr_reporting_config():
-    pass
+_ATTR_REPORTING_CONFIG_ARGS = ('direction:uint8', 'attribute:uint16',)
+_ATTR_REPORTING_SEND_ARGS = ('datatype:uint8', 'minimum:uint16', 'maximum:uint16',)
+_ATTR_REPORTING_RECEIVE_ARGS = ('timeout:uint16',)
+
+def _decode_attr_reporting_config(data, i, obj):
+    # Direction 0 configures the reports the device sends (with a
+    # reportable change for analog types), 1 the timeout for reports it
+    # expects to receive.
+    kwargs, i = _decode_helper(_ATTR_REPORTING_CONFIG_ARGS, data, i)
+    if kwargs['direction'] == 0:
+        config, i = _decode_helper(_ATTR_REPORTING_SEND_ARGS, data, i)
+        kwargs.update(config)
+        if kwargs['datatype'] in ANALOG_DATATYPES:
+            kwargs['delta'], i = _DATATYPE_DECODERS[kwargs['datatype']](data, i, kwargs)
+    else:
+        config, i = _decode_helper(_ATTR_REPORTING_RECEIVE_ARGS, data, i)
+        kwargs.update(config)
+    return kwargs, i
 
 def _encode_attr_reporting_config(obj):
-    data = bytes()
-    datatype = DATATYPES_BY_NAME[obj['datatype']]
+    direction = obj.get('direction', 0)
+    if direction != 0:
+        return struct.pack('<BHH', direction, obj['attribute'], obj['timeout'])
+    datatype = _datatype_id(obj['datatype'])
     # min=1s, max=60s
-    data += struct.pack('<BHBHH', 0, obj['attribute'], datatype, obj['minimum'], obj['maximum'])
+    data = struct.pack('<BHBHH', 0, obj['attribute'], datatype, obj['minimum'], obj['maximum'])
     if datatype in ANALOG_DATATYPES:
-        decode, encode = STRUCT_TYPES[DATATYPE_STRUCT_TYPES[datatype]]
-        fmt, _nbytes = decode, encode
-        data += struct.pack(fmt, obj.get('delta', 1))
+        data += _encode_value_field_helper(DATATYPE_STRUCT_TYPES[datatype], obj.get('delta', 1))
     return data
 
+_ATTR_REPORTING_STATUS_ARGS = ('status:status8', 'direction:uint8', 'attribute:uint16',)
+
 def _decode_attr_reporting_status(data, i, obj):
     # Note that attribute status records are not included for successfully configured attributes, in order to save bandwidth. In the case of successful configuration of all attributes, only a single attribute status record SHALL be included in the command, with the status field set to SUCCESS and the direction and attribute identifier fields omitted.
     if data[i] == 0x00 and len(data) - i == 1:
         return {
             'status': 'SUCCESS',
         }, i + 1
-    return _decode_helper(('status:status8', 'direction:uint8', 'attribute:uint16',), data, i)
+    return _decode_helper(_ATTR_REPORTING_STATUS_ARGS, data, i)
 
 
-def _encode_attr_reporting_status():
-    pass
+def _encode_attr_reporting_status(obj):
+    # The single all-successful record is just the status.
+    if 'attribute' not in obj:
+        return _encode_status(obj['status'])
+    return _encode_status(obj['status']) + struct.pack('<BH', obj['direction'], obj['attribute'])
 
 
+_REPORTED_ATTRIBUTE_ARGS = ('attribute:uint16', 'datatype:uint8', 'value:datatype',)
+
 def _decode_reported_attribute(data, i, obj):
-    return _decode_helper(('attribute:uint16', 'datatype:uint8', 'value:datatype',), data, i)
+    return _decode_helper(_REPORTED_ATTRIBUTE_ARGS, data, i)
 
-def _encode_reported_attribute():
-    pass
+def _encode_reported_attribute(obj):
+    return struct.pack('<H', obj['attribute']) + _encode_datatype_value(obj['datatype'], obj['value'])
 
 
 def _decode_string(data, i, obj):
-    nbytes, = struct.unpack('<B', data[i:i+1])
+    # For memoryview input the slice doesn't copy, so the only copy is the
+    # str. Slicing bytes copies the string bytes once more.
+    nbytes, = _UINT8.unpack_from(data, i)
     nbytes += 1
-    return data[i+1:i+nbytes].decode(), i + nbytes
+    return str(data[i+1:i+nbytes], 'utf-8'), i + nbytes
 
 
 def _encode_string(val):
@@ -347,18 +616,24 @@ def _encode_string(val):
 
 
 def _decode_status(data, i, obj):
-    status, = struct.unpack('<B', data[i:i+1])
-    for s in Status:
-        if s.value == status:
-            return s.name, i + 1
-    raise ValueError('Unknown status {}'.format(status))
+    status, = _UINT8.unpack_from(data, i)
+    name = _STATUS_NAMES[status]
+    if name is None:
+        raise ValueError('Unknown status {}'.format(status))
+    return name, i + 1
 
 
 def _encode_status(val):
-    for s in Status:
-        if s.name == val:
-            return struct.pack('<B', s.value)
-    raise ValueError('Unknown status {}'.format(val))
+    data = _STATUS_BYTES.get(val)
+    if data is None:
+        raise ValueError('Unknown status {}'.format(val))
+    return data
+
+
+_UINT8 = struct.Struct('<B')
+_ZDO_HEADER = struct.Struct('<B')
+_ZCL_HEADER = struct.Struct('<BBB')
+_ZCL_MANUFACTURER_HEADER = struct.Struct('<BHBB')
 
 
 STRUCT_TYPES = {
@@ -403,6 +678,10 @@ DATATYPE_STRUCT_TYPES = {
     DataType.EUI64: 'EUI64',
 }
 
+_DATATYPE_DECODERS = {
+    datatype: _field_decoder(name) for datatype, name in DATATYPE_STRUCT_TYPES.items()
+}
+
 DATATYPES_BY_NAME = {
     'bool': DataType.BOOLEAN,
     'bitmap8': DataType.BITMAP8,
@@ -421,6 +700,16 @@ DATATYPES_BY_NAME = {
 }
 
 
+ZdoHeader = collections.namedtuple('ZdoHeader', ('cluster', 'seq', 'response', 'size',))
+
+
+def peek_zdo_header(cluster, data):
+    """Parse only the ZDO frame header (the sequence number), without
+    decoding the payload. Response clusters have the high bit set."""
+    seq, = _ZDO_HEADER.unpack_from(data, 0)
+    return ZdoHeader(cluster, seq, bool(cluster & 0x8000), _ZDO_HEADER.size)
+
+
 def decode_zdo(cluster, data):
     if cluster not in ZDO_BY_ID:
         raise ValueError('Unknown ZDO 0x{:04x}'.format(cluster))
@@ -429,43 +718,188 @@ def decode_zdo(cluster, data):
 
     cluster_name, args = ZDO_BY_ID[cluster]
 
-    seq, = struct.unpack('<B', data[:1])
-    data = data[1:]
+    seq, = _ZDO_HEADER.unpack_from(data, 0)
 
-    kwargs, _nbytes =_decode_helper(args, data)
+    kwargs, _nbytes = _decode_helper(args, data, _ZDO_HEADER.size)
 
     return cluster_name, seq, kwargs
 
 
-def _encode_helper(args, kwargs):
-    data = bytes()
+# Encoder plans mirror the decoder plans above. Fixed-width fields
+# (including n_ lengths) are packed by one precompiled struct.Struct.
+# Unlike decoder plans these are compiled on first use, as not every
+# arg spec can be encoded.
+_ENCODE_PLANS = {}
+
+
+def _encode_struct_run_step(run):
+    st = struct.Struct('<' + ''.join(fmt.lstrip('<') for _field, fmt in run))
+    return (_STEP_STRUCT, st, tuple(field for field, _fmt in run),)
+
+
+def _encoded_size(encode, values):
+    return sum(len(encode(value)) for value in values)
+
+
+def _compile_encoder(args):
+    plan = []
+    run = []
+
+    # A b_ field is the size of the '#' records that follow it, once
+    # encoded.
+    record_encoders = {}
+    for arg in args:
+        name, datatype = arg.split(':')[:2]
+        if datatype.startswith('#'):
+            record_encoders[name] = STRUCT_TYPES[datatype[1:]][1]
 
     for arg in args:
         arg = arg.split(':')
         name, datatype = arg[0], arg[1],
 
+        # False, True for an n_ count, or a function giving the size of a
+        # b_ field's records.
+        length = False
         if name.startswith('n_'):
             name = name[2:]
-            values = [len(kwargs[name])]
-        else:
-            values = [kwargs[name]]
+            length = True
+        elif name.startswith('b_'):
+            name = name[2:]
+            length = functools.partial(_encoded_size, record_encoders[name])
 
-        if datatype.startswith('*'):
+        repeat = False
+        if datatype[0] in '*#%':
             datatype = datatype[1:]
-            values = kwargs[name]
+            repeat = True
 
         decode, encode = STRUCT_TYPES[datatype]
+        fixed = not callable(decode)
+        hex64 = datatype == 'uint64'
 
-        for value in values:
-            if not callable(decode):
-                fmt, _nbytes = decode, encode
-                if datatype == 'uint64' and isinstance(value, str):
-                    value = int(value, 16)
-                data += struct.pack(fmt, value)
-            else:
-                data += encode(value)
+        if fixed and not repeat:
+            run.append(((name, length, hex64,), decode,))
+            continue
 
-    return data
+        if run:
+            plan.append(_encode_struct_run_step(run))
+            run = []
+
+        if fixed:
+            plan.append((_STEP_REPEAT_STRUCT, name, decode.lstrip('<'), hex64,))
+        elif repeat:
+            plan.append((_STEP_REPEAT, name, encode,))
+        else:
+            plan.append((_STEP_VALUE, name, encode, length,))
+
+    if run:
+        plan.append(_encode_struct_run_step(run))
+
+    return tuple(plan)
+
+
+def _get_encode_plan(args):
+    plan = _ENCODE_PLANS.get(args)
+    if plan is None:
+        plan = _ENCODE_PLANS[args] = _compile_encoder(args)
+    return plan
+
+
+def _encode_run_values(fields, kwargs):
+    values = []
+    for name, length, hex64 in fields:
+        value = kwargs[name]
+        if length is True:
+            value = len(value)
+        elif length:
+            value = length(value)
+        elif hex64 and isinstance(value, str):
+            value = int(value, 16)
+        values.append(value)
+    return values
+
+
+def _encode_repeat_values(values, hex64):
+    if hex64:
+        return [int(value, 16) if isinstance(value, str) else value for value in values]
+    return values
+
+
+def _run_encode_plan(plan, kwargs, parts):
+    for step in plan:
+        kind = step[0]
+        if kind == _STEP_STRUCT:
+            _kind, st, fields = step
+            parts.append(st.pack(*_encode_run_values(fields, kwargs)))
+        elif kind == _STEP_REPEAT_STRUCT:
+            _kind, name, fmt, hex64 = step
+            values = _encode_repeat_values(kwargs[name], hex64)
+            parts.append(struct.pack('<{}{}'.format(len(values), fmt), *values))
+        elif kind == _STEP_REPEAT:
+            _kind, name, encode = step
+            for value in kwargs[name]:
+                parts.append(encode(value))
+        else:
+            _kind, name, encode, length = step
+            value = kwargs[name]
+            parts.append(encode(len(value) if length else value))
+    return b''.join(parts)
+
+
+def _write_into(buffer, offset, data):
+    end = offset + len(data)
+    if end > len(buffer):
+        raise struct.error('buffer too small: need {} bytes at offset {}'.format(len(data), offset))
+    buffer[offset:end] = data
+    return end
+
+
+def _run_encode_plan_into(plan, kwargs, buffer, offset):
+    for step in plan:
+        kind = step[0]
+        if kind == _STEP_STRUCT:
+            _kind, st, fields = step
+            st.pack_into(buffer, offset, *_encode_run_values(fields, kwargs))
+            offset += st.size
+        elif kind == _STEP_REPEAT_STRUCT:
+            _kind, name, fmt, hex64 = step
+            values = _encode_repeat_values(kwargs[name], hex64)
+            fmt = '<{}{}'.format(len(values), fmt)
+            struct.pack_into(fmt, buffer, offset, *values)
+            offset += struct.calcsize(fmt)
+        elif kind == _STEP_REPEAT:
+            _kind, name, encode = step
+            for value in kwargs[name]:
+                offset = _write_into(buffer, offset, encode(value))
+        else:
+            _kind, name, encode, length = step
+            value = kwargs[name]
+            offset = _write_into(buffer, offset, encode(len(value) if length else value))
+    return offset
+
+
+# Encoders are pairs of callables, (kwargs, parts) returning bytes and
+# (kwargs, buffer, offset) returning the new offset.
+_ENCODERS = {}
+
+
+def _plan_encoder(args):
+    plan = _get_encode_plan(args)
+    return functools.partial(_run_encode_plan, plan), functools.partial(_run_encode_plan_into, plan)
+
+
+_make_encoder = _plan_encoder
+
+
+def _get_encoder(args):
+    encoder = _ENCODERS.get(args)
+    if encoder is None:
+        encoder = _ENCODERS[args] = _make_encoder(args)
+    return encoder
+
+
+def _encode_helper(args, kwargs):
+    encode, _encode_into = _get_encoder(args)
+    return encode(kwargs, [])
 
 
 def encode_zdo(cluster_name, seq, **kwargs):
@@ -474,20 +908,36 @@ def encode_zdo(cluster_name, seq, **kwargs):
 
     cluster, args = ZDO_BY_NAME[cluster_name]
 
-    data = struct.pack('<B', seq) + _encode_helper(args, kwargs)
+    encode, _encode_into = _get_encoder(args)
+    data = encode(kwargs, [_ZDO_HEADER.pack(seq)])
 
     return cluster, data
 
 
+def encode_zdo_into(buffer, offset, cluster_name, seq, **kwargs):
+    """Like encode_zdo, but writes the frame into buffer (a bytearray or
+    writable memoryview) at offset. Returns (cluster, nbytes)."""
+    if cluster_name not in ZDO_BY_NAME:
+        raise ValueError('Unknown ZDO "{}"'.format(cluster_name))
+
+    cluster, args = ZDO_BY_NAME[cluster_name]
+
+    _ZDO_HEADER.pack_into(buffer, offset, seq)
+    _encode, encode_into = _get_encoder(args)
+    end = encode_into(kwargs, buffer, offset + _ZDO_HEADER.size)
+
+    return cluster, end - offset
+
+
 PROFILE_COMMANDS_BY_NAME = {
     # ZCL Spec -- "2.5 General Command Frames"
-    'read_attributes': (0x00, ('attributes:*uint16',),),
+    'read_attributes': (0x00, ('attributes:%uint16',),),
     'read_attributes_response': (0x01, ('attributes:%read_attr_status',),),
-    'write_attributes': (0x02, ('attributes:*write_attr',),),
-    'write_attributes_undivided': (0x03, ('attributes:*write_attr',),),
+    'write_attributes': (0x02, ('attributes:%write_attr',),),
+    'write_attributes_undivided': (0x03, ('attributes:%write_attr',),),
     'write_attributes_response': (0x04, ('attributes:%write_attr_status',),),
-    'write_attributes_no_response': (0x05, ('attributes:*write_attr',),),
-    'configure_reporting': (0x06, ('configs:*attr_reporting_config',),),
+    'write_attributes_no_response': (0x05, ('attributes:%write_attr',),),
+    'configure_reporting': (0x06, ('configs:%attr_reporting_config',),),
     'configure_reporting_response': (0x07, ('results:%attr_reporting_status',),),
     # 'read_reporting_configuration': (0x08, (),),
     # 'read_reporting_configuration_response': (0x09, (),),
@@ -534,7 +984,7 @@ CLUSTERS_BY_NAME = {
         'identify_query': (0x01, (),),
         'trigger_effect': (0x40, ('effect_id:uint8', 'effect_variant:uint8',),),
     }, {
-        'identify_query_response': (0x00, ('timeout:uint16'),),
+        'identify_query_response': (0x00, ('timeout:uint16',),),
     },{
         'identify_time': (0x0000, 'uint16',),
     },),
@@ -670,28 +1120,70 @@ for cluster_name, (cluster, rx_commands, tx_commands, attributes,) in CLUSTERS_B
     )
 
 
-def decode_zcl(cluster, data):
-    frame_control, = struct.unpack('<B', data[:1])
-    frame_type = frame_control & 1
-    direction = frame_control & (1 << 3)
-    disable_default_response = frame_control & (1 << 4)
-    manufacturer_specific = 0 #frame_control & (1 << 2)      ??
-    #print(frame_type, direction, manufacturer_specific)
+def _compile_tables():
+    # Build decoders for everything in the spec tables up front.
+    for _cluster, args in ZDO_BY_ID.values():
+        _get_decoder(args)
+    for _command, args in PROFILE_COMMANDS_BY_ID.values():
+        _get_decoder(args)
+    for _cluster_name, rx_commands, tx_commands, _attributes in CLUSTERS_BY_ID.values():
+        for _command, args in list(rx_commands.values()) + list(tx_commands.values()):
+            _get_decoder(args)
 
-    if manufacturer_specific:
-        manufacturer_code, seq, command = struct.unpack('<HBB', data[1:5])
-        data = data[5:]
+
+_compile_tables()
+
+
+def use_codegen(enabled=True):
+    """Switch between the table-driven decoders/encoders and specialised
+    straight-line functions generated for each command (see
+    zcl.codegen). Both produce identical results."""
+    global _make_decoder, _make_encoder
+    if enabled:
+        from . import codegen
+        _make_decoder, _make_encoder = codegen.generate_decoder, codegen.generate_encoder
     else:
-        manufacturer_code = 0
-        seq, command = struct.unpack('<BB', data[1:3])
-        data = data[3:]
+        _make_decoder, _make_encoder = _plan_decoder, _plan_encoder
+    _DECODERS.clear()
+    _ENCODERS.clear()
+    _compile_tables()
+
 
-    #print(manufacturer_code, seq, command)
+def _decode_zcl_header(data):
+    # The one ZCL header parser: returns (frame_control, manufacturer_code,
+    # seq, command, payload offset). manufacturer_code is 0 unless the
+    # manufacturer specific bit is set.
+    frame_control, seq, command = _ZCL_HEADER.unpack_from(data, 0)
+    if frame_control & (1 << 2):
+        frame_control, manufacturer_code, seq, command = _ZCL_MANUFACTURER_HEADER.unpack_from(data, 0)
+        return frame_control, manufacturer_code, seq, command, _ZCL_MANUFACTURER_HEADER.size
+    return frame_control, 0, seq, command, _ZCL_HEADER.size
+
+
+ZclHeader = collections.namedtuple('ZclHeader', ('frame_control', 'command_type', 'direction', 'default_response', 'manufacturer_code', 'seq', 'command', 'size',))
+
+_ZCL_COMMAND_TYPES = (ZclCommandType.PROFILE, ZclCommandType.CLUSTER,)
+
+
+def peek_zcl_header(data):
+    """Parse only the ZCL frame header, without decoding the payload.
+    The payload starts at data[header.size:]."""
+    frame_control, manufacturer_code, seq, command, i = _decode_zcl_header(data)
+    return ZclHeader(frame_control, _ZCL_COMMAND_TYPES[frame_control & 1], (frame_control >> 3) & 1, not frame_control & (1 << 4), manufacturer_code, seq, command, i)
+
+
+def _lookup_zcl_command(cluster, frame_control, command):
+    frame_type = frame_control & 1
+    direction = frame_control & (1 << 3)
 
     if cluster not in CLUSTERS_BY_ID:
         raise ValueError('Unknown cluster {}'.format(cluster))
     cluster_name, rx_commands, tx_commands, attributes = CLUSTERS_BY_ID[cluster]
 
+    if frame_control & (1 << 2):
+        # The command tables are only for the standard commands.
+        raise ValueError('Manufacturer-specific command {} for cluster "{}"'.format(command, cluster_name))
+
     if direction == 0:
         commands = rx_commands
     else:
@@ -702,15 +1194,250 @@ def decode_zcl(cluster, data):
         if command not in PROFILE_COMMANDS_BY_ID:
             raise ValueError('Unknown profile command {} for cluster "{}"'.format(command, cluster_name))
         command_name, args = PROFILE_COMMANDS_BY_ID[command]
-        kwargs, _nbytes = _decode_helper(args, data)
-        return cluster_name, seq, ZclCommandType.PROFILE, command_name, not disable_default_response, kwargs
+        return cluster_name, ZclCommandType.PROFILE, command_name, args
     else:
         # Cluster command
         if command not in commands:
             raise ValueError('Unknown cluster command {} for cluster "{}" (direction={})'.format(command, cluster_name, direction))
         command_name, args = commands[command]
-        kwargs, _nbytes = _decode_helper(args, data)
-        return cluster_name, seq, ZclCommandType.CLUSTER, command_name, not disable_default_response, kwargs
+        return cluster_name, ZclCommandType.CLUSTER, command_name, args
+
+
+def decode_zcl(cluster, data):
+    frame_control, manufacturer_code, seq, command, i = _decode_zcl_header(data)
+    disable_default_response = frame_control & (1 << 4)
+    #print(frame_control, manufacturer_code, seq, command)
+
+    cluster_name, command_type, command_name, args = _lookup_zcl_command(cluster, frame_control, command)
+    kwargs, _nbytes = _decode_helper(args, data, i)
+    return cluster_name, seq, command_type, command_name, not disable_default_response, kwargs
+
+
+class _LazyFrame:
+    __slots__ = ('_data', '_plan', '_offset', '_kwargs',)
+
+    def __init__(self, data, args, offset):
+        self._data = data
+        self._plan = _get_decode_plan(args)
+        self._offset = offset
+        self._kwargs = None
+
+    @property
+    def kwargs(self):
+        if self._kwargs is None:
+            self._kwargs, _nbytes = _run_decode_plan(self._plan, self._data, self._offset, lazy=True)
+        return self._kwargs
+
+    def __getitem__(self, name):
+        return self.kwargs[name]
+
+    def __contains__(self, name):
+        return name in self.kwargs
+
+    def get(self, name, default=None):
+        return self.kwargs.get(name, default)
+
+
+class ZclFrame(_LazyFrame):
+    """A ZCL frame with the header already parsed. Payload fields are
+    decoded on first access, and record lists (e.g. the attributes in a
+    report) are RecordLists that decode one record at a time. The
+    buffer must not be modified while the frame is in use."""
+
+    __slots__ = ('cluster_name', 'command_name', 'header',)
+
+    def __init__(self, cluster_name, command_name, header, data, args):
+        super().__init__(data, args, header.size)
+        self.cluster_name = cluster_name
+        self.command_name = command_name
+        self.header = header
+
+    @property
+    def seq(self):
+        return self.header.seq
+
+    @property
+    def command_type(self):
+        return self.header.command_type
+
+    @property
+    def default_response(self):
+        return self.header.default_response
+
+    def as_tuple(self):
+        return self.cluster_name, self.seq, self.command_type, self.command_name, self.default_response, self.kwargs
+
+    def __repr__(self):
+        return 'ZclFrame({!r}, {!r}, seq={})'.format(self.cluster_name, self.command_name, self.seq)
+
+
+def decode_zcl_lazy(cluster, data):
+    header = peek_zcl_header(data)
+    cluster_name, _command_type, command_name, args = _lookup_zcl_command(cluster, header.frame_control, header.command)
+    return ZclFrame(cluster_name, command_name, header, data, args)
+
+
+def iter_zcl_records(cluster, data):
+    """Return an iterator over the records of a multi-record frame (e.g.
+    the attributes in report_attributes or read_attributes_response).
+    Records are decoded one at a time and not kept, so a caller can stop
+    as soon as it finds the record it needs:
+
+        for record in iter_zcl_records(cluster, data):
+            if record['attribute'] == 0x0000:
+                break
+    """
+    frame = decode_zcl_lazy(cluster, data)
+    for value in frame.kwargs.values():
+        if isinstance(value, RecordList):
+            return _iter_records(value._data, value._i, value._end, value._decode, value._obj)
+    raise ValueError('Command "{}" has no records'.format(frame.command_name))
+
+
+class ZdoFrame(_LazyFrame):
+    """A ZDO frame with the header already parsed, and the payload decoded
+    on first access (see ZclFrame)."""
+
+    __slots__ = ('cluster_name', 'header',)
+
+    def __init__(self, cluster_name, header, data, args):
+        super().__init__(data, args, header.size)
+        self.cluster_name = cluster_name
+        self.header = header
+
+    @property
+    def seq(self):
+        return self.header.seq
+
+    def as_tuple(self):
+        return self.cluster_name, self.seq, self.kwargs
+
+    def __repr__(self):
+        return 'ZdoFrame({!r}, seq={})'.format(self.cluster_name, self.seq)
+
+
+# Compact decoders by (cluster, frame type, manufacturer specific and direction bits, command)
+# for ZCL and by cluster for ZDO. These are generated by zcl.codegen.
+_COMPACT_ZCL_DECODERS = {}
+_COMPACT_ZDO_DECODERS = {}
+
+
+def decode_zcl_compact(cluster, data):
+    """Like decode_zcl, but returns a single object of a per-command class
+    with __slots__ (records in lists are slotted too) instead of a tuple
+    and dicts. Its as_dict() gives the kwargs that decode_zcl returns and
+    as_tuple() the full decode_zcl result."""
+    frame_control, manufacturer_code, seq, command, i = _decode_zcl_header(data)
+    key = (cluster, frame_control & 0x0d, command,)
+    decoder = _COMPACT_ZCL_DECODERS.get(key)
+    if decoder is None:
+        from . import codegen
+        cluster_name, command_type, command_name, args = _lookup_zcl_command(cluster, frame_control, command)
+        decoder = _COMPACT_ZCL_DECODERS[key] = codegen.compact_zcl_decoder(cluster_name, command_type, command_name, args)
+    frame, _nbytes = decoder(data, i, seq, not frame_control & (1 << 4))
+    return frame
+
+
+def decode_zdo_compact(cluster, data):
+    """Like decode_zdo, but returns a slotted object (see
+    decode_zcl_compact)."""
+    decoder = _COMPACT_ZDO_DECODERS.get(cluster)
+    if decoder is None:
+        if cluster not in ZDO_BY_ID:
+            raise ValueError('Unknown ZDO 0x{:04x}'.format(cluster))
+        from . import codegen
+        cluster_name, args = ZDO_BY_ID[cluster]
+        decoder = _COMPACT_ZDO_DECODERS[cluster] = codegen.compact_zdo_decoder(cluster_name, args)
+    seq, = _ZDO_HEADER.unpack_from(data, 0)
+    frame, _nbytes = decoder(data, _ZDO_HEADER.size, seq)
+    return frame
+
+
+def decode_zdo_lazy(cluster, data):
+    if cluster not in ZDO_BY_ID:
+        raise ValueError('Unknown ZDO 0x{:04x}'.format(cluster))
+
+    cluster_name, args = ZDO_BY_ID[cluster]
+    return ZdoFrame(cluster_name, peek_zdo_header(cluster, data), data, args)
+
+
+# Non-raising decoding. try_decode_zcl/try_decode_zdo return an Undecoded
+# instead of raising, and count each fallback by reason. The header
+# checks and command lookups are plain dict lookups, so only frames with
+# a bad payload go through an exception internally.
+Undecoded = collections.namedtuple('Undecoded', ('cluster', 'reason', 'header', 'payload',))
+
+DECODE_FALLBACKS = collections.Counter()
+
+_make_undecoded = Undecoded._make
+_make_zcl_header = ZclHeader._make
+
+
+def _undecoded(cluster, reason, header, data):
+    DECODE_FALLBACKS[reason] += 1
+    payload = memoryview(data)[header.size if header is not None else 0:]
+    # _make skips the namedtuple __new__ wrapper.
+    return _make_undecoded((cluster, reason, header, payload,))
+
+
+def try_decode_zcl(cluster, data):
+    """Like decode_zcl, but returns an Undecoded (with the header, if it
+    could be parsed, and the rest of the frame as a memoryview) instead
+    of raising. Manufacturer-specific frames are always Undecoded."""
+    if len(data) < _ZCL_HEADER.size or (data[0] & (1 << 2) and len(data) < _ZCL_MANUFACTURER_HEADER.size):
+        return _undecoded(cluster, 'short_header', None, data)
+
+    frame_control, manufacturer_code, seq, command, size = _decode_zcl_header(data)
+    entry = CLUSTERS_BY_ID.get(cluster)
+
+    if frame_control & (1 << 2):
+        reason = 'manufacturer_specific'
+    elif entry is None:
+        reason = 'unknown_cluster'
+    else:
+        cluster_name, rx_commands, tx_commands, _attributes = entry
+        if frame_control & 1:
+            command_type = ZclCommandType.CLUSTER
+            entry = (tx_commands if frame_control & (1 << 3) else rx_commands).get(command)
+        else:
+            command_type = ZclCommandType.PROFILE
+            entry = PROFILE_COMMANDS_BY_ID.get(command)
+        if entry is None:
+            reason = 'unknown_command'
+        else:
+            command_name, args = entry
+            try:
+                kwargs, _nbytes = _decode_helper(args, data, size)
+                return cluster_name, seq, command_type, command_name, not frame_control & (1 << 4), kwargs
+            except ValueError:
+                reason = 'invalid_payload'
+            except struct.error:
+                reason = 'truncated'
+
+    header = _make_zcl_header((frame_control, _ZCL_COMMAND_TYPES[frame_control & 1], (frame_control >> 3) & 1, not frame_control & (1 << 4), manufacturer_code, seq, command, size,))
+    return _undecoded(cluster, reason, header, data)
+
+
+def try_decode_zdo(cluster, data):
+    """Like decode_zdo, but returns an Undecoded instead of raising (see
+    try_decode_zcl)."""
+    if len(data) < _ZDO_HEADER.size:
+        return _undecoded(cluster, 'short_header', None, data)
+
+    seq, = _ZDO_HEADER.unpack_from(data, 0)
+
+    entry = ZDO_BY_ID.get(cluster)
+    if entry is None:
+        return _undecoded(cluster, 'unknown_cluster', peek_zdo_header(cluster, data), data)
+    cluster_name, args = entry
+
+    try:
+        kwargs, _nbytes = _decode_helper(args, data, _ZDO_HEADER.size)
+    except ValueError:
+        return _undecoded(cluster, 'invalid_payload', peek_zdo_header(cluster, data), data)
+    except struct.error:
+        return _undecoded(cluster, 'truncated', peek_zdo_header(cluster, data), data)
+    return cluster_name, seq, kwargs
 
 
 def get_cluster_by_name(cluster_name):
@@ -734,28 +1461,58 @@ def get_cluster_rx_command(cluster_name, command_name):
     return cluster, command, args
 
 
-def encode_cluster_command(cluster_name, command_name, seq, direction=0, default_response=True, manufacturer_code=None, **kwargs):
-    cluster, command, args = get_cluster_rx_command(cluster_name, command_name)
-
+def _cluster_frame_control(direction, default_response, manufacturer_code):
     # ZCL Spec - "2.4.1.1 Frame Control Field"
     frame_control = 1  # Cluster command (command is specific to this cluster)
     if direction:
         frame_control |= 1 << 3
     if not default_response:
         frame_control |= 1 << 4
-
     if manufacturer_code is not None:
         frame_control |= 1 << 2
-        data = struct.pack('<BHBB', frame_control, manufacturer_code, seq, command)
+    return frame_control
+
+
+def _profile_frame_control(direction, default_response, manufacturer_code):
+    # Profile command (command applies to all clusters)
+    return _cluster_frame_control(direction, default_response, manufacturer_code) & ~1
+
+
+def encode_cluster_command(cluster_name, command_name, seq, direction=0, default_response=True, manufacturer_code=None, **kwargs):
+    cluster, command, args = get_cluster_rx_command(cluster_name, command_name)
+
+    frame_control = _cluster_frame_control(direction, default_response, manufacturer_code)
+    if manufacturer_code is not None:
+        header = _ZCL_MANUFACTURER_HEADER.pack(frame_control, manufacturer_code, seq, command)
     else:
-        data = struct.pack('<BBB', frame_control, seq, command)
+        header = _ZCL_HEADER.pack(frame_control, seq, command)
 
-    data += _encode_helper(args, kwargs)
+    encode, _encode_into = _get_encoder(args)
+    data = encode(kwargs, [header])
 
     return cluster, data
 
 
-def encode_profile_command(cluster_name, command_name, seq, direction=0, default_response=True, manufacturer_code=None, **kwargs):
+def encode_cluster_command_into(buffer, offset, cluster_name, command_name, seq, direction=0, default_response=True, manufacturer_code=None, **kwargs):
+    """Like encode_cluster_command, but writes the frame into buffer (a
+    bytearray or writable memoryview) at offset. Returns (cluster, nbytes)."""
+    cluster, command, args = get_cluster_rx_command(cluster_name, command_name)
+
+    frame_control = _cluster_frame_control(direction, default_response, manufacturer_code)
+    if manufacturer_code is not None:
+        _ZCL_MANUFACTURER_HEADER.pack_into(buffer, offset, frame_control, manufacturer_code, seq, command)
+        i = offset + _ZCL_MANUFACTURER_HEADER.size
+    else:
+        _ZCL_HEADER.pack_into(buffer, offset, frame_control, seq, command)
+        i = offset + _ZCL_HEADER.size
+
+    _encode, encode_into = _get_encoder(args)
+    end = encode_into(kwargs, buffer, i)
+
+    return cluster, end - offset
+
+
+def _get_profile_command(cluster_name, command_name):
     if cluster_name not in CLUSTERS_BY_NAME:
         raise ValueError('Unknown cluster "{}"'.format(cluster_name))
 
@@ -765,16 +1522,164 @@ def encode_profile_command(cluster_name, command_name, seq, direction=0, default
         raise ValueError('Unknown command "{}"'.format(command_name))
 
     command, args = PROFILE_COMMANDS_BY_NAME[command_name]
+    return cluster, command, args
 
-    # ZCL Spec - "2.4.1.1 Frame Control Field"
-    frame_control = 0  # Profile  command (command applies to all clusters)
-    data = struct.pack('<BBB', frame_control, seq, command)
 
-    data += _encode_helper(args, kwargs)
+def encode_profile_command(cluster_name, command_name, seq, direction=0, default_response=True, manufacturer_code=None, **kwargs):
+    cluster, command, args = _get_profile_command(cluster_name, command_name)
+
+    frame_control = _profile_frame_control(direction, default_response, manufacturer_code)
+    if manufacturer_code is not None:
+        header = _ZCL_MANUFACTURER_HEADER.pack(frame_control, manufacturer_code, seq, command)
+    else:
+        header = _ZCL_HEADER.pack(frame_control, seq, command)
+
+    encode, _encode_into = _get_encoder(args)
+    data = encode(kwargs, [header])
 
     return cluster, data
 
 
+def encode_profile_command_into(buffer, offset, cluster_name, command_name, seq, direction=0, default_response=True, manufacturer_code=None, **kwargs):
+    """Like encode_profile_command, but writes the frame into buffer (a
+    bytearray or writable memoryview) at offset. Returns (cluster, nbytes)."""
+    cluster, command, args = _get_profile_command(cluster_name, command_name)
+
+    frame_control = _profile_frame_control(direction, default_response, manufacturer_code)
+    if manufacturer_code is not None:
+        _ZCL_MANUFACTURER_HEADER.pack_into(buffer, offset, frame_control, manufacturer_code, seq, command)
+        i = offset + _ZCL_MANUFACTURER_HEADER.size
+    else:
+        _ZCL_HEADER.pack_into(buffer, offset, frame_control, seq, command)
+        i = offset + _ZCL_HEADER.size
+
+    _encode, encode_into = _get_encoder(args)
+    end = encode_into(kwargs, buffer, i)
+
+    return cluster, end - offset
+
+
+class FrameTemplate:
+    """A ZCL frame encoded once with some of its args fixed. encode()
+    copies the prototype and patches in the sequence number and the
+    remaining args, which must all be fixed-width. Frames with no
+    variable args are built for every sequence number up front."""
+
+    __slots__ = ('cluster', 'prototype', '_seq_offset', '_fields', '_frames',)
+
+    def __init__(self, cluster, prototype, seq_offset, fields):
+        self.cluster = cluster
+        self.prototype = prototype
+        self._seq_offset = seq_offset
+        # (name, offset, Struct, hex64) for each variable arg.
+        self._fields = fields
+        self._frames = None
+        if not fields:
+            self._frames = tuple(prototype[:seq_offset] + bytes((seq,)) + prototype[seq_offset + 1:] for seq in range(256))
+
+    def _check(self, seq, kwargs):
+        # Only called once something is known to be wrong, to say what.
+        if not 0 <= seq <= 255:
+            raise ValueError('Sequence number {} out of range'.format(seq))
+        for name, _offset, _st, _hex64 in self._fields:
+            if name not in kwargs:
+                raise ValueError('Missing arg "{}"'.format(name))
+        names = [name for name, _offset, _st, _hex64 in self._fields]
+        unknown = next(name for name in kwargs if name not in names)
+        raise ValueError('Unknown arg "{}" (not a variable arg of this template)'.format(unknown))
+
+    def _patch(self, frame, offset, seq, kwargs):
+        if not 0 <= seq <= 255 or len(kwargs) != len(self._fields):
+            self._check(seq, kwargs)
+        frame[offset + self._seq_offset] = seq
+        for name, field_offset, st, hex64 in self._fields:
+            if name not in kwargs:
+                self._check(seq, kwargs)
+            value = kwargs[name]
+            if hex64 and isinstance(value, str):
+                value = int(value, 16)
+            st.pack_into(frame, offset + field_offset, value)
+
+    def encode(self, seq, **kwargs):
+        if self._frames is not None:
+            if not 0 <= seq <= 255 or kwargs:
+                self._check(seq, kwargs)
+            return self.cluster, self._frames[seq]
+        frame = bytearray(self.prototype)
+        self._patch(frame, 0, seq, kwargs)
+        return self.cluster, bytes(frame)
+
+    def encode_into(self, buffer, offset, seq, **kwargs):
+        """Write the frame into buffer at offset. Returns (cluster, nbytes)."""
+        _write_into(buffer, offset, self.prototype)
+        self._patch(buffer, offset, seq, kwargs)
+        return self.cluster, len(self.prototype)
+
+
+def _compile_template(cluster, header, args, kwargs):
+    # Variable args (those not in kwargs) need a known offset, so every
+    # arg before them has to be fixed-width.
+    fields = []
+    offset = len(header)
+    known = True
+    values = dict(kwargs)
+    for arg in args:
+        name, datatype = arg.split(':')[:2]
+        length = name.startswith(('n_', 'b_',))
+        if length:
+            name = name[2:]
+        repeat = datatype[0] in '*#%'
+        decode, _encode = STRUCT_TYPES[datatype.lstrip('*#%')]
+        fixed_width = not callable(decode) and not repeat
+
+        if name in kwargs:
+            if fixed_width:
+                offset += struct.calcsize(decode)
+            else:
+                known = False
+            continue
+
+        if length or not fixed_width or not known:
+            raise ValueError('Arg "{}" is variable-width or follows one, so it must be given to the template'.format(name))
+        st = struct.Struct(decode)
+        fields.append((name, offset, st, datatype == 'uint64',))
+        values[name] = 0
+        offset += st.size
+
+    encode, _encode_into = _get_encoder(args)
+    prototype = encode(values, [header])
+    # The sequence number is the second to last byte of the header.
+    return FrameTemplate(cluster, prototype, len(header) - 2, tuple(fields))
+
+
+def cluster_command_template(cluster_name, command_name, direction=0, default_response=True, manufacturer_code=None, **kwargs):
+    """Return a FrameTemplate for encode_cluster_command with the given
+    args fixed. The args that are left out are passed to encode()."""
+    cluster, command, args = get_cluster_rx_command(cluster_name, command_name)
+
+    frame_control = _cluster_frame_control(direction, default_response, manufacturer_code)
+    if manufacturer_code is not None:
+        header = _ZCL_MANUFACTURER_HEADER.pack(frame_control, manufacturer_code, 0, command)
+    else:
+        header = _ZCL_HEADER.pack(frame_control, 0, command)
+
+    return _compile_template(cluster, header, args, kwargs)
+
+
+def profile_command_template(cluster_name, command_name, direction=0, default_response=True, manufacturer_code=None, **kwargs):
+    """Return a FrameTemplate for encode_profile_command (see
+    cluster_command_template)."""
+    cluster, command, args = _get_profile_command(cluster_name, command_name)
+
+    frame_control = _profile_frame_control(direction, default_response, manufacturer_code)
+    if manufacturer_code is not None:
+        header = _ZCL_MANUFACTURER_HEADER.pack(frame_control, manufacturer_code, 0, command)
+    else:
+        header = _ZCL_HEADER.pack(frame_control, 0, command)
+
+    return _compile_template(cluster, header, args, kwargs)
+
+
 def get_json():
     return {
         'profile': [
@@ -0,0 +1,225 @@
+# Random access into capture files (see zcl.capture) via mmap and a
+# sidecar index.
+#
+# The index (capture path + '.idx') has one entry per record --
+# (timestamp, source, cluster, offset of the record) -- stored three
+# times, sorted by time, by (source, time) and by (cluster, time). A
+# query binary searches the most selective section directly in the
+# mmap'd index, so only the matching entries and records are touched.
+#
+#   header:  magic 'ZCLIDX', version (uint8), count (uint64),
+#            capture size (uint64), capture mtime (uint64, ns)
+#   entries: timestamp (float64), source (uint64), cluster (uint16),
+#            offset (uint64), 3 * count of them
+#
+# The index is rebuilt if the capture's size or mtime doesn't match the
+# header. Building it is an external sort: entries are sorted RUN_SIZE
+# at a time into temporary files next to the capture, then the runs are
+# merged (heapq.merge), so memory use doesn't grow with the capture.
+
+import contextlib
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+
+from . import capture
+
+
+INDEX_MAGIC = b'ZCLIDX'
+INDEX_VERSION = 2
+
+# Entries sorted in memory at a time when building an index.
+RUN_SIZE = 1 << 19
+
+_INDEX_HEADER = struct.Struct('<6sBQQQ')
+_INDEX_ENTRY = struct.Struct('<dQHQ')
+
+_SECTION_TIME = 0
+_SECTION_SOURCE = 1
+_SECTION_CLUSTER = 2
+
+# Sort key of each section. The offset makes the order total, so the
+# merged runs come out the same as one big sort.
+_SECTION_KEYS = (
+    lambda e: (e[0], e[3],),
+    lambda e: (e[1], e[0], e[3],),
+    lambda e: (e[2], e[0], e[3],),
+)
+
+# Entries read from a run at a time while merging.
+_MERGE_BLOCK = 4096
+
+
+def _index_path(path):
+    return path + '.idx'
+
+
+def _scan(data):
+    # Yields (timestamp, source, cluster, offset) for each record.
+    magic, version = capture._FILE_HEADER.unpack_from(data, 0)
+    if magic != capture.MAGIC:
+        raise ValueError('Not a capture file')
+    if version != capture.VERSION:
+        raise ValueError('Unsupported capture version {}'.format(version))
+    i = capture._FILE_HEADER.size
+    end = len(data)
+    while i < end:
+        if i + capture._RECORD_HEADER.size > end:
+            raise ValueError('Truncated capture record')
+        length, timestamp, source, _endpoint, _profile, cluster = capture._RECORD_HEADER.unpack_from(data, i)
+        if i + capture._RECORD_HEADER.size + length > end:
+            raise ValueError('Truncated capture record')
+        yield timestamp, source, cluster, i
+        i += capture._RECORD_HEADER.size + length
+
+
+def _read_run(f, start, end):
+    # Yields the entries start:end of a run file. Runs of the same file
+    # are read interleaved by the merge, hence the seek before each block.
+    block = _MERGE_BLOCK * _INDEX_ENTRY.size
+    for offset in range(start * _INDEX_ENTRY.size, end * _INDEX_ENTRY.size, block):
+        f.seek(offset)
+        yield from _INDEX_ENTRY.iter_unpack(f.read(min(block, end * _INDEX_ENTRY.size - offset)))
+
+
+def build_index(path, run_size=RUN_SIZE):
+    """(Re)build the sidecar index for the capture at path, sorting at
+    most run_size entries in memory at a time."""
+    directory = os.path.dirname(os.path.abspath(path))
+    with contextlib.ExitStack() as stack:
+        # One file of sorted runs per section, and (start, end) of each
+        # run in entries.
+        runs = [stack.enter_context(tempfile.TemporaryFile(dir=directory)) for _key in _SECTION_KEYS]
+        bounds = []
+        count = 0
+
+        def flush(entries):
+            for key, f in zip(_SECTION_KEYS, runs):
+                f.write(b''.join(_INDEX_ENTRY.pack(*entry) for entry in sorted(entries, key=key)))
+            bounds.append((count - len(entries), count,))
+
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                entries = []
+                for entry in _scan(data):
+                    entries.append(entry)
+                    count += 1
+                    if len(entries) == run_size:
+                        flush(entries)
+                        entries = []
+                if entries:
+                    flush(entries)
+
+        tmp = _index_path(path) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, count, st.st_size, st.st_mtime_ns))
+            for key, run in zip(_SECTION_KEYS, runs):
+                run.flush()
+                merged = heapq.merge(*(_read_run(run, start, end) for start, end in bounds), key=key)
+                for entry in merged:
+                    f.write(_INDEX_ENTRY.pack(*entry))
+        os.replace(tmp, _index_path(path))
+
+
+class CaptureStore:
+    """A capture file opened for indexed queries.
+
+    The index is built on open if it's missing or out of date. Payloads
+    are memoryviews into the mmap'd capture, so they're only valid until
+    close(). Copy them (bytes(record.payload)) to keep them longer.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._f = open(path, 'rb')
+        self._data = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if not self._index_is_current():
+            build_index(path)
+        self._index_f = open(_index_path(path), 'rb')
+        self._index = mmap.mmap(self._index_f.fileno(), 0, access=mmap.ACCESS_READ)
+        _magic, _version, self._count, _size, _mtime = _INDEX_HEADER.unpack_from(self._index, 0)
+        self._view = memoryview(self._data)
+
+    def _index_is_current(self):
+        try:
+            with open(_index_path(self._path), 'rb') as f:
+                header = f.read(_INDEX_HEADER.size)
+        except FileNotFoundError:
+            return False
+        if len(header) < _INDEX_HEADER.size:
+            return False
+        magic, version, _count, size, mtime = _INDEX_HEADER.unpack(header)
+        st = os.fstat(self._f.fileno())
+        return magic == INDEX_MAGIC and version == INDEX_VERSION and size == st.st_size and mtime == st.st_mtime_ns
+
+    def close(self):
+        """Unmap the capture and index. Raises BufferError (leaving the
+        capture mapped) if payloads from this store are still alive;
+        close() can be called again once they've been released."""
+        self._index.close()
+        self._index_f.close()
+        self._view.release()
+        try:
+            self._data.close()
+        except BufferError:
+            raise BufferError('Payloads from this store are still in use') from None
+        finally:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _entry(self, section, k):
+        return _INDEX_ENTRY.unpack_from(self._index, _INDEX_HEADER.size + (section * self._count + k) * _INDEX_ENTRY.size)
+
+    def _bisect(self, section, key, target):
+        # First k in section with key(entry) >= target.
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key(self._entry(section, mid)) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def record_at(self, offset):
+        length, timestamp, source, endpoint, profile, cluster = capture._RECORD_HEADER.unpack_from(self._data, offset)
+        i = offset + capture._RECORD_HEADER.size
+        return capture.CaptureRecord(timestamp, source, endpoint, profile, cluster, self._view[i:i + length])
+
+    def query(self, start=None, end=None, source=None, cluster=None):
+        """Yield the CaptureRecords with start <= timestamp < end from the
+        given source and cluster (any of which may be None), in time
+        order."""
+        lo_time = float('-inf') if start is None else start
+        hi_time = float('inf') if end is None else end
+
+        if source is not None:
+            section, key, prefix = _SECTION_SOURCE, lambda e: (e[1], e[0],), (source,)
+        elif cluster is not None:
+            section, key, prefix = _SECTION_CLUSTER, lambda e: (e[2], e[0],), (cluster,)
+        else:
+            section, key, prefix = _SECTION_TIME, lambda e: (e[0],), ()
+
+        k = self._bisect(section, key, prefix + (lo_time,))
+        hi = self._bisect(section, key, prefix + (hi_time,))
+        while k < hi:
+            timestamp, entry_source, entry_cluster, offset = self._entry(section, k)
+            k += 1
+            if cluster is not None and entry_cluster != cluster:
+                continue
+            yield self.record_at(offset)
+
+    def __iter__(self):
+        return self.query()